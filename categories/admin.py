@@ -6,18 +6,15 @@ from .models import Category
 
 # Register your models here.
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ('name', 'slug', 'description', 'created_at', 'updated_at', 'topic_count')
+    list_display = ('name', 'slug', 'description', 'created_at', 'updated_at', 'topic_count', 'post_count', 'last_post_at')
     search_fields = ('name', 'description')
     prepopulated_fields = {'slug': ('name',)}
     list_filter = ('created_at', 'updated_at')
     date_hierarchy = 'created_at'
+    # Maintained by the signal handlers in forum/signals.py
+    readonly_fields = ('topic_count', 'post_count', 'last_post_at', 'last_post_by', 'last_post_topic')
     actions = ['export_as_csv', 'regenerate_slugs', 'display_topic_count']
 
-    def topic_count(self, obj):
-        """Return the number of topics in this category."""
-        return obj.topics.count()
-    topic_count.short_description = 'Topics'
-
     def export_as_csv(self, request, queryset):
         """Export selected categories as CSV."""
         meta = self.model._meta
@@ -45,8 +42,7 @@ class CategoryAdmin(admin.ModelAdmin):
         """Display the number of topics for each selected category."""
         message_parts = []
         for category in queryset:
-            count = category.topics.count()
-            message_parts.append(f'"{category.name}": {count} topics')
+            message_parts.append(f'"{category.name}": {category.topic_count} topics')
 
         message = ', '.join(message_parts)
         self.message_user(request, message)
@@ -0,0 +1,46 @@
+# Async versions of the read-only views in views.py, served instead of them when the
+# FORUM_ASYNC_VIEWS setting is on (see urls.py and forum/async_views.py).
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.shortcuts import aget_object_or_404
+
+from forum.async_views import arender
+from forum.decorators import query_budget
+from forum.listings import atopic_listing
+from forum.page_cache import cache_anonymous_page, conditional_page
+
+from .models import Category
+
+
+@conditional_page("index")
+@query_budget(5)
+async def category_list(request):
+    """
+    View for displaying all categories with their topic and post counts and latest post.
+    This view is accessible to all users.
+    """
+    categories = Category.objects.select_related("last_post_by", "last_post_topic").order_by("name")
+
+    paginator = Paginator(categories, 10)  # Show 10 categories per page
+    paginator.count = await categories.acount()
+    try:
+        page = paginator.page(request.GET.get("page"))
+    except PageNotAnInteger:
+        page = paginator.page(1)
+    except EmptyPage:
+        page = paginator.page(paginator.num_pages)
+    page.object_list = [category async for category in page.object_list]
+
+    return await arender(request, "categories/category_list.html", {"categories": page})
+
+
+@conditional_page("category:{category_slug}")
+@cache_anonymous_page("category:{category_slug}")
+@query_budget(8)
+async def topics_by_category(request, category_slug):
+    """
+    View for displaying all topics in a specific category.
+    This view shows sticky topics at the top, followed by regular topics with pagination.
+    """
+    category = await aget_object_or_404(Category, slug=category_slug)
+    context = {"category": category, **await atopic_listing(request, category.topics.all())}
+    return await arender(request, "categories/topics_by_category.html", context)
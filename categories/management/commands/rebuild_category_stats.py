@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from categories.models import Category
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the denormalized topic_count, post_count and last post columns of every category. "
+        "Run 'rebuild_topic_stats' first if the topics' statistics may be stale too."
+    )
+
+    def handle(self, *args, **options):
+        updated = Category.objects.refresh_stats()
+        self.stdout.write(self.style.SUCCESS(f"Successfully rebuilt statistics for {updated} categories"))
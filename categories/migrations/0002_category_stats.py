@@ -0,0 +1,64 @@
+# Generated by Django 5.2.1 on 2026-10-18 01:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_category_stats(apps, schema_editor):
+    """Populate the new statistics columns from the topics' denormalized statistics."""
+    Category = apps.get_model('categories', 'Category')
+    Topic = apps.get_model('forum', 'Topic')
+
+    topics = Topic.objects.filter(category=OuterRef('pk')).order_by()
+    topic_count = topics.values('category').annotate(count=Count('pk')).values('count')
+    post_count = topics.values('category').annotate(total=Sum('post_count')).values('total')
+    latest_topics = topics.filter(last_post_at__isnull=False).order_by('-last_post_at', '-pk')
+
+    Category.objects.update(
+        topic_count=Coalesce(Subquery(topic_count), Value(0), output_field=IntegerField()),
+        post_count=Coalesce(Subquery(post_count), Value(0), output_field=IntegerField()),
+        last_post_at=Subquery(latest_topics.values('last_post_at')[:1]),
+        last_post_by=Subquery(latest_topics.values('last_post_by')[:1]),
+        last_post_topic=Subquery(latest_topics.values('pk')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0001_initial'),
+        ('forum', '0010_post_message_html'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='last_post_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='last_post_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='last_post_topic',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='forum.topic'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='topic_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_category_stats, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,37 @@
+from django.apps import apps
+from django.conf import settings
 from django.db import models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.utils.text import slugify
 
+
+class CategoryQuerySet(models.QuerySet):
+    def refresh_stats(self):
+        """
+        Recalculates the denormalized statistics of the categories in this queryset
+        from their topics in a single UPDATE and returns the number of categories updated.
+
+        The post statistics are derived from the topics' own denormalized columns, so
+        those need to be current (see the 'rebuild_topic_stats' command).
+        """
+        # Looked up lazily because forum.models imports this module
+        Topic = apps.get_model('forum', 'Topic')
+
+        topics = Topic.objects.filter(category=OuterRef('pk')).order_by()
+        topic_count = topics.values('category').annotate(count=Count('pk')).values('count')
+        post_count = topics.values('category').annotate(total=Sum('post_count')).values('total')
+        latest_topics = topics.filter(last_post_at__isnull=False).order_by('-last_post_at', '-pk')
+
+        return self.update(
+            topic_count=Coalesce(Subquery(topic_count), Value(0), output_field=IntegerField()),
+            post_count=Coalesce(Subquery(post_count), Value(0), output_field=IntegerField()),
+            last_post_at=Subquery(latest_topics.values('last_post_at')[:1]),
+            last_post_by=Subquery(latest_topics.values('last_post_by')[:1]),
+            last_post_topic=Subquery(latest_topics.values('pk')[:1]),
+        )
+
+
 # Create your models here.
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -9,6 +40,29 @@ class Category(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Denormalized statistics so the category index doesn't have to aggregate the topics
+    # and posts tables. These are kept current by the Topic and Post signal handlers in
+    # forum/signals.py and can be rebuilt with the 'rebuild_category_stats' command.
+    topic_count = models.PositiveIntegerField(default=0)
+    post_count = models.PositiveIntegerField(default=0)
+    last_post_at = models.DateTimeField(null=True, blank=True)
+    last_post_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name='+',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+    last_post_topic = models.ForeignKey(
+        'forum.Topic',
+        related_name='+',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+
+    objects = CategoryQuerySet.as_manager()
+
     class Meta:
         ordering = ['name']
         verbose_name_plural = 'Categories'
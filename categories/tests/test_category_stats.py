@@ -0,0 +1,138 @@
+import io
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from categories.models import Category
+from forum.models import Post, Topic
+from forum.read_tracking import read_marker_buffer
+
+HTTP_SUCCESS = 200
+
+
+class TestCategoryStats(TestCase):
+    """Tests for the denormalized topic and post statistics on the Category model."""
+
+    def setUp(self):
+        """Set up test data."""
+        # Markers left pending by earlier tests would be flushed into the query counts
+        read_marker_buffer.clear()
+        self.user = User.objects.create(username="testuser")
+        self.other_user = User.objects.create(username="otheruser")
+        self.category = Category.objects.create(name="Test Category")
+        self.other_category = Category.objects.create(name="Other Category")
+        self.topic = Topic.objects.create(subject="Test Topic", created_by=self.user, category=self.category)
+        self.client = Client()
+
+    def test_topic_creation_updates_stats(self):
+        """Test that creating topics increments the category's topic counter."""
+        Topic.objects.create(subject="Second Topic", created_by=self.user, category=self.category)
+
+        self.category.refresh_from_db()
+        assert self.category.topic_count == 2  # noqa: S101
+        assert self.category.post_count == 0  # noqa: S101
+        assert self.category.last_post_at is None  # noqa: S101
+
+    def test_post_creation_updates_stats(self):
+        """Test that creating posts increments the counter and records the last post."""
+        Post.objects.create(message="First", topic=self.topic, created_by=self.user)
+        reply = Post.objects.create(message="Reply", topic=self.topic, created_by=self.other_user)
+
+        self.category.refresh_from_db()
+        assert self.category.post_count == 2  # noqa: S101
+        assert self.category.last_post_at == reply.created_at  # noqa: S101
+        assert self.category.last_post_by == self.other_user  # noqa: S101
+        assert self.category.last_post_topic == self.topic  # noqa: S101
+
+    def test_post_deletion_updates_stats(self):
+        """Test that deleting the latest post falls back to the latest remaining one."""
+        other_topic = Topic.objects.create(subject="Other Topic", created_by=self.user, category=self.category)
+        first = Post.objects.create(message="First", topic=other_topic, created_by=self.user)
+        reply = Post.objects.create(message="Reply", topic=self.topic, created_by=self.other_user)
+
+        reply.delete()
+
+        self.category.refresh_from_db()
+        assert self.category.post_count == 1  # noqa: S101
+        assert self.category.last_post_at == first.created_at  # noqa: S101
+        assert self.category.last_post_by == self.user  # noqa: S101
+        assert self.category.last_post_topic == other_topic  # noqa: S101
+
+    def test_topic_deletion_updates_stats(self):
+        """Test that deleting a topic removes it and its posts from the statistics."""
+        Post.objects.create(message="First", topic=self.topic, created_by=self.user)
+        Post.objects.create(message="Reply", topic=self.topic, created_by=self.other_user)
+
+        self.topic.delete()
+
+        self.category.refresh_from_db()
+        assert self.category.topic_count == 0  # noqa: S101
+        assert self.category.post_count == 0  # noqa: S101
+        assert self.category.last_post_at is None  # noqa: S101
+        assert self.category.last_post_topic is None  # noqa: S101
+
+    def test_topic_move_updates_both_categories(self):
+        """Test that moving a topic moves its counts and last post to the new category."""
+        post = Post.objects.create(message="First", topic=self.topic, created_by=self.user)
+
+        topic = Topic.objects.get(pk=self.topic.pk)
+        topic.category = self.other_category
+        topic.save()
+
+        self.category.refresh_from_db()
+        self.other_category.refresh_from_db()
+        assert self.category.topic_count == 0  # noqa: S101
+        assert self.category.post_count == 0  # noqa: S101
+        assert self.category.last_post_at is None  # noqa: S101
+        assert self.other_category.topic_count == 1  # noqa: S101
+        assert self.other_category.post_count == 1  # noqa: S101
+        assert self.other_category.last_post_at == post.created_at  # noqa: S101
+        assert self.other_category.last_post_topic == topic  # noqa: S101
+
+    def test_saving_unmoved_topic_does_not_recalculate(self):
+        """Test that saving a topic without changing its category doesn't touch the category."""
+        topic = Topic.objects.get(pk=self.topic.pk)
+        topic.subject = "Renamed Topic"
+
+        with CaptureQueriesContext(connection) as ctx:
+            topic.save()
+
+        assert not any(  # noqa: S101
+            q["sql"].startswith('UPDATE "categories_category"') for q in ctx.captured_queries
+        )
+
+    def test_rebuild_category_stats_command(self):
+        """Test that the management command repairs stale statistics."""
+        Post.objects.create(message="First", topic=self.topic, created_by=self.user)
+        Category.objects.update(topic_count=99, post_count=99, last_post_at=None)
+
+        out = io.StringIO()
+        call_command("rebuild_category_stats", stdout=out)
+
+        self.category.refresh_from_db()
+        self.other_category.refresh_from_db()
+        assert self.category.topic_count == 1  # noqa: S101
+        assert self.category.post_count == 1  # noqa: S101
+        assert self.category.last_post_at is not None  # noqa: S101
+        assert self.other_category.topic_count == 0  # noqa: S101
+        assert "2 categories" in out.getvalue()  # noqa: S101
+
+    @override_settings(LAST_SEEN_FLUSH_INTERVAL=3600)
+    def test_category_list_shows_last_post(self):
+        """Test that the category index shows the post count and last post from the stored columns."""
+        Post.objects.create(message="First", topic=self.topic, created_by=self.other_user)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("categories:category_list"))
+
+        assert response.status_code == HTTP_SUCCESS  # noqa: S101
+        self.assertContains(response, "1 Post")
+        self.assertContains(response, "Test Topic")
+        self.assertContains(response, "by otheruser")
+        # A COUNT(*) for the paginator and one SELECT for the page, without aggregating topics
+        assert len(ctx.captured_queries) == 2  # noqa: S101
+        assert not any("forum_topic" in q["sql"] and "COUNT" in q["sql"] for q in ctx.captured_queries)  # noqa: S101
@@ -1,11 +1,16 @@
+from django.conf import settings
 from django.urls import path
 
-from . import views
+from . import async_views, views
 
 app_name = "categories"
 
+# The read-only pages are served by the async views when FORUM_ASYNC_VIEWS is on
+read_views = async_views if getattr(settings, "FORUM_ASYNC_VIEWS", False) else views
+
 urlpatterns = [
-    path("", views.category_list, name="category_list"),
+    path("", read_views.category_list, name="category_list"),
     # This URL pattern will be implemented later for task 4.2
-    path("<slug:category_slug>/", views.topics_by_category, name="topics_by_category"),
+    path("<slug:category_slug>/", read_views.topics_by_category, name="topics_by_category"),
+    path("<slug:category_slug>/mark-read/", views.mark_read, name="mark_category_read"),
 ]
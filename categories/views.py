@@ -1,8 +1,14 @@
 # from django.contrib import messages
 # from django.contrib.auth.decorators import login_required, permission_required
+from django.contrib.auth.decorators import login_required
 from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
-from django.db.models import Count
-from django.shortcuts import get_object_or_404, render
+from django.shortcuts import get_object_or_404, redirect, render
+from django.views.decorators.http import require_POST
+
+from forum.decorators import query_budget
+from forum.page_cache import cache_anonymous_page, conditional_page
+from forum.listings import topic_listing
+from forum.read_tracking import mark_category_read
 
 # from .forms import CategoryForm
 from .models import Category
@@ -58,13 +64,18 @@ from .models import Category
 #     )
 
 
+# The category statistics change with every new or deleted topic or post, which is
+# exactly when the "index" scope of the topic listings is bumped
+@conditional_page("index")
+@query_budget(5)
 def category_list(request):
     """
-    View for displaying all categories with their topic counts.
+    View for displaying all categories with their topic and post counts and latest post.
     This view is accessible to all users.
     """
-    # Get all categories and annotate with topic count
-    categories = (Category.objects.annotate(topic_count=Count("topics")).order_by("name"))
+    # The statistics are denormalized onto the category, so the page is a single query
+    # ordered by the unique (indexed) name, with the last poster and topic joined in
+    categories = Category.objects.select_related("last_post_by", "last_post_topic").order_by("name")
 
     # Set up pagination
     paginator = Paginator(categories, 10)  # Show 10 categories per page
@@ -82,6 +93,9 @@ def category_list(request):
     return render(request, "categories/category_list.html", {"categories": categories})
 
 
+@conditional_page("category:{category_slug}")
+@cache_anonymous_page("category:{category_slug}")
+@query_budget(8)
 def topics_by_category(request, category_slug):
     """
     View for displaying all topics in a specific category.
@@ -90,41 +104,21 @@ def topics_by_category(request, category_slug):
     # Get the category by slug
     category = get_object_or_404(Category, slug=category_slug)
 
-    # Get sticky topics in this category, ordered by creation date
-    sticky_topics = category.topics.filter(is_sticky=True).order_by("-created_at")
-
-    # Get regular (non-sticky) topics in this category for pagination
-    regular_topics_list = category.topics.filter(is_sticky=False).order_by(
-        "-created_at",
-    )
-
-    # Set up pagination
-    topics_per_page = 5  # Number of regular topics per page
-    paginator = Paginator(regular_topics_list, topics_per_page)
-    page_number = request.GET.get("page")
+    # Sticky topics at the top, then a page of the regular ones, newest first: numbered
+    # pages for small categories, keyset (?after=/?before=) pages once the category grows
+    # large (see forum/listings.py)
+    context = {"category": category, **topic_listing(request, category.topics.all())}
 
-    try:
-        regular_topics_page = paginator.page(page_number)
-    except PageNotAnInteger:
-        # If page is not an integer, deliver first page
-        regular_topics_page = paginator.page(1)
-    except EmptyPage:
-        # If page is out of range, deliver last page of results
-        regular_topics_page = paginator.page(paginator.num_pages)
-
-    # Generate the elided page range for the regular topics
-    elided_page_range = paginator.get_elided_page_range(
-        number=regular_topics_page.number,
-        on_each_side=2,
-        on_ends=1,
-    )
+    return render(request, "categories/topics_by_category.html", context)
 
-    context = {
-        "category": category,
-        "sticky_topics": sticky_topics,  # Pass sticky topics
-        "regular_topics_page": regular_topics_page,  # Pass paginated regular topics
-        "elided_page_range": elided_page_range,
-        "PAGINATOR_ELLIPSIS": paginator.ELLIPSIS,
-    }
 
-    return render(request, "categories/topics_by_category.html", context)
+@login_required
+@require_POST
+def mark_read(request, category_slug):
+    """
+    View for marking every topic in a category as read for the current user.
+    Only the category's watermark is stored, however many topics it has.
+    """
+    category = get_object_or_404(Category, slug=category_slug)
+    mark_category_read(request.user, category)
+    return redirect("categories:topics_by_category", category_slug=category.slug)
@@ -11,12 +11,14 @@ from .models import Post, Profile, Topic  # Import your models
 # Customized Admin Interface for Topic model
 @admin.register(Topic)
 class TopicAdmin(admin.ModelAdmin):
-    list_display = ("subject", "created_by", "created_at", "is_sticky")  # Add 'is_sticky'
+    list_display = ("subject", "created_by", "created_at", "is_sticky", "post_count", "last_post_at")
     search_fields = ("subject", "created_by__username")
     list_filter = ("created_at", "created_by", "is_sticky")  # Add 'is_sticky'
     date_hierarchy = "created_at"
     ordering = ("-is_sticky", "-created_at")  # Order by sticky status first, then by date
     list_editable = ("is_sticky",)  # Allow editing sticky status directly in the list view
+    # Post statistics are maintained by signals, so they shouldn't be edited by hand
+    readonly_fields = ("post_count", "last_post_at", "last_post_by")
 
 
 # Customized Admin Interface for Post model
@@ -0,0 +1,42 @@
+# forum/async_views.py
+
+# Async versions of the read-only views in views.py, served instead of them when the
+# FORUM_ASYNC_VIEWS setting is on (see urls.py). Under ASGI they wait for the database on
+# the event loop instead of holding a thread for the whole request. They fetch everything
+# a page shows through the async ORM before rendering; Django templates only render
+# synchronously, so the render itself is handed to a worker thread.
+
+from asgiref.sync import sync_to_async
+from django.shortcuts import render
+
+from .decorators import query_budget
+from .listings import atopic_listing
+from .models import Topic
+from .page_cache import cache_anonymous_page, conditional_page
+from .threads import atopic_thread
+from .view_counts import count_topic_view
+
+
+async def arender(request, template_name, context):
+    """
+    render() for async views, run in a worker thread. Fetch everything the context needs
+    beforehand, so rendering doesn't query.
+    """
+    return await sync_to_async(render)(request, template_name, context)
+
+
+@conditional_page("index")
+@cache_anonymous_page("index")
+@query_budget(8)
+async def forum_index(request):
+    context = await atopic_listing(request, Topic.objects.all(), sort=request.GET.get("sort"))
+    return await arender(request, "forum/forum_index.html", context)
+
+
+@count_topic_view
+@conditional_page("topic:{topic_id}")
+@cache_anonymous_page("topic:{topic_id}")
+@query_budget(6)
+async def topic_detail(request, topic_id):
+    context = await atopic_thread(request, topic_id)
+    return await arender(request, "forum/topic_detail.html", context)
@@ -0,0 +1,370 @@
+# forum/avatars.py
+
+import hashlib
+import logging
+import math
+import os
+import re
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import connections
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Sizes of the square thumbnails made of every avatar, in pixels. Templates render avatars
+# with the avatar tag, which offers the browser every size (see templatetags/forum_avatars.py).
+# Can be overridden with the AVATAR_SIZES setting.
+AVATAR_SIZES = (48, 96, 256)
+
+# Threads making thumbnails of uploaded avatars in the background.
+# Can be overridden with the AVATAR_PROCESSING_WORKERS setting.
+AVATAR_PROCESSING_WORKERS = 2
+
+# Whether uploaded avatars are processed by the background threads, or right away in the
+# request that uploaded them.
+# Can be overridden with the AVATAR_PROCESSING_IN_BACKGROUND setting.
+AVATAR_PROCESSING_IN_BACKGROUND = True
+
+# Largest avatar accepted, in pixels (width x height). It's checked from the image header,
+# before anything is decoded: a 2MB upload can hold a far larger image of a single colour.
+# Can be overridden with the AVATAR_MAX_PIXELS setting.
+AVATAR_MAX_PIXELS = 4096 * 4096
+
+# Image formats accepted as avatars, as named by Pillow
+AVATAR_FORMATS = frozenset({"JPEG", "PNG", "GIF"})
+
+# Image modes Image.reduce() works on; others are converted to RGBA first
+REDUCIBLE_MODES = frozenset({"L", "LA", "RGB", "RGBA", "CMYK", "I", "F"})
+
+# Directory (in MEDIA_ROOT) avatars and their thumbnails are stored in
+AVATAR_DIR = "avatars"
+
+# Content-addressed avatar names: the SHA-256 of the original, under a directory named
+# after its first two digits, plus for thumbnails the size and the thumbnail_version()
+# (missing from thumbnails made before it was added)
+CONTENT_ADDRESSED_NAME = re.compile(
+    rf"^{AVATAR_DIR}/[0-9a-f]{{2}}/(?P<digest>[0-9a-f]{{64}})(_\d+(_[0-9a-f]{{8}})?)?\.\w+$",
+)
+
+# Seconds browsers and proxies may cache a content-addressed avatar. The file under a
+# name never changes, so it's a year and marked immutable.
+AVATAR_CACHE_MAX_AGE = 365 * 24 * 60 * 60
+
+# File extensions of the same format, stored under one
+EXTENSION_ALIASES = {".jpeg": ".jpg"}
+
+# The default avatar's static path, without the extension; create_default_avatar makes
+# "<path>.png" and "<path>_<size>.<png|webp>" for each of AVATAR_SIZES
+DEFAULT_AVATAR = "forum/images/default_avatar"
+
+# Every thumbnail is also made in WebP, offered with <picture> to the browsers that take
+# it (all current ones); it's typically far smaller than a PNG of the same image
+WEBP = "webp"
+
+# Encoder settings of the thumbnails, by Pillow format name. Thumbnail names include a
+# hash of them (see thumbnail_version()), so after changing them reprocess_avatars makes
+# every thumbnail again under a new name.
+THUMBNAIL_SAVE_OPTIONS = {
+    "JPEG": {"quality": 85, "optimize": True, "progressive": True},
+    "PNG": {"optimize": True},
+    "WEBP": {"quality": 80, "method": 6},
+}
+
+
+class InvalidAvatar(Exception):  # noqa: N818
+    """Raised for files that aren't an acceptable avatar image; the message says why."""
+
+
+def is_content_addressed(name):
+    return CONTENT_ADDRESSED_NAME.match(name) is not None
+
+
+def avatar_upload_to(instance, filename):
+    """
+    upload_to of Profile.avatar: names the uploaded file after the SHA-256 of its content,
+    so identical avatars are stored once and a name never holds different content.
+    """
+    file = instance.avatar.file
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    extension = PurePosixPath(filename).suffix.lower()
+    extension = EXTENSION_ALIASES.get(extension, extension)
+    hexdigest = digest.hexdigest()
+    return f"{AVATAR_DIR}/{hexdigest[:2]}/{hexdigest}{extension}"
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Storage of MEDIA_ROOT for avatars. A file saved under a content-addressed name that's
+    already stored has the same content, so the stored file is kept instead of being
+    saved again under a new name. Other names are stored like by FileSystemStorage.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        if is_content_addressed(name):
+            return name
+        return super().get_available_name(name, max_length=max_length)
+
+    def _save(self, name, content):
+        if not is_content_addressed(name):
+            return super()._save(name, content)
+        if self.exists(name):
+            # Marks the file as in use again for collect_avatars' grace period
+            os.utime(self.path(name))
+            return name
+        # Written under a temporary name and moved into place, so two uploads of the same
+        # file at once can't leave a partly written file and readers never see one
+        temporary = super()._save(f"{name}.{secrets.token_hex(8)}.tmp", content)
+        os.replace(self.path(temporary), self.path(name))
+        return name
+
+
+# The storage Profile.avatar and the thumbnails are saved in
+avatar_storage = ContentAddressedStorage()
+
+
+def get_avatar_sizes():
+    return tuple(sorted(getattr(settings, "AVATAR_SIZES", AVATAR_SIZES)))
+
+
+def _check_header(image):
+    max_pixels = getattr(settings, "AVATAR_MAX_PIXELS", AVATAR_MAX_PIXELS)
+    if image.format not in AVATAR_FORMATS:
+        msg = f"Unsupported image format {image.format}. Please use JPEG, PNG or GIF."
+        raise InvalidAvatar(msg)
+    if image.width * image.height > max_pixels:
+        msg = f"Image too large. Please keep it under {max_pixels:,} pixels."
+        raise InvalidAvatar(msg)
+
+
+def read_avatar_header(file):
+    """
+    Returns the format and (width, height) of an uploaded avatar, read from its header,
+    after checking them and verifying the file's structure. No pixels are decoded.
+    Uploads validated by a forms.ImageField were already opened and verified by it, and
+    aren't read again.
+    """
+    image = getattr(file, "image", None)
+    if image is None:
+        file.seek(0)
+        try:
+            with Image.open(file) as image:
+                image.verify()
+        except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+            msg = f"Invalid image file: {e!s}"
+            raise InvalidAvatar(msg) from e
+        finally:
+            file.seek(0)
+    _check_header(image)
+    return image.format, image.size
+
+
+def decode_avatar(file, size):
+    """
+    Decodes an avatar in a single pass, at the lowest scale that still fills a size x size
+    square, and returns its centered square, turned upright by its EXIF orientation.
+
+    JPEGs are decoded at 1/2, 1/4 or 1/8 scale with draft(); other formats are cropped and
+    shrunk by a whole factor with reduce() before any resampling. The header is checked
+    first, so an oversized image is rejected before it's decoded.
+    """
+    with Image.open(file) as image:
+        _check_header(image)
+        image_format = image.format
+        shortest = min(image.size)
+        if image_format == "JPEG" and shortest > size:
+            scale = size / shortest
+            image.draft(image.mode, (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+        image.load()
+        ImageOps.exif_transpose(image, in_place=True)
+
+        shortest = min(image.size)
+        left, top = (image.width - shortest) // 2, (image.height - shortest) // 2
+        box = (left, top, left + shortest, top + shortest)
+        factor = shortest // size
+        if image.mode not in REDUCIBLE_MODES:
+            # Palette, bilevel and 16-bit images can't be reduced; crop first so only the
+            # square is converted
+            square = image.crop(box).convert("RGBA" if image.has_transparency_data else "RGB")
+            if factor > 1:
+                square = square.reduce(factor)
+        elif factor > 1:
+            square = image.reduce(factor, box)
+        else:
+            square = image.crop(box)
+    square.format = image_format
+    return square
+
+
+def _thumbnail(square, size):
+    """Returns the decoded square scaled to size x size pixels, in a mode it can be saved in."""
+    thumbnail = square.resize((size, size), Image.Resampling.LANCZOS, reducing_gap=3.0)
+    if square.format == "JPEG":
+        thumbnail = thumbnail.convert("RGB")
+    elif thumbnail.mode not in {"RGB", "RGBA"}:
+        # Greyscale and other modes are stored as RGBA PNGs
+        thumbnail = thumbnail.convert("RGBA")
+    return thumbnail
+
+
+def encode_thumbnail(thumbnail, image_format):
+    """Returns the thumbnail encoded in the format (a Pillow format name) with THUMBNAIL_SAVE_OPTIONS."""
+    output = BytesIO()
+    thumbnail.save(output, format=image_format, **THUMBNAIL_SAVE_OPTIONS[image_format])
+    return output.getvalue()
+
+
+def thumbnail_version():
+    """
+    Returns the short hash of THUMBNAIL_SAVE_OPTIONS thumbnail names end with. Thumbnails
+    made with other encoder settings get other names, and so other URLs: a stored
+    thumbnail is never rewritten, since browsers and proxies cache it as immutable.
+    """
+    options = repr(sorted(THUMBNAIL_SAVE_OPTIONS.items()))
+    return hashlib.sha256(options.encode()).hexdigest()[:8]
+
+
+def thumbnail_key(size, extension=None):
+    """
+    Returns the key of a thumbnail in Profile.avatar_thumbnails: the size for the
+    thumbnail in the avatar's own format ("48"), the size and extension for other formats
+    ("48.webp").
+    """
+    return f"{size}.{extension}" if extension else str(size)
+
+
+def thumbnail_keys():
+    """Returns the thumbnail_key() of every thumbnail make_thumbnails() makes."""
+    return {thumbnail_key(size, extension) for size in get_avatar_sizes() for extension in (None, WEBP)}
+
+
+def has_current_thumbnails(thumbnails):
+    """
+    Returns whether the thumbnails recorded for an avatar (Profile.avatar_thumbnails) are
+    all make_thumbnails() makes now: every size and format, with the current encoder settings.
+    """
+    thumbnails = thumbnails or {}
+    suffix = f"_{thumbnail_version()}"
+    return thumbnail_keys() <= set(thumbnails) and all(
+        PurePosixPath(name).stem.endswith(suffix) for name in thumbnails.values()
+    )
+
+
+def make_thumbnails(avatar_name):
+    """
+    Makes thumbnails of the stored avatar for each of AVATAR_SIZES and returns their names
+    in the storage by thumbnail_key(). The avatar is decoded once, for the largest size.
+    Each size is made in WebP and in a format every browser shows: JPEG for JPEG avatars,
+    PNG for everything else (including the first frame of animated GIFs). Thumbnails
+    already stored under the same name, made with the same encoder settings, are kept.
+    """
+    sizes = get_avatar_sizes()
+    version = thumbnail_version()
+    with avatar_storage.open(avatar_name) as file:
+        square = decode_avatar(file, sizes[-1])
+
+    path = PurePosixPath(avatar_name)
+    fallback = ("JPEG", "jpg") if square.format == "JPEG" else ("PNG", "png")
+    names = {}
+    for size in sizes:
+        thumbnail = None
+        for image_format, extension in (fallback, ("WEBP", WEBP)):
+            key = thumbnail_key(size, extension if extension == WEBP else None)
+            # Stored next to the original and named after it, so the thumbnails of a
+            # content-addressed avatar are shared by everyone using the same image
+            name = str(path.with_name(f"{path.stem}_{size}_{version}.{extension}"))
+            if is_content_addressed(name) and avatar_storage.exists(name):
+                names[key] = name
+                continue
+            if thumbnail is None:
+                thumbnail = _thumbnail(square, size)
+            names[key] = avatar_storage.save(name, ContentFile(encode_thumbnail(thumbnail, image_format)))
+    return names
+
+
+def thumbnail_names(avatar_name, stored_names):
+    """Returns the names among 'stored_names' (of the avatar's directory) of the avatar's thumbnails."""
+    pattern = re.compile(rf"^{re.escape(PurePosixPath(avatar_name).stem)}_\d+(_[0-9a-f]+)?\.\w+$")
+    return [name for name in stored_names if pattern.match(name)]
+
+
+def process_avatar(profile_id, avatar_name):
+    """
+    Makes the thumbnails of a profile's newly stored avatar and records them on the
+    profile. Returns the thumbnail names, or an empty dict if the avatar was replaced or
+    removed in the meantime (its thumbnails are then left to collect_avatars).
+    """
+    # Imported here because forum.models imports this module
+    from .models import Profile  # noqa: PLC0415
+    from .page_cache import invalidate  # noqa: PLC0415
+
+    thumbnails = make_thumbnails(avatar_name)
+    # Filtering on the avatar keeps a slow job from overwriting a newer upload's thumbnails.
+    # Bumping updated_at expires the fragments showing the avatar.
+    updated = Profile.objects.filter(pk=profile_id, avatar=avatar_name).update(
+        avatar_thumbnails=thumbnails,
+        updated_at=timezone.now(),
+    )
+    if not updated:
+        return {}
+    invalidate("profiles")
+    return thumbnails
+
+
+class AvatarProcessor:
+    """
+    Runs process_avatar() for uploaded avatars in a pool of background threads, so the
+    upload request only has to store the original. Until a profile's thumbnails are
+    recorded, Profile.get_avatar_url() serves the original. A failed job is logged and
+    leaves the original in use.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def submit(self, profile_id, avatar_name):
+        """Queues the avatar for processing, or processes it right away if not in background mode."""
+        if not getattr(settings, "AVATAR_PROCESSING_IN_BACKGROUND", AVATAR_PROCESSING_IN_BACKGROUND):
+            self._run(profile_id, avatar_name, close_connections=False)
+            return None
+        with self._lock:
+            if self._executor is None:
+                workers = getattr(settings, "AVATAR_PROCESSING_WORKERS", AVATAR_PROCESSING_WORKERS)
+                self._executor = ThreadPoolExecutor(workers, thread_name_prefix="avatar-processing")
+            return self._executor.submit(self._run, profile_id, avatar_name)
+
+    @staticmethod
+    def _run(profile_id, avatar_name, *, close_connections=True):
+        try:
+            return process_avatar(profile_id, avatar_name)
+        except (OSError, ValueError, InvalidAvatar, Image.DecompressionBombError):
+            logger.exception("Could not process avatar %s of profile %s", avatar_name, profile_id)
+            return {}
+        finally:
+            if close_connections:
+                # Each worker thread has its own connections; don't leave them open between jobs
+                connections.close_all()
+
+    def wait(self):
+        """Waits for all queued avatars to be processed."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+# The processor the Profile post_save handler queues uploaded avatars with
+avatar_processor = AvatarProcessor()
@@ -1,11 +1,34 @@
 # forum/decorators.py
 
+import logging
 from functools import wraps
+from inspect import iscoroutinefunction
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib import messages
-from django.shortcuts import get_object_or_404, redirect
+from django.db import connection
+from django.shortcuts import redirect
 
-from .models import User
+from .identity_map import get_profile, get_user_or_404
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):  # noqa: N818
+    """Raised by query_budget when a view runs more SQL queries than it declared."""
+
+
+async def load_user(request):
+    """
+    Loads the request's user for async views and decorators.
+
+    request.user is loaded lazily with a synchronous query, which isn't allowed on the
+    event loop; this loads it through request.auser() instead and puts the result in its
+    place, so request.user can be used freely afterwards. Loading it again is free.
+    """
+    request.user = await request.auser()
+    return request.user
 
 
 def profile_visibility_required(view_func):
@@ -22,11 +45,12 @@ def profile_visibility_required(view_func):
 
     @wraps(view_func)
     def _wrapped_view(request, username, *args, **kwargs):
-        # Get the User object for the requested username, or raise a 404 if not found
-        profile_user = get_object_or_404(User, username=username)
+        # Get the User object for the requested username, or raise a 404 if not found. It's
+        # loaded with its profile and kept in the request's identity map for the view
+        profile_user = get_user_or_404(username)
 
         # Check profile visibility settings
-        profile = profile_user.profile
+        profile = get_profile(profile_user)
         visibility = profile.profile_visibility
 
         # Determine if the current user can view this profile
@@ -54,3 +78,78 @@ def profile_visibility_required(view_func):
         return view_func(request, username, *args, **kwargs)
 
     return _wrapped_view
+
+
+def query_budget(max_queries):
+    """
+    Decorator to declare the maximum number of SQL queries a view may run.
+
+    The budget covers everything executed while the view runs, including template
+    rendering done through render(). What happens when a view goes over budget is
+    controlled by the QUERY_BUDGET_MODE setting:
+
+    - "off": the budget isn't checked (default, and what production should use)
+    - "log": a warning is logged with the offending SQL
+    - "raise": QueryBudgetExceeded is raised, which is useful in development and tests
+
+    The declared budget is also exposed as the view's 'query_budget' attribute so tests
+    can assert against it.
+    """
+
+    def check(view_func, executed, mode):
+        if len(executed) > max_queries:
+            msg = f"{view_func.__name__} ran {len(executed)} queries, exceeding its budget of {max_queries}"
+            if mode == "raise":
+                raise QueryBudgetExceeded(msg)
+            logger.warning("%s:\n%s", msg, "\n".join(executed))
+
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+
+            @wraps(view_func)
+            async def _wrapped_view(request, *args, **kwargs):
+                mode = getattr(settings, "QUERY_BUDGET_MODE", "off")
+                if mode == "off":
+                    return await view_func(request, *args, **kwargs)
+
+                executed = []
+
+                def count_queries(execute, sql, params, many, context):
+                    executed.append(sql)
+                    return execute(sql, params, many, context)
+
+                # The async ORM runs queries on the request's thread-sensitive worker
+                # thread, so that's the connection the wrapper has to go on
+                await sync_to_async(lambda: connection.execute_wrappers.append(count_queries))()
+                try:
+                    response = await view_func(request, *args, **kwargs)
+                finally:
+                    await sync_to_async(lambda: connection.execute_wrappers.remove(count_queries))()
+
+                check(view_func, executed, mode)
+                return response
+
+        else:
+
+            @wraps(view_func)
+            def _wrapped_view(request, *args, **kwargs):
+                mode = getattr(settings, "QUERY_BUDGET_MODE", "off")
+                if mode == "off":
+                    return view_func(request, *args, **kwargs)
+
+                executed = []
+
+                def count_queries(execute, sql, params, many, context):
+                    executed.append(sql)
+                    return execute(sql, params, many, context)
+
+                with connection.execute_wrapper(count_queries):
+                    response = view_func(request, *args, **kwargs)
+
+                check(view_func, executed, mode)
+                return response
+
+        _wrapped_view.query_budget = max_queries
+        return _wrapped_view
+
+    return decorator
@@ -6,9 +6,9 @@ from typing import ClassVar, cast
 from django import forms
 from django.core.exceptions import ValidationError
 from django.db.models import QuerySet
-from PIL import Image
 
 from categories.models import Category
+from .avatars import InvalidAvatar, read_avatar_header
 from .models import Profile
 
 
@@ -77,7 +77,8 @@ class ProfileForm(forms.ModelForm):
         Checks:
         - File size (max 2MB)
         - File type (must be jpg, jpeg, png, or gif)
-        - Image dimensions (minimum 100x100 pixels)
+        - Image format and dimensions (minimum 100x100 pixels, at most AVATAR_MAX_PIXELS),
+          read from the image header without decoding it
 
         Returns:
         - object | None: The validated avatar file or None if no file was uploaded
@@ -86,7 +87,8 @@ class ProfileForm(forms.ModelForm):
 
         """
         avatar = self.cleaned_data.get("avatar")
-        if not avatar:
+        if not avatar or not hasattr(avatar, "content_type"):
+            # No upload, just the avatar already stored
             return avatar
 
         self._validate_file_size(avatar)
@@ -105,21 +107,13 @@ class ProfileForm(forms.ModelForm):
             raise ValidationError(self.ERROR_FILE_TYPE)
 
     def _validate_image_dimensions(self, avatar) -> None:
-        def raise_dimension_error():
-            raise ValidationError(self.ERROR_DIMENSIONS)
-
-        def raise_invalid_image(exp):
-            msg = f"Invalid image file: {exp!s}"
-            raise ValidationError(msg) from exp
-
         try:
-            img = Image.open(avatar)
-            if img.height < self.IMAGE_HEIGHT_MIN or img.width < self.IMAGE_WIDTH_MIN:
-                raise_dimension_error()
-            # Note: Large images will be resized in the view after saving
-        # except Exception as e:
-        except ValidationError as e:
-            raise_invalid_image(e)
+            _, (width, height) = read_avatar_header(avatar)
+        except InvalidAvatar as e:
+            raise ValidationError(str(e)) from e
+        if height < self.IMAGE_HEIGHT_MIN or width < self.IMAGE_WIDTH_MIN:
+            raise ValidationError(self.ERROR_DIMENSIONS)
+        # Thumbnails are made from the stored original in the background (see forum/avatars.py)
 
     class Meta:
         model = Profile
@@ -0,0 +1,66 @@
+# forum/fragment_cache.py
+
+import hashlib
+import zlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from .models import Post, Topic
+from .rendering import current_renderer_version
+
+# Seconds a rendered fragment is kept. Keys change with the object's version, so this
+# only bounds how long fragments of unchanged objects use memory. 0 disables the cache.
+# Can be overridden with the FORUM_FRAGMENT_CACHE_TIMEOUT setting.
+FRAGMENT_CACHE_TIMEOUT = 3600
+
+# Cache (from the CACHES setting) fragments are stored in.
+# Can be overridden with the FORUM_FRAGMENT_CACHE_ALIAS setting.
+FRAGMENT_CACHE_ALIAS = "default"
+
+
+def get_fragment_cache():
+    return caches[getattr(settings, "FORUM_FRAGMENT_CACHE_ALIAS", FRAGMENT_CACHE_ALIAS)]
+
+
+def _author_version(obj):
+    # Username, avatar, title and signature of the author are shown next to their content
+    author = obj.created_by
+    return (author.pk, author.username, author.profile.updated_at)
+
+
+def fragment_version(obj):
+    """
+    Returns the parts of an object's fragment cache key that change whenever anything
+    rendered for it changes: the object's own version and its author profile's version.
+
+    Only columns loaded by Topic.objects.for_listing() and Post.objects.for_thread() are
+    used, so building a key never queries the database.
+    """
+    if isinstance(obj, Topic):
+        category = obj.category
+        return (obj.updated_at, category.updated_at if category else None, *_author_version(obj))
+    if isinstance(obj, Post):
+        return (
+            obj.updated_at,
+            # Posts edited without touching updated_at (e.g. in the admin) still get a new key
+            zlib.crc32(obj.message_html.encode()),
+            # get_message_html() re-renders posts stored by an outdated renderer
+            obj.renderer_version,
+            current_renderer_version(),
+            *_author_version(obj),
+        )
+    msg = f"No fragment version for {type(obj).__name__} objects"
+    raise TypeError(msg)
+
+
+def fragment_cache_key(name, obj):
+    """
+    Returns the cache key of the 'name' fragment rendered for 'obj', built from the model,
+    the primary key and fragment_version(). Dates in fragments are rendered in the active
+    timezone, so that's part of the key too.
+    """
+    version = repr((*fragment_version(obj), timezone.get_current_timezone_name()))
+    digest = hashlib.md5(version.encode(), usedforsecurity=False).hexdigest()
+    return f"forum:fragment:{name}:{obj._meta.label_lower}:{obj.pk}:{digest}"
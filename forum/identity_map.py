@@ -0,0 +1,99 @@
+# forum/identity_map.py
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.http import Http404
+
+from .models import Profile, User
+
+
+class IdentityMap:
+    """
+    The users and profiles loaded while handling one request.
+
+    Each user is loaded once and the same instance is handed out by primary key and by
+    username afterwards, so decorators, views and template tags don't query for a user
+    or profile that something earlier in the request, e.g. request.user, already loaded.
+    """
+
+    def __init__(self):
+        self.users = {}  # pk -> User
+        self.usernames = {}  # username -> User
+        self.profiles = {}  # user pk -> Profile
+
+
+# The map of the request being handled, set by IdentityMapMiddleware. Outside of a request
+# (management commands, background threads, tests calling views directly) there is none
+# and every lookup goes to the database.
+_identity_map = ContextVar("identity_map", default=None)
+
+
+@contextmanager
+def request_identity_map():
+    """Gives the code run within it a new, empty identity map, discarded on exit."""
+    token = _identity_map.set(IdentityMap())
+    try:
+        yield
+    finally:
+        _identity_map.reset(token)
+
+
+def remember(user):
+    """
+    Adds the user, with its profile if that was loaded along with it, to the request's
+    identity map. Returns the instance the map holds for the user, which is the one to
+    use from then on.
+    """
+    identity_map = _identity_map.get()
+    if identity_map is None:
+        return user
+    user = identity_map.users.setdefault(user.pk, user)
+    identity_map.usernames.setdefault(user.username, user)
+    if User.profile.is_cached(user):
+        try:
+            identity_map.profiles.setdefault(user.pk, user.profile)
+        except Profile.DoesNotExist:
+            pass
+    return user
+
+
+def find_user(*, pk=None, username=None):
+    """Returns the user already loaded during the request by primary key or username, or None."""
+    identity_map = _identity_map.get()
+    if identity_map is None:
+        return None
+    if pk is not None:
+        return identity_map.users.get(pk)
+    return identity_map.usernames.get(username)
+
+
+def get_user_or_404(username):
+    """Returns the user with the username along with their profile, raising Http404 if there's none."""
+    user = find_user(username=username)
+    if user is None:
+        try:
+            user = User.objects.select_related("profile").get(username=username)
+        except User.DoesNotExist as e:
+            msg = "No User matches the given query."
+            raise Http404(msg) from e
+        user = remember(user)
+    return user
+
+
+def get_profile(user):
+    """
+    Returns the user's profile, from the identity map if it was loaded earlier in the
+    request. Raises Profile.DoesNotExist if the user has none.
+    """
+    identity_map = _identity_map.get()
+    profile = identity_map.profiles.get(user.pk) if identity_map is not None else None
+    if profile is None:
+        profile = user.profile
+        if identity_map is not None:
+            profile = identity_map.profiles.setdefault(user.pk, profile)
+    if not User.profile.is_cached(user):
+        # Later user.profile lookups, e.g. in templates, get it without a query too
+        user.profile = profile
+    return profile
+
@@ -0,0 +1,113 @@
+# forum/last_seen.py
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+
+# A user's last_seen is only recorded again once the recorded value is this old (seconds).
+# Can be overridden with the LAST_SEEN_UPDATE_INTERVAL setting.
+LAST_SEEN_UPDATE_INTERVAL = 300
+
+# Recorded timestamps are written to the database at most this often (seconds).
+# Can be overridden with the LAST_SEEN_FLUSH_INTERVAL setting.
+LAST_SEEN_FLUSH_INTERVAL = 60
+
+logger = logging.getLogger(__name__)
+
+
+class LastSeenBuffer:
+    """
+    In-process buffer of users' last-seen timestamps.
+
+    Browsing records a timestamp at most once per LAST_SEEN_UPDATE_INTERVAL per user, and
+    pending timestamps are written to Profile.last_seen in a single UPDATE at most once per
+    LAST_SEEN_FLUSH_INTERVAL. Until then, get() returns the pending value so reads through
+    Profile.get_last_seen() stay current.
+
+    The buffer only lives in the process: timestamps still pending when it exits (at most
+    the last flush interval's worth) are lost, leaving those users' last_seen slightly
+    older than it should be.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}  # user_id -> timestamp not written to the database yet
+        self._recorded = {}  # user_id -> most recent timestamp recorded for the user
+        self._last_flush = time.monotonic()
+
+    def touch(self, user_id, when):
+        """Records that the user was seen at 'when', unless they were recorded recently."""
+        interval = getattr(settings, "LAST_SEEN_UPDATE_INTERVAL", LAST_SEEN_UPDATE_INTERVAL)
+        with self._lock:
+            recorded = self._recorded.get(user_id)
+            if recorded is not None and (when - recorded).total_seconds() < interval:
+                return
+            self._recorded[user_id] = when
+            self._pending[user_id] = when
+
+    def get(self, user_id):
+        """Returns the user's pending last-seen timestamp, or None if nothing is pending."""
+        with self._lock:
+            return self._pending.get(user_id)
+
+    def flush_if_due(self):
+        """Flushes the buffer if LAST_SEEN_FLUSH_INTERVAL has passed since the last flush."""
+        interval = getattr(settings, "LAST_SEEN_FLUSH_INTERVAL", LAST_SEEN_FLUSH_INTERVAL)
+        if time.monotonic() - self._last_flush >= interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes all pending timestamps in one UPDATE and returns the number of users written.
+        If the write fails (e.g. the database is locked) the timestamps are kept for the
+        next flush and the error is logged rather than raised, so it doesn't fail the
+        request that happened to trigger the flush.
+        """
+        interval = getattr(settings, "LAST_SEEN_UPDATE_INTERVAL", LAST_SEEN_UPDATE_INTERVAL)
+        now = timezone.now()
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+            # Users recorded more than an update interval ago would be recorded again on
+            # their next request anyway, so there's no need to remember them
+            self._recorded = {
+                user_id: when
+                for user_id, when in self._recorded.items()
+                if (now - when).total_seconds() < interval
+            }
+
+        if not pending:
+            return 0
+
+        # Imported here because forum.models imports this module
+        from .models import Profile  # noqa: PLC0415
+
+        try:
+            Profile.objects.filter(user_id__in=pending).update(
+                last_seen=Case(
+                    *(When(user_id=user_id, then=Value(when)) for user_id, when in pending.items()),
+                    output_field=DateTimeField(),
+                ),
+            )
+        except DatabaseError:
+            logger.exception("Failed to write the last-seen times of %d users, retrying next flush", len(pending))
+            with self._lock:
+                # Times recorded since the batch was taken are newer and win
+                self._pending = {**pending, **self._pending}
+            return 0
+        return len(pending)
+
+    def clear(self):
+        """Drops everything buffered without writing it."""
+        with self._lock:
+            self._pending = {}
+            self._recorded = {}
+
+
+# The buffer shared by LastSeenMiddleware and Profile.get_last_seen()
+last_seen_buffer = LastSeenBuffer()
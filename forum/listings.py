@@ -0,0 +1,67 @@
+# forum/listings.py
+
+# The topic listings of the forum index and of each category, shared by the sync views and
+# their async versions so the two build the same page.
+
+from .decorators import load_user
+from .pagination import apaginate_listing, paginate_listing
+from .read_tracking import flag_unread_topics
+
+# Number of regular (non-sticky) topics per page of a listing
+TOPICS_PER_PAGE = 5
+
+
+def _listing_querysets(topics, user, sort):
+    """
+    Returns the sticky topics of 'topics', newest first, and the regular topics to paginate
+    in the listing's order.
+
+    for_listing() joins in each topic's author, profile and category so rendering a row
+    doesn't query, and with_read_state() adds what the unread indicators need to the same
+    query.
+    """
+    sticky_topics = topics.filter(is_sticky=True).for_listing().with_read_state(user).order_by("-created_at")
+    regular_topics = topics.filter(is_sticky=False).for_listing().with_read_state(user)
+    if sort == "views":
+        return sticky_topics, regular_topics.most_viewed()
+    return sticky_topics, regular_topics.order_by("-created_at")
+
+
+def _listing_context(user, sticky_topics, pagination, sort):
+    flag_unread_topics(user, sticky_topics)
+    flag_unread_topics(user, pagination["page"])
+    return {
+        "sticky_topics": sticky_topics,
+        "regular_topics_page": pagination["page"],
+        "keyset_pagination": pagination["keyset_pagination"],
+        "elided_page_range": pagination["elided_page_range"],
+        "PAGINATOR_ELLIPSIS": pagination["PAGINATOR_ELLIPSIS"],
+        "sort": sort,
+        # Appended to the numbered page links so they keep the sort order
+        "sort_query": "&sort=views" if sort == "views" else "",
+    }
+
+
+def topic_listing(request, topics, sort=None):
+    """
+    Returns the template context of a listing of 'topics': the sticky ones, then a page of
+    the others, newest first or, with sort="views", most viewed first.
+
+    Newest-first listings get numbered pages while they're small and keyset (?after=/
+    ?before=) pages once they grow large; "most viewed" pages are always numbered, since
+    the cursors only work on the newest-first order.
+    """
+    sort = "views" if sort == "views" else "newest"
+    sticky_topics, regular_topics = _listing_querysets(topics, request.user, sort)
+    pagination = paginate_listing(request, regular_topics, TOPICS_PER_PAGE, keyset=sort == "newest")
+    return _listing_context(request.user, sticky_topics, pagination, sort)
+
+
+async def atopic_listing(request, topics, sort=None):
+    """Async version of topic_listing(), fetching the topics through the async ORM."""
+    user = await load_user(request)
+    sort = "views" if sort == "views" else "newest"
+    sticky_topics, regular_topics = _listing_querysets(topics, user, sort)
+    sticky_topics = [topic async for topic in sticky_topics]
+    pagination = await apaginate_listing(request, regular_topics, TOPICS_PER_PAGE, keyset=sort == "newest")
+    return _listing_context(user, sticky_topics, pagination, sort)
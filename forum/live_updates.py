@@ -0,0 +1,167 @@
+# forum/live_updates.py
+
+import asyncio
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import Post
+
+# Seconds between keep-alive comments on an idle event stream, so proxies don't drop it.
+# Can be overridden with the LIVE_UPDATES_HEARTBEAT setting.
+LIVE_UPDATES_HEARTBEAT = 15
+
+# Events a listener may fall behind by before its stream is closed. The browser then
+# reconnects and catches up from the database using the Last-Event-ID header.
+# Can be overridden with the LIVE_UPDATES_QUEUE_SIZE setting.
+LIVE_UPDATES_QUEUE_SIZE = 100
+
+# A reconnecting listener is sent at most this many missed posts; further behind, it's
+# told to reload the page instead.
+# Can be overridden with the LIVE_UPDATES_REPLAY_LIMIT setting.
+LIVE_UPDATES_REPLAY_LIMIT = 20
+
+
+class Subscription:
+    """A listener's queue of events, filled on the event loop the listener runs on."""
+
+    def __init__(self, loop, maxsize):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def deliver(self, event):
+        """Queues an event for the listener; a listener that fell too far behind is flagged."""
+        # Always called on self.loop, so the queue needs no locking
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class TopicBroker:
+    """
+    In-process publish/subscribe of new posts, per topic.
+
+    Listeners are asyncio queues, so an idle listener costs one pending await and no
+    thread. publish() may be called from any thread (sync views run in a thread pool under
+    ASGI) and hands the event to each listener's own event loop. Only listeners connected
+    to the same process receive an event; listeners of other processes catch up when their
+    browser reconnects.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}  # topic_id -> set of Subscription
+
+    def subscribe(self, topic_id):
+        """Registers a listener for the topic; must be called from the listener's event loop."""
+        maxsize = getattr(settings, "LIVE_UPDATES_QUEUE_SIZE", LIVE_UPDATES_QUEUE_SIZE)
+        subscription = Subscription(asyncio.get_running_loop(), maxsize)
+        with self._lock:
+            self._subscriptions.setdefault(topic_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, topic_id, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(topic_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[topic_id]
+
+    def has_subscribers(self, topic_id):
+        with self._lock:
+            return topic_id in self._subscriptions
+
+    def publish(self, topic_id, event):
+        """Sends the event to every listener of the topic and returns how many there were."""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(topic_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # The listener's event loop is gone
+                self.unsubscribe(topic_id, subscription)
+        return len(subscriptions)
+
+
+# The broker shared by new_post and the topic_events stream
+topic_broker = TopicBroker()
+
+
+def render_live_post(post):
+    """
+    Renders the part of a post every visitor sees, for pushing to live listeners. It's
+    rendered once for all of them, so dates are shown in the site's default timezone.
+    The post's author and profile should be loaded (Post.objects.for_thread()).
+    """
+    with timezone.override(settings.TIME_ZONE):
+        return render_to_string("forum/live_post.html", {"post": post}).strip()
+
+
+def format_event(data, event=None, event_id=None):
+    """Formats one Server-Sent Events message; multi-line data is split over 'data:' fields."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event is not None:
+        lines.append(f"event: {event}")
+    lines.extend(f"data: {line}" for line in data.splitlines() or [""])
+    return "\n".join(lines) + "\n\n"
+
+
+def publish_post(post):
+    """
+    Pushes a newly created post to the topic's live listeners in this process. Nothing is
+    rendered when nobody is listening.
+    """
+    if not topic_broker.has_subscribers(post.topic_id):
+        return 0
+    message = format_event(render_live_post(post), event="post", event_id=post.sequence)
+    return topic_broker.publish(post.topic_id, (post.sequence, message))
+
+
+async def topic_event_stream(topic_id, after=None):
+    """
+    Yields the Server-Sent Events of a topic's live listener: the posts after sequence
+    number 'after' (if given) from the database, then every new post as it's published,
+    with keep-alive comments in between. The stream ends when the listener falls more than
+    LIVE_UPDATES_QUEUE_SIZE events behind; the browser then reconnects with the sequence
+    of the last post it got as Last-Event-ID.
+    """
+    heartbeat = getattr(settings, "LIVE_UPDATES_HEARTBEAT", LIVE_UPDATES_HEARTBEAT)
+    replay_limit = getattr(settings, "LIVE_UPDATES_REPLAY_LIMIT", LIVE_UPDATES_REPLAY_LIMIT)
+    # Subscribe before catching up, so no post can slip in between
+    subscription = topic_broker.subscribe(topic_id)
+    try:
+        # Reconnect quickly after the stream ends
+        yield "retry: 3000\n\n"
+
+        if after is not None:
+            missed = Post.objects.for_thread().filter(topic_id=topic_id, sequence__gt=after).order_by("sequence")
+            posts = [post async for post in missed[: replay_limit + 1]]
+            if len(posts) > replay_limit:
+                yield format_event("", event="reload")
+                return
+            for post in posts:
+                after = post.sequence
+                html = await sync_to_async(render_live_post)(post)
+                yield format_event(html, event="post", event_id=post.sequence)
+
+        while not subscription.overflowed:
+            try:
+                sequence, message = await asyncio.wait_for(subscription.queue.get(), heartbeat)
+            except TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            # Posts published while catching up were sent from the database already
+            if after is None or sequence > after:
+                after = sequence
+                yield message
+    finally:
+        topic_broker.unsubscribe(topic_id, subscription)
@@ -0,0 +1,243 @@
+import asyncio
+import importlib
+import io
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import override_settings
+from django.urls import clear_url_caches
+
+DEFAULT_PATHS = ("/forum/", "/categories/")
+CLIENT_ADDRESS = "127.0.0.1"
+
+
+def _reload_urlconf():
+    # The URLconf picks the views for FORUM_ASYNC_VIEWS when it's imported (see forum/urls.py)
+    for module in ("forum.urls", "categories.urls", settings.ROOT_URLCONF):
+        importlib.reload(importlib.import_module(module))
+    clear_url_caches()
+
+
+@contextmanager
+def _views(use_async):
+    """Serves the read-only pages with the sync or the async views for the duration."""
+    try:
+        with override_settings(FORUM_ASYNC_VIEWS=use_async):
+            _reload_urlconf()
+            yield
+    finally:
+        _reload_urlconf()
+
+
+def _summary(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": percentile(0.50),
+        "p99": percentile(0.99),
+        "errors": errors,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks requests/s and p50/p99 latency of the read-only pages under concurrent "
+        "load: through Django's WSGI handler with the sync views, and through its ASGI handler "
+        "with the sync and with the async views (FORUM_ASYNC_VIEWS). With --server, running "
+        "deployments (e.g. gunicorn and uvicorn) are benchmarked over HTTP instead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500, help="Requests per run (default: 500)")
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=20,
+            help="Concurrent requests: WSGI worker threads or ASGI tasks (default: 20)",
+        )
+        parser.add_argument(
+            "--path",
+            action="append",
+            dest="paths",
+            help="Path to request, may be repeated; requests cycle through them (default: /forum/ and /categories/)",
+        )
+        parser.add_argument(
+            "--host",
+            default="127.0.0.1",
+            help="Host header of the in-process requests; must be in ALLOWED_HOSTS (default: 127.0.0.1)",
+        )
+        parser.add_argument(
+            "--server",
+            action="append",
+            dest="servers",
+            metavar="NAME=URL",
+            help="A running deployment to benchmark over HTTP, e.g. asgi=http://127.0.0.1:8001; may be repeated",
+        )
+
+    def handle(self, *args, **options):
+        paths = options["paths"] or DEFAULT_PATHS
+        total, concurrency, host = options["requests"], options["concurrency"], options["host"]
+
+        self.stdout.write(f"{total} requests, concurrency {concurrency}, paths: {', '.join(paths)}\n")
+        self.stdout.write(f"{'deployment':<24}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+
+        if options["servers"]:
+            for server in options["servers"]:
+                name, sep, url = server.partition("=")
+                if not sep:
+                    msg = f"--server must be NAME=URL, got {server!r}"
+                    raise CommandError(msg)
+                self._report(name, self._run_http(url.rstrip("/"), paths, total, concurrency))
+            return
+
+        runs = (
+            ("wsgi + sync views", self._run_wsgi, False),
+            ("asgi + sync views", self._run_asgi, False),
+            ("asgi + async views", self._run_asgi, True),
+        )
+        for name, run, use_async in runs:
+            with _views(use_async):
+                self._report(name, run(host, paths, total, concurrency))
+
+    def _report(self, name, result):
+        self.stdout.write(
+            f"{name:<24}{result['rps']:>10.0f}{result['p50']:>10.1f}{result['p99']:>10.1f}{result['errors']:>8}",
+        )
+
+    @staticmethod
+    def _run_wsgi(host, paths, total, concurrency):
+        # Like a threaded WSGI server: each worker thread serves one request at a time
+        handler = WSGIHandler()
+        counter = iter(range(total))
+        lock = threading.Lock()
+        latencies, errors = [], []
+
+        def environ(path):
+            return {
+                "REQUEST_METHOD": "GET",
+                "PATH_INFO": path,
+                "QUERY_STRING": "",
+                "SCRIPT_NAME": "",
+                "SERVER_NAME": host,
+                "SERVER_PORT": "80",
+                "SERVER_PROTOCOL": "HTTP/1.1",
+                "REMOTE_ADDR": CLIENT_ADDRESS,
+                "wsgi.input": io.BytesIO(),
+                "wsgi.errors": io.StringIO(),
+                "wsgi.url_scheme": "http",
+                "wsgi.version": (1, 0),
+                "wsgi.multithread": True,
+                "wsgi.multiprocess": False,
+                "wsgi.run_once": False,
+            }
+
+        def worker():
+            while True:
+                with lock:
+                    i = next(counter, None)
+                if i is None:
+                    break
+                statuses = []
+                started = time.perf_counter()
+                body = handler(environ(paths[i % len(paths)]), lambda status, headers: statuses.append(status))
+                b"".join(body)
+                body.close()
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    if int(statuses[0].split()[0]) >= 400:  # noqa: PLR2004
+                        errors.append(i)
+            connections.close_all()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            for future in [executor.submit(worker) for _ in range(concurrency)]:
+                future.result()
+        return _summary(latencies, len(errors), time.perf_counter() - started)
+
+    @staticmethod
+    def _run_asgi(host, paths, total, concurrency):
+        # Like an ASGI server: one event loop with a task per in-flight request
+        handler = ASGIHandler()
+        latencies, errors = [], []
+
+        async def request(path):
+            scope = {
+                "type": "http",
+                "asgi": {"version": "3.0"},
+                "http_version": "1.1",
+                "method": "GET",
+                "scheme": "http",
+                "path": path,
+                "raw_path": path.encode(),
+                "query_string": b"",
+                "root_path": "",
+                "headers": [(b"host", host.encode())],
+                "client": (CLIENT_ADDRESS, 50000),
+                "server": (host, 80),
+            }
+            body_sent = False
+            status = []
+
+            async def receive():
+                nonlocal body_sent
+                if not body_sent:
+                    body_sent = True
+                    return {"type": "http.request", "body": b"", "more_body": False}
+                # The client never disconnects; Django stops listening once it has responded
+                await asyncio.Future()
+                return None
+
+            async def send(message):
+                if message["type"] == "http.response.start":
+                    status.append(message["status"])
+
+            started = time.perf_counter()
+            await handler(scope, receive, send)
+            latencies.append(time.perf_counter() - started)
+            if status[0] >= 400:  # noqa: PLR2004
+                errors.append(path)
+
+        async def main():
+            counter = iter(range(total))
+
+            async def worker():
+                for i in counter:
+                    await request(paths[i % len(paths)])
+
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+        started = time.perf_counter()
+        asyncio.run(main())
+        return _summary(latencies, len(errors), time.perf_counter() - started)
+
+    @staticmethod
+    def _run_http(base_url, paths, total, concurrency):
+        def fetch(i):
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(base_url + paths[i % len(paths)], timeout=30) as response:  # noqa: S310
+                    response.read()
+                    failed = False
+            except (urllib.error.URLError, TimeoutError):
+                failed = True
+            return time.perf_counter() - started, failed
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            results = list(executor.map(fetch, range(total)))
+        elapsed = time.perf_counter() - started
+        return _summary([latency for latency, _ in results], sum(failed for _, failed in results), elapsed)
@@ -0,0 +1,124 @@
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+SEED_TOPICS = 200
+SEED_POSTS_PER_TOPIC = 50
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks concurrent read/write throughput of a scratch SQLite database with the "
+        "default settings and with the production profile (SQLITE_PRODUCTION_PRAGMAS and "
+        "persistent connections)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seconds", type=float, default=5.0, help="Duration of each run (default: 5)")
+        parser.add_argument("--readers", type=int, default=8, help="Number of reader threads (default: 8)")
+        parser.add_argument("--writers", type=int, default=2, help="Number of writer threads (default: 2)")
+
+    def handle(self, *args, **options):
+        profiles = (
+            # What Django runs with out of the box: Python sqlite3's 5s busy timeout, no
+            # pragmas and a new connection per operation (no CONN_MAX_AGE)
+            ("default", {}, False),
+            # Production pragmas, with each thread keeping its connection open
+            ("production", settings.SQLITE_PRODUCTION_PRAGMAS, True),
+        )
+
+        self.stdout.write(
+            f"{options['readers']} readers, {options['writers']} writers, {options['seconds']}s per run\n",
+        )
+        self.stdout.write(f"{'profile':<12}{'reads/s':>12}{'writes/s':>12}{'locked errors':>16}")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for name, pragmas, persistent in profiles:
+                db_path = Path(tmp_dir) / f"{name}.sqlite3"
+                self._seed(db_path, pragmas)
+                reads, writes, errors = self._run(db_path, pragmas, persistent, options)
+                seconds = options["seconds"]
+                self.stdout.write(f"{name:<12}{reads / seconds:>12.0f}{writes / seconds:>12.0f}{errors:>16}")
+
+    @staticmethod
+    def _connect(db_path, pragmas):
+        # isolation_level=None so transactions are controlled explicitly, like Django does.
+        # The connection keeps sqlite3's default busy timeout, as Django's do; a profile
+        # setting the busy_timeout pragma replaces it
+        connection = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        for pragma, value in pragmas.items():
+            connection.execute(f"PRAGMA {pragma} = {value}")
+        return connection
+
+    def _seed(self, db_path, pragmas):
+        connection = self._connect(db_path, pragmas)
+        connection.execute(
+            "CREATE TABLE post (id INTEGER PRIMARY KEY, topic_id INTEGER NOT NULL, message TEXT NOT NULL)",
+        )
+        connection.execute("CREATE INDEX post_topic ON post (topic_id, id)")
+        connection.execute("BEGIN")
+        connection.executemany(
+            "INSERT INTO post (topic_id, message) VALUES (?, ?)",
+            (
+                (topic_id, "x" * 200)
+                for topic_id in range(SEED_TOPICS)
+                for _ in range(SEED_POSTS_PER_TOPIC)
+            ),
+        )
+        connection.execute("COMMIT")
+        connection.close()
+
+    def _run(self, db_path, pragmas, persistent, options):
+        deadline = time.monotonic() + options["seconds"]
+        counts = {"reads": 0, "writes": 0, "errors": 0}
+        lock = threading.Lock()
+
+        def read(connection, i):
+            connection.execute(
+                "SELECT id, message FROM post WHERE topic_id = ? ORDER BY id LIMIT 20",
+                (i % SEED_TOPICS,),
+            ).fetchall()
+
+        def write(connection, i):
+            connection.execute("BEGIN IMMEDIATE" if persistent else "BEGIN")
+            try:
+                connection.execute("INSERT INTO post (topic_id, message) VALUES (?, ?)", (i % SEED_TOPICS, "reply"))
+                connection.execute("COMMIT")
+            except sqlite3.Error:
+                connection.execute("ROLLBACK")
+                raise
+
+        def worker(operation, counter):
+            done = errors = i = 0
+            connection = self._connect(db_path, pragmas) if persistent else None
+            while time.monotonic() < deadline:
+                i += 1
+                conn = connection or self._connect(db_path, pragmas)
+                try:
+                    operation(conn, i)
+                    done += 1
+                except sqlite3.OperationalError:
+                    # "database is locked" after the busy timeout ran out
+                    errors += 1
+                finally:
+                    if connection is None:
+                        conn.close()
+            if connection is not None:
+                connection.close()
+            with lock:
+                counts[counter] += done
+                counts["errors"] += errors
+
+        threads = [threading.Thread(target=worker, args=(read, "reads")) for _ in range(options["readers"])]
+        threads += [threading.Thread(target=worker, args=(write, "writes")) for _ in range(options["writers"])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return counts["reads"], counts["writes"], counts["errors"]
@@ -0,0 +1,131 @@
+import re
+from datetime import timedelta
+from pathlib import PurePosixPath
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from forum.avatars import AVATAR_DIR, avatar_storage, thumbnail_names, thumbnail_version
+from forum.models import AvatarFile, Profile
+
+# A thumbnail's name: its avatar's name (without the extension), its size and the
+# thumbnail_version() it was made with, if it was made since versions were added
+THUMBNAIL_NAME = re.compile(r"^(?P<stem>.+?)_\d+(_(?P<version>[0-9a-f]{8}))?\.\w+$")
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes stored avatars, with their thumbnails, that no profile has used for the grace "
+        "period. With --sweep, also deletes files in MEDIA_ROOT/avatars/ that aren't any "
+        "profile's avatar or thumbnail, such as uploads whose transaction was rolled back and "
+        "thumbnails superseded by ones made with other encoder settings"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace",
+            type=int,
+            default=3600,
+            help="Seconds a file must have been unused before it's deleted (default: 3600)",
+        )
+        parser.add_argument("--sweep", action="store_true", help="Also delete untracked files")
+        parser.add_argument("--dry-run", action="store_true", help="Only list what would be deleted")
+
+    def handle(self, *args, **options):
+        self.dry_run = options["dry_run"]
+        self.verbosity = options["verbosity"]
+        self.cutoff = timezone.now() - timedelta(seconds=options["grace"])
+        self.deleted_files = 0
+        self.deleted_bytes = 0
+        self._listings = {}
+
+        collected = self._collect_unused()
+        swept = self._sweep() if options["sweep"] else 0
+
+        verb = "Would delete" if self.dry_run else "Deleted"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{verb} {collected} unused avatars and {swept} untracked files "
+                f"({self.deleted_files} files, {self.deleted_bytes / 1024:.0f} KB)",
+            ),
+        )
+
+    def _collect_unused(self):
+        collected = 0
+        unused = AvatarFile.objects.filter(ref_count=0, updated_at__lt=self.cutoff).order_by("pk")
+        for avatar_file in unused.iterator():
+            in_use = Profile.objects.filter(avatar=avatar_file.name).count()
+            if in_use:
+                # The count drifted (e.g. profiles changed with queryset updates); repair it
+                AvatarFile.objects.filter(pk=avatar_file.pk).update(ref_count=in_use)
+                continue
+            if not self.dry_run:
+                # An upload of the same image may have started using the file meanwhile
+                deleted, _ = AvatarFile.objects.filter(pk=avatar_file.pk, ref_count=0).delete()
+                if not deleted:
+                    continue
+            directory = str(PurePosixPath(avatar_file.name).parent)
+            thumbnails = thumbnail_names(avatar_file.name, self._listdir(directory))
+            for name in [avatar_file.name, *(f"{directory}/{thumbnail}" for thumbnail in thumbnails)]:
+                self._delete(name)
+            collected += 1
+        return collected
+
+    def _sweep(self):
+        # Everything a profile or an avatar file row refers to, by directory and stem so
+        # current thumbnails not recorded yet are kept with their avatar
+        kept_names = set(AvatarFile.objects.values_list("name", flat=True).iterator())
+        profiles = Profile.objects.exclude(avatar="").exclude(avatar__isnull=True)
+        for avatar, thumbnails in profiles.values_list("avatar", "avatar_thumbnails").iterator():
+            kept_names.add(avatar)
+            kept_names.update((thumbnails or {}).values())
+        kept_stems = {str(PurePosixPath(name).with_suffix("")) for name in kept_names}
+
+        version = thumbnail_version()
+
+        swept = 0
+        for name in self._walk(AVATAR_DIR):
+            if name in kept_names:
+                continue
+            match = THUMBNAIL_NAME.match(name)
+            # Unrecorded thumbnails made with other encoder settings were replaced by ones
+            # under a new name (see reprocess_avatars)
+            if match and match.group("stem") in kept_stems and match.group("version") == version:
+                continue
+            if self._delete(name):
+                swept += 1
+        return swept
+
+    def _listdir(self, directory):
+        if directory not in self._listings:
+            try:
+                self._listings[directory] = avatar_storage.listdir(directory)[1]
+            except FileNotFoundError:
+                self._listings[directory] = []
+        return self._listings[directory]
+
+    def _walk(self, directory):
+        try:
+            directories, files = avatar_storage.listdir(directory)
+        except FileNotFoundError:
+            return
+        for name in files:
+            yield f"{directory}/{name}"
+        for subdirectory in directories:
+            yield from self._walk(f"{directory}/{subdirectory}")
+
+    def _delete(self, name):
+        """Deletes the file unless it's missing or was used within the grace period; returns whether it did."""
+        try:
+            if avatar_storage.get_modified_time(name) >= self.cutoff:
+                return False
+            size = avatar_storage.size(name)
+        except FileNotFoundError:
+            return False
+        if self.verbosity > 1:
+            self.stdout.write(f"{'Would delete' if self.dry_run else 'Deleting'} {name}")
+        if not self.dry_run:
+            avatar_storage.delete(name)
+        self.deleted_files += 1
+        self.deleted_bytes += size
+        return True
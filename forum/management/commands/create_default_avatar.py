@@ -4,32 +4,51 @@ from django.conf import settings
 from django.core.management.base import BaseCommand
 from PIL import Image, ImageDraw
 
+from forum.avatars import DEFAULT_AVATAR, WEBP, encode_thumbnail, get_avatar_sizes
+
+# Drawn at this multiple of each size and scaled down, for smooth edges
+SUPERSAMPLING = 4
+
+# Two colours and the shades of the edge between them fit a small palette, which makes
+# the PNGs a fraction of the size
+PNG_COLORS = 16
+
+
+def draw_default_avatar(size):
+    """Returns the default avatar, a white circle on a blue background, drawn at size x size pixels."""
+    canvas = size * SUPERSAMPLING
+    img = Image.new("RGB", (canvas, canvas), color=(73, 109, 137))
+    d = ImageDraw.Draw(img)
+    d.ellipse((canvas // 4, canvas // 4, canvas * 3 // 4, canvas * 3 // 4), fill=(255, 255, 255))
+    return img.resize((size, size), Image.Resampling.LANCZOS)
+
 
 class Command(BaseCommand):
-    help = "Creates a default avatar image"
+    help = (
+        "Creates the default avatar: a 200x200 PNG, and a PNG and a WebP of it for each of "
+        "AVATAR_SIZES like the thumbnails of uploaded avatars"
+    )
 
     def handle(self, *args, **options):
         # Define the path for the default avatar
-        avatar_dir = Path(settings.BASE_DIR) / "forum" / "static" / "forum" / "images"
-        # avatar_dir = os.path.join(settings.BASE_DIR, "forum", "static", "forum", "images")
-        avatar_path = avatar_dir / "default_avatar.png"
-        # avatar_path = os.path.join(avatar_dir, "default_avatar.png")
+        avatar_path = Path(settings.BASE_DIR) / "forum" / "static" / DEFAULT_AVATAR
+        avatar_dir = avatar_path.parent
 
         # Create directory if it doesn't exist
         Path(avatar_dir).mkdir(parents=True, exist_ok=True)
-        # os.makedirs(avatar_dir, exist_ok=True)
-
-        # Create a 200x200 image with a blue background
-        size = (200, 200)
-        img: Image = Image.new("RGB", size, color=(73, 109, 137))
-
-        # Get a drawing context
-        d = ImageDraw.Draw(img)
-
-        # Draw a simple avatar (a circle)
-        d.ellipse((50, 50, 150, 150), fill=(255, 255, 255))
-
-        # Save the image
-        img.save(avatar_path)
 
-        self.stdout.write(self.style.SUCCESS(f"Successfully created default avatar at {avatar_path}"))
+        paths = [avatar_path.with_name(f"{avatar_path.name}.png")]
+        paths[0].write_bytes(encode_thumbnail(draw_default_avatar(200).quantize(PNG_COLORS), "PNG"))
+        for size in get_avatar_sizes():
+            img = draw_default_avatar(size)
+            for image_format, extension, variant in (("PNG", "png", img.quantize(PNG_COLORS)), ("WEBP", WEBP, img)):
+                path = avatar_path.with_name(f"{avatar_path.name}_{size}.{extension}")
+                path.write_bytes(encode_thumbnail(variant, image_format))
+                paths.append(path)
+
+        total = sum(path.stat().st_size for path in paths)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Successfully created {len(paths)} default avatar images ({total} bytes) in {avatar_dir}",
+            ),
+        )
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from forum.models import Profile
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the denormalized topic_count, post_count and last_post_at columns of every profile"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Number of profiles to update per transaction (default: 1000)",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+
+        updated = 0
+        last_pk = 0
+        while True:
+            # Walk the profiles by primary key so each chunk is an indexed range scan
+            chunk_pks = list(
+                Profile.objects.filter(pk__gt=last_pk)
+                .order_by("pk")
+                .values_list("pk", flat=True)[:chunk_size],
+            )
+            if not chunk_pks:
+                break
+
+            with transaction.atomic():
+                updated += Profile.objects.filter(pk__gte=chunk_pks[0], pk__lte=chunk_pks[-1]).refresh_stats()
+            last_pk = chunk_pks[-1]
+
+        self.stdout.write(self.style.SUCCESS(f"Successfully rebuilt activity statistics for {updated} profiles"))
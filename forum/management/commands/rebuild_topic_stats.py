@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Now
+
+from forum.models import Post, Topic
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the denormalized post_count, last_post_at and last_post_by columns of every topic"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Number of topics to update per transaction (default: 1000)",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+
+        # Correlated subqueries computing the statistics of the outer topic
+        topic_posts = Post.objects.filter(topic=OuterRef("pk")).order_by()
+        post_count = topic_posts.values("topic").annotate(count=Count("pk")).values("count")
+        latest_posts = topic_posts.order_by("-created_at", "-pk")
+
+        updated = 0
+        last_pk = 0
+        while True:
+            # Walk the topics by primary key so each chunk is an indexed range scan
+            chunk_pks = list(
+                Topic.objects.filter(pk__gt=last_pk)
+                .order_by("pk")
+                .values_list("pk", flat=True)[:chunk_size],
+            )
+            if not chunk_pks:
+                break
+
+            with transaction.atomic():
+                updated += Topic.objects.filter(pk__gte=chunk_pks[0], pk__lte=chunk_pks[-1]).update(
+                    post_count=Coalesce(Subquery(post_count), Value(0), output_field=IntegerField()),
+                    last_post_at=Subquery(latest_posts.values("created_at")[:1]),
+                    last_post_by=Subquery(latest_posts.values("created_by")[:1]),
+                    updated_at=Now(),
+                )
+            last_pk = chunk_pks[-1]
+
+        self.stdout.write(self.style.SUCCESS(f"Successfully rebuilt post statistics for {updated} topics"))
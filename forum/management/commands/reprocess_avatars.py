@@ -0,0 +1,171 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from forum.avatars import InvalidAvatar, has_current_thumbnails, make_thumbnails
+from forum.models import Profile
+from forum.page_cache import invalidate
+
+
+class Command(BaseCommand):
+    help = (
+        "Remakes the thumbnails of stored avatars in a pool of worker processes, after "
+        "changing AVATAR_SIZES or THUMBNAIL_SAVE_OPTIONS. Only profiles missing some of the "
+        "current thumbnails, or with thumbnails made with other encoder settings, are "
+        "processed, reusing the current thumbnails already stored"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of worker processes (default: one per CPU)",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=200,
+            help="Number of profiles to process and update per batch (default: 200)",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            help="File to record progress in after each batch and to resume from if it exists; removed when done",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Only list the avatars that would be processed")
+
+    def handle(self, *args, **options):
+        if options["workers"] < 1 or options["chunk_size"] < 1:
+            msg = "--workers and --chunk-size must be at least 1"
+            raise CommandError(msg)
+        self.dry_run = options["dry_run"]
+        self.verbosity = options["verbosity"]
+        self.checkpoint = Path(options["checkpoint"]) if options["checkpoint"] else None
+        self.avatars = self.profiles = self.failed = 0
+
+        last_pk = self._read_checkpoint()
+        if last_pk:
+            self.stdout.write(f"Resuming after profile {last_pk}")
+        chunks = self._chunks(last_pk, options["chunk_size"])
+
+        if self.dry_run:
+            for _, chunk in chunks:
+                names = {avatar_name for _, avatar_name in chunk}
+                if self.verbosity > 1:
+                    for name in sorted(names):
+                        self.stdout.write(f"Would process {name}")
+                self.avatars += len(names)
+                self.profiles += len(chunk)
+            self.stdout.write(
+                self.style.SUCCESS(f"Would process {self.avatars} avatars of {self.profiles} profiles"),
+            )
+            return
+
+        # Workers started without a copy of this process (spawn, forkserver) set Django up
+        # themselves. Each only reads and writes files; the updates are made here.
+        with ProcessPoolExecutor(options["workers"], initializer=django.setup) as executor:
+            # The next batch is queued before waiting for the current one, so workers
+            # finishing early move on to it instead of idling until the batch is done
+            batches = deque()
+            for last_scanned_pk, chunk in chunks:
+                batches.append((last_scanned_pk, chunk, self._submit(executor, chunk)))
+                if len(batches) > 1:
+                    self._finish(*batches.popleft())
+            while batches:
+                self._finish(*batches.popleft())
+
+        if self.checkpoint:
+            self.checkpoint.unlink(missing_ok=True)
+        style = self.style.WARNING if self.failed else self.style.SUCCESS
+        self.stdout.write(
+            style(f"Processed {self.avatars} avatars of {self.profiles} profiles ({self.failed} avatars failed)"),
+        )
+
+    def _read_checkpoint(self):
+        if not self.checkpoint or not self.checkpoint.exists():
+            return 0
+        try:
+            return int(self.checkpoint.read_text())
+        except ValueError as e:
+            msg = f"Invalid checkpoint file {self.checkpoint}"
+            raise CommandError(msg) from e
+
+    def _chunks(self, last_pk, chunk_size):
+        """
+        Yields the profiles to process a chunk at a time, as (last scanned primary key,
+        [(profile pk, avatar name), ...]); the list can be empty.
+        """
+        profiles = (
+            Profile.objects.exclude(avatar="")
+            .exclude(avatar__isnull=True)
+            .order_by("pk")
+            .values_list("pk", "avatar", "avatar_thumbnails")
+        )
+        while True:
+            # Walk the profiles by primary key so only a chunk or two is in memory at a time
+            rows = list(profiles.filter(pk__gt=last_pk)[:chunk_size])
+            if not rows:
+                return
+            last_pk = rows[-1][0]
+            yield last_pk, [
+                (pk, avatar_name)
+                for pk, avatar_name, thumbnails in rows
+                if not has_current_thumbnails(thumbnails)
+            ]
+
+    def _submit(self, executor, chunk):
+        """Queues each distinct avatar of the chunk; returns the futures by avatar name."""
+        names = dict.fromkeys(avatar_name for _, avatar_name in chunk)
+        return {name: executor.submit(make_thumbnails, name) for name in names}
+
+    def _finish(self, last_scanned_pk, chunk, futures):
+        """Waits for the chunk's avatars, records their thumbnails and moves the checkpoint past the chunk."""
+        thumbnails = {}
+        for name, future in futures.items():
+            try:
+                thumbnails[name] = future.result()
+            except (OSError, ValueError, InvalidAvatar, Image.DecompressionBombError) as e:
+                # A crashed worker (BrokenProcessPool) stops the command instead; rerunning
+                # it with the checkpoint picks up from the last finished chunk
+                self.failed += 1
+                profile_pks = ", ".join(str(pk) for pk, avatar_name in chunk if avatar_name == name)
+                self.stderr.write(f"Failed to process {name} (profiles {profile_pks}): {e}")
+
+        updated = self._update(chunk, thumbnails)
+        self.avatars += len(thumbnails)
+        self.profiles += updated
+        if self.verbosity > 1:
+            self.stdout.write(f"Processed profiles up to {last_scanned_pk} ({updated} updated)")
+        if self.checkpoint:
+            self.checkpoint.write_text(str(last_scanned_pk))
+
+    @staticmethod
+    def _update(chunk, thumbnails):
+        """Records the thumbnails on the chunk's profiles that still have the same avatar; returns how many."""
+        avatar_names = {pk: avatar_name for pk, avatar_name in chunk if avatar_name in thumbnails}
+        if not avatar_names:
+            return 0
+        now = timezone.now()
+        with transaction.atomic():
+            # Profiles whose avatar was replaced meanwhile get their new avatar's thumbnails
+            # from the upload's own job
+            profiles = [
+                profile
+                for profile in Profile.objects.select_for_update().filter(pk__in=avatar_names).only("pk", "avatar")
+                if profile.avatar.name == avatar_names[profile.pk]
+            ]
+            for profile in profiles:
+                profile.avatar_thumbnails = thumbnails[profile.avatar.name]
+                profile.updated_at = now
+            Profile.objects.bulk_update(profiles, ["avatar_thumbnails", "updated_at"])
+        if profiles:
+            # Bumping updated_at expires the fragments showing the avatars
+            invalidate("profiles")
+        return len(profiles)
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+
+from forum.models import Post
+from forum.rendering import current_renderer_version, render_message
+
+
+class Command(BaseCommand):
+    help = "Re-renders the stored HTML of posts rendered by an outdated (or no) renderer version"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=500,
+            help="Number of posts to render and update per batch (default: 500)",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Re-render every post, not just outdated ones",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        renderer_version = current_renderer_version()
+
+        posts = Post.objects.only("pk", "message").order_by("pk")
+        if not options["all"]:
+            posts = posts.exclude(renderer_version=renderer_version)
+
+        updated = 0
+        last_pk = 0
+        while True:
+            # Walk the posts by primary key so only one chunk is in memory at a time
+            chunk = list(posts.filter(pk__gt=last_pk)[:chunk_size])
+            if not chunk:
+                break
+
+            for post in chunk:
+                post.message_html, post.renderer_version = render_message(post.message)
+            Post.objects.bulk_update(chunk, ["message_html", "renderer_version"])
+
+            updated += len(chunk)
+            last_pk = chunk[-1].pk
+
+        self.stdout.write(self.style.SUCCESS(f"Successfully re-rendered {updated} posts with {renderer_version}"))
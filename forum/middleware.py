@@ -1,23 +1,144 @@
 # forum/middleware.py
 
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib import auth
 from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+
+from .identity_map import remember, request_identity_map
+from .last_seen import last_seen_buffer
+from .read_tracking import read_marker_buffer
+
+
+def _remember_user(user):
+    return remember(user) if user.is_authenticated else user
+
+
+class IdentityMapMiddleware:
+    """
+    Middleware giving each request its own identity map (see forum/identity_map.py), so
+    a user or profile is loaded at most once per request and nothing loaded is kept
+    past it.
+
+    It has to come after AuthenticationMiddleware: request.user and request.auser() are
+    still loaded by the authentication backends, lazily, and the user they load is
+    recorded in the map, so views and template tags looking up the same user or their
+    profile get them without a query.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with request_identity_map():
+            self.remember_request_user(request)
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with request_identity_map():
+            self.remember_request_user(request)
+            return await self.get_response(request)
+
+    @staticmethod
+    def remember_request_user(request):
+        auser = request.auser
+
+        async def remembering_auser():
+            return _remember_user(await auser())
+
+        request.user = SimpleLazyObject(lambda: _remember_user(auth.get_user(request)))
+        request.auser = remembering_auser
 
 
 class LastSeenMiddleware:
-    """Middleware to update the 'last_seen' field in the user's profile whenever they make a request to the site."""
+    """
+    Middleware to track when users were last seen on the site.
+
+    Instead of writing the user's profile on every request, the time is recorded in an
+    in-process buffer (at most once per LAST_SEEN_UPDATE_INTERVAL per user) and pending
+    times are written to Profile.last_seen in bulk every LAST_SEEN_FLUSH_INTERVAL.
+
+    It works in both sync and async middleware chains, so under ASGI async views don't
+    have to be switched to a thread for it.
+    """
+
+    sync_capable = True
+    async_capable = True
 
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
         # Process the request
         response = self.get_response(request)
 
-        # Update last_seen for authenticated users
-        if request.user.is_authenticated and hasattr(request.user, "profile"):
-            # Update the last_seen field with the current time
-            # Only update if the user has a profile
-            request.user.profile.last_seen = timezone.now()
-            request.user.profile.save(update_fields=["last_seen"])
+        # Static and media files served by Django don't count as activity
+        if request.path.startswith((settings.STATIC_URL, settings.MEDIA_URL)):
+            return response
+
+        # Record last_seen for authenticated users without loading their profile
+        if request.user.is_authenticated:
+            last_seen_buffer.touch(request.user.pk, timezone.now())
+
+        # Write the buffered times to the database if the flush interval has passed
+        last_seen_buffer.flush_if_due()
+
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+
+        if request.path.startswith((settings.STATIC_URL, settings.MEDIA_URL)):
+            return response
+
+        user = await request.auser()
+        if user.is_authenticated:
+            last_seen_buffer.touch(user.pk, timezone.now())
+
+        await sync_to_async(last_seen_buffer.flush_if_due)()
+
+        return response
+
+
+class ReadMarkerMiddleware:
+    """
+    Middleware writing the buffered read markers (see forum/read_tracking.py) once the
+    response is ready, when a flush is due.
+
+    The topic pages advance the markers but don't write them, so a flush never counts
+    against a page's query budget and never slows down the page that happened to be
+    viewed when it was due.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        read_marker_buffer.flush_if_due()
+        return response
 
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        await sync_to_async(read_marker_buffer.flush_if_due)()
         return response
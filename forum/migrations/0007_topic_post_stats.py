@@ -0,0 +1,50 @@
+# Generated by Django 5.2.1 on 2026-10-18 00:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_topic_post_stats(apps, schema_editor):
+    """Populate the new statistics columns from the existing posts."""
+    Post = apps.get_model('forum', 'Post')
+    Topic = apps.get_model('forum', 'Topic')
+
+    topic_posts = Post.objects.filter(topic=OuterRef('pk')).order_by()
+    post_count = topic_posts.values('topic').annotate(count=Count('pk')).values('count')
+    latest_posts = topic_posts.order_by('-created_at', '-pk')
+
+    Topic.objects.update(
+        post_count=Coalesce(Subquery(post_count), Value(0), output_field=IntegerField()),
+        last_post_at=Subquery(latest_posts.values('created_at')[:1]),
+        last_post_by=Subquery(latest_posts.values('created_by')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0006_topic_category_alter_profile_avatar'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='topic',
+            name='last_post_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='topic',
+            name='last_post_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='topic',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_topic_post_stats, migrations.RunPython.noop),
+    ]
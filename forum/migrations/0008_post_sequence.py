@@ -0,0 +1,64 @@
+# Generated by Django 5.2.1 on 2026-10-18 00:44
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, IntegerField, Max, OuterRef, Subquery, Value, Window
+from django.db.models.functions import Coalesce, RowNumber
+
+BATCH_SIZE = 1000
+
+
+def backfill_post_sequences(apps, schema_editor):
+    """Number the existing posts of every topic in creation order."""
+    Post = apps.get_model('forum', 'Post')
+    Topic = apps.get_model('forum', 'Topic')
+
+    numbered_posts = Post.objects.annotate(
+        position=Window(
+            RowNumber(),
+            partition_by=[F('topic')],
+            order_by=[F('created_at').asc(), F('pk').asc()],
+        ),
+    ).only('pk')
+
+    batch = []
+    for post in numbered_posts.iterator(chunk_size=BATCH_SIZE):
+        post.sequence = post.position
+        batch.append(post)
+        if len(batch) >= BATCH_SIZE:
+            Post.objects.bulk_update(batch, ['sequence'])
+            batch = []
+    Post.objects.bulk_update(batch, ['sequence'])
+
+    highest_sequence = (
+        Post.objects.filter(topic=OuterRef('pk')).order_by().values('topic').annotate(seq=Max('sequence')).values('seq')
+    )
+    Topic.objects.update(
+        post_sequence=Coalesce(Subquery(highest_sequence), Value(0), output_field=IntegerField()),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0007_topic_post_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='sequence',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='topic',
+            name='post_sequence',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_post_sequences, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='post',
+            constraint=models.UniqueConstraint(fields=('topic', 'sequence'), name='unique_post_sequence_per_topic'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.1 on 2026-10-18 00:48
+
+import bleach
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def backfill_signature_html(apps, schema_editor):
+    """Sanitize the existing signatures once so they can be rendered as-is."""
+    Profile = apps.get_model('forum', 'Profile')
+
+    cleaner = bleach.sanitizer.Cleaner(
+        tags={'a', 'abbr', 'acronym', 'b', 'blockquote', 'code', 'em', 'i', 'li', 'ol', 'strong', 'ul', 'p', 'br'},
+        attributes={'a': ['href', 'title'], 'abbr': ['title'], 'acronym': ['title']},
+        strip=True,
+    )
+
+    batch = []
+    for profile in Profile.objects.exclude(signature='').only('pk', 'signature').iterator(chunk_size=BATCH_SIZE):
+        profile.signature_html = cleaner.clean(profile.signature)
+        batch.append(profile)
+        if len(batch) >= BATCH_SIZE:
+            Profile.objects.bulk_update(batch, ['signature_html'])
+            batch = []
+    Profile.objects.bulk_update(batch, ['signature_html'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0008_post_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='signature_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(backfill_signature_html, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.1 on 2026-10-18 02:03
+
+import forum.avatars
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_avatar_files(apps, schema_editor):
+    """Count the profiles using each avatar stored so far."""
+    AvatarFile = apps.get_model('forum', 'AvatarFile')
+    Profile = apps.get_model('forum', 'Profile')
+
+    counts = (
+        Profile.objects.exclude(avatar='').exclude(avatar__isnull=True)
+        .values('avatar').annotate(count=Count('pk')).order_by()
+    )
+    AvatarFile.objects.bulk_create(
+        [AvatarFile(name=row['avatar'], ref_count=row['count']) for row in counts.iterator()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0015_profile_avatar_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='profile',
+            name='avatar',
+            field=models.ImageField(blank=True, help_text='Upload your avatar image', null=True, storage=forum.avatars.ContentAddressedStorage(), upload_to=forum.avatars.avatar_upload_to),
+        ),
+        migrations.CreateModel(
+            name='AvatarFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('ref_count', 0)), fields=['updated_at'], name='avatar_file_unused_idx')],
+            },
+        ),
+        migrations.RunPython(count_avatar_files, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.1 on 2026-10-18 02:22
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_profile_stats(apps, schema_editor):
+    """Populate the new statistics columns from the existing topics and posts."""
+    Post = apps.get_model('forum', 'Post')
+    Profile = apps.get_model('forum', 'Profile')
+    Topic = apps.get_model('forum', 'Topic')
+
+    topics = Topic.objects.filter(created_by=OuterRef('user')).order_by()
+    topic_count = topics.values('created_by').annotate(count=Count('pk')).values('count')
+    posts = Post.objects.filter(created_by=OuterRef('user')).order_by()
+    post_count = posts.values('created_by').annotate(count=Count('pk')).values('count')
+
+    Profile.objects.update(
+        topic_count=Coalesce(Subquery(topic_count), Value(0), output_field=IntegerField()),
+        post_count=Coalesce(Subquery(post_count), Value(0), output_field=IntegerField()),
+        last_post_at=Subquery(posts.order_by('-created_at', '-pk').values('created_at')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0016_avatar_files'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='last_post_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='topic_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_profile_stats, migrations.RunPython.noop),
+    ]
@@ -1,14 +1,92 @@
 # forum/models.py
 
+import threading
 from typing import ClassVar
 
 import bleach
 import pytz  # Import pytz for timezone handling
 from django.contrib.auth.models import User  # Import Django's built-in User model
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.templatetags.static import static
+from django.urls import reverse
 
 from categories.models import Category
 
+from .avatars import DEFAULT_AVATAR, avatar_storage, avatar_upload_to, get_avatar_sizes, thumbnail_key
+from .last_seen import last_seen_buffer
+from .rendering import current_renderer_version, render_message
+
+# Number of posts shown per page of a topic
+POSTS_PER_PAGE = 20
+
+
+def get_sequence_page_number(sequence):
+    """Returns the number of the topic page showing the post with the sequence number."""
+    return (sequence - 1) // POSTS_PER_PAGE + 1
+
+
+# HTML allowed in user signatures
+SIGNATURE_ALLOWED_TAGS = frozenset(
+    {
+        "a",
+        "abbr",
+        "acronym",
+        "b",
+        "blockquote",
+        "code",
+        "em",
+        "i",
+        "li",
+        "ol",
+        "strong",
+        "ul",
+        "p",
+        "br",
+    },
+)
+SIGNATURE_ALLOWED_ATTRIBUTES = {  # noqa: RUF012
+    "a": ["href", "title"],
+    "abbr": ["title"],
+    "acronym": ["title"],
+}
+
+# bleach Cleaners are reusable but not thread-safe, so keep one per thread
+_signature_cleaners = threading.local()
+
+
+def sanitize_signature(signature):
+    """Returns the signature with HTML sanitized to prevent XSS attacks."""
+    cleaner = getattr(_signature_cleaners, "cleaner", None)
+    if cleaner is None:
+        cleaner = bleach.sanitizer.Cleaner(
+            tags=SIGNATURE_ALLOWED_TAGS,
+            attributes=SIGNATURE_ALLOWED_ATTRIBUTES,
+            strip=True,
+        )
+        _signature_cleaners.cleaner = cleaner
+    return cleaner.clean(signature)
+
+
+class ProfileQuerySet(models.QuerySet):
+    def refresh_stats(self):
+        """
+        Recalculates the denormalized activity statistics of the profiles in this queryset
+        from the users' topics and posts in a single UPDATE and returns the number of
+        profiles updated.
+        """
+        topics = Topic.objects.filter(created_by=OuterRef("user")).order_by()
+        topic_count = topics.values("created_by").annotate(count=Count("pk")).values("count")
+        posts = Post.objects.filter(created_by=OuterRef("user")).order_by()
+        post_count = posts.values("created_by").annotate(count=Count("pk")).values("count")
+
+        return self.update(
+            topic_count=Coalesce(Subquery(topic_count), Value(0), output_field=IntegerField()),
+            post_count=Coalesce(Subquery(post_count), Value(0), output_field=IntegerField()),
+            last_post_at=Subquery(posts.order_by("-created_at", "-pk").values("created_at")[:1]),
+        )
+
 
 # Profile model for extended user information
 class Profile(models.Model):
@@ -16,12 +94,17 @@ class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="profile")
 
     # Personal information fields
+    # Stored under the hash of its content (see forum/avatars.py)
     avatar = models.ImageField(
-        upload_to="avatars/",
+        upload_to=avatar_upload_to,
+        storage=avatar_storage,
         blank=True,
         null=True,
         help_text="Upload your avatar image",
     )
+    # Storage names of the avatar's thumbnails by size (see forum/avatars.py), filled in
+    # by a background job after the avatar is uploaded
+    avatar_thumbnails = models.JSONField(default=dict, blank=True, editable=False)
     bio = models.TextField(blank=True)
     location = models.CharField(max_length=100, blank=True)
     birth_date = models.DateField(null=True, blank=True)
@@ -29,6 +112,9 @@ class Profile(models.Model):
 
     # Forum-specific fields
     signature = models.TextField(blank=True)
+    # Sanitized HTML of the signature, computed in save() so rendering a post
+    # doesn't have to run bleach every time
+    signature_html = models.TextField(blank=True, editable=False)
     user_title = models.CharField(max_length=100, blank=True)
 
     # Contact/social media fields
@@ -59,53 +145,180 @@ class Profile(models.Model):
     # Activity tracking
     last_seen = models.DateTimeField(null=True, blank=True)
 
+    # Denormalized activity statistics so the profile page doesn't have to COUNT(*) the
+    # user's topics and posts. These are kept current by the Topic and Post signal
+    # handlers in forum/signals.py and can be rebuilt from scratch with the
+    # 'rebuild_profile_stats' management command.
+    topic_count = models.PositiveIntegerField(default=0, editable=False)
+    post_count = models.PositiveIntegerField(default=0, editable=False)
+    last_post_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    # Changes whenever the profile is saved; part of the fragment cache keys of the user's
+    # topic rows and posts (see forum/fragment_cache.py)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ProfileQuerySet.as_manager()
+
+    # Fields shown next to the user's topics and posts; changing one expires the page cache
+    PAGE_CACHE_FIELDS = ("avatar", "user_title", "signature_html")
+    # Fields only ever changed with UPDATEs of their own (see above)
+    STATS_FIELDS = ("topic_count", "post_count", "last_post_at")
+
     def __str__(self):
         return f"{self.user.username}'s profile"
 
-    def get_avatar_url(self):
-        """Returns the URL of the user's avatar or a default avatar if none is set."""
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored values so the post_save handler can tell they were changed
+        instance._loaded_page_cache_fields = instance.get_page_cache_fields()
+        return instance
+
+    def get_page_cache_fields(self):
+        """Returns the current values of PAGE_CACHE_FIELDS (deferred fields count as empty)."""
+        return tuple(str(self.__dict__.get(field) or "") for field in self.PAGE_CACHE_FIELDS)
+
+    def get_avatar_thumbnail_urls(self, extension=None):
+        """
+        Returns the URLs of the avatar's thumbnails by size, smallest first: the WebP ones
+        with extension "webp", the JPEG or PNG ones without. Empty while the thumbnails
+        are being made. Users without an avatar get the default avatar's variants (made by
+        the create_default_avatar command).
+        """
+        if not self.avatar:
+            return {size: static(f"{DEFAULT_AVATAR}_{size}.{extension or 'png'}") for size in get_avatar_sizes()}
+        urls = {}
+        for size in get_avatar_sizes():
+            name = self.avatar_thumbnails.get(thumbnail_key(size, extension))
+            if name:
+                urls[size] = self.avatar.storage.url(name)
+        return urls
+
+    def get_avatar_url(self, size=None):
+        """
+        Returns the URL of the user's avatar or a default avatar if none is set. With a
+        size, the URL of the smallest thumbnail at least that large; the original is
+        returned while the thumbnails are being made.
+        """
+        if size is not None:
+            urls = self.get_avatar_thumbnail_urls()
+            if urls:
+                return next((url for s, url in urls.items() if s >= int(size)), urls[max(urls)])
         if self.avatar and hasattr(self.avatar, "url"):
             return self.avatar.url
         # Return a default avatar URL
-        return "/static/forum/images/default_avatar.png"
+        return static(f"{DEFAULT_AVATAR}.png")
+
+    def get_avatar_srcset(self, extension=None):
+        """Returns a srcset listing the avatar's thumbnails (see get_avatar_thumbnail_urls) by width."""
+        return ", ".join(f"{url} {size}w" for size, url in self.get_avatar_thumbnail_urls(extension).items())
+
+    def get_last_seen(self):
+        """Returns when the user was last seen, including activity not yet written to the database."""
+        pending = last_seen_buffer.get(self.user_id)
+        if pending is not None and (self.last_seen is None or pending > self.last_seen):
+            return pending
+        return self.last_seen
+
+    def save(self, *args, **kwargs):
+        # Re-sanitize the signature whenever it is being saved
+        update_fields = kwargs.get("update_fields")
+        saving_signature = update_fields is None or "signature" in update_fields
+        if saving_signature and "signature" not in self.get_deferred_fields():
+            self.signature_html = sanitize_signature(self.signature) if self.signature else ""
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "signature_html"}
+        # A new avatar starts without thumbnails; the post_save handler queues making them
+        # and moves the reference from the old avatar's file to the new one's
+        saving_avatar = update_fields is None or "avatar" in update_fields
+        if saving_avatar and "avatar" not in self.get_deferred_fields() and self.avatar_changed():
+            self._replaced_avatar = self._loaded_avatar()
+            self.avatar_thumbnails = {}
+            if update_fields is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "avatar_thumbnails"}
+        super().save(*args, **kwargs)
+        # The post_save handlers have seen the changes by now; these are the stored values
+        self._loaded_page_cache_fields = self.get_page_cache_fields()
+
+    def save_without_stats(self):
+        """
+        Saves the profile's loaded fields except STATS_FIELDS, so a profile loaded before
+        the user's latest topic or post doesn't write back its stale counters.
+        """
+        deferred = self.get_deferred_fields()
+        self.save(
+            update_fields=[
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.STATS_FIELDS and field.attname not in deferred
+            ],
+        )
+
+    def _loaded_avatar(self):
+        loaded = getattr(self, "_loaded_page_cache_fields", None)
+        return loaded[0] if loaded is not None else ""
+
+    def avatar_changed(self):
+        """Returns whether the avatar is a new upload or was changed since it was loaded."""
+        if self.avatar and not self.avatar._committed:  # noqa: SLF001
+            return True
+        return str(self.avatar or "") != self._loaded_avatar()
 
     def get_sanitized_signature(self):
         """Returns the user's signature with HTML sanitized to prevent XSS attacks."""
-        if not self.signature:
-            return ""
-
-        # Define allowed tags and attributes
-        allowed_tags = [
-            "a",
-            "abbr",
-            "acronym",
-            "b",
-            "blockquote",
-            "code",
-            "em",
-            "i",
-            "li",
-            "ol",
-            "strong",
-            "ul",
-            "p",
-            "br",
-        ]
-        allowed_attrs = {
-            "a": ["href", "title"],
-            "abbr": ["title"],
-            "acronym": ["title"],
-        }
-
-        # Clean the signature using bleach
-        clean_signature = bleach.clean(
-            self.signature,
-            tags=allowed_tags,
-            attributes=allowed_attrs,
-            strip=True,
+        return self.signature_html
+
+
+# Profile columns that can be large and aren't shown next to topics or posts
+LISTING_DEFERRED_PROFILE_FIELDS = ("bio", "signature", "signature_html")
+
+
+class TopicQuerySet(models.QuerySet):
+    def for_listing(self):
+        """
+        Topics with everything a listing row renders (author, author profile and category)
+        fetched in the same query, leaving out heavy profile columns the row doesn't use.
+        """
+        return self.select_related("created_by__profile", "category").defer(
+            *(f"created_by__profile__{field}" for field in LISTING_DEFERRED_PROFILE_FIELDS),
         )
 
-        return clean_signature
+    def most_viewed(self):
+        """Topics ordered by view count, most viewed first (newest first among equals)."""
+        return self.order_by("-view_count", "-created_at")
+
+    def with_read_state(self, user):
+        """
+        Topics annotated with how far 'user' has read them: 'last_read_sequence' (None if
+        they've never opened the topic) and 'category_read_at' (when they last marked the
+        topic's category as read, or None). Both come from correlated subqueries on unique
+        indexes, so flagging a whole listing page costs no extra query. See
+        forum/read_tracking.py for turning them into unread flags.
+        """
+        if not user.is_authenticated:
+            return self
+        markers = TopicReadMarker.objects.filter(user=user, topic=OuterRef("pk"))
+        watermarks = CategoryReadMarker.objects.filter(user=user, category=OuterRef("category"))
+        return self.annotate(
+            last_read_sequence=Subquery(markers.values("last_read_sequence")[:1]),
+            category_read_at=Subquery(watermarks.values("marked_at")[:1]),
+        )
+
+
+class PostQuerySet(models.QuerySet):
+    def for_listing(self):
+        """Posts with their topic fetched in the same query, for lists of a user's posts."""
+        return self.select_related("topic")
+
+    def for_thread(self):
+        """
+        Posts with their author and author profile fetched in the same query, for rendering
+        a thread. Only the sanitized signature is kept since it's shown below every post.
+        """
+        return self.select_related("created_by__profile").defer(
+            "created_by__profile__bio",
+            "created_by__profile__signature",
+        )
 
 
 # Create your models here.
@@ -127,12 +340,80 @@ class Topic(models.Model):
         blank=False,
     )
 
-    # We might add a 'last_updated' field later if needed
+    # Denormalized reply statistics so listings don't have to COUNT(*) the posts table.
+    # These are kept current by the Post signal handlers in forum/signals.py and can be
+    # rebuilt from scratch with the 'rebuild_topic_stats' management command.
+    post_count = models.PositiveIntegerField(default=0)
+    last_post_at = models.DateTimeField(null=True, blank=True)
+    last_post_by = models.ForeignKey(
+        User,
+        related_name="+",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+    # Highest Post.sequence handed out in this topic. Unlike post_count it never goes
+    # down, so sequence numbers of deleted posts are never reused.
+    post_sequence = models.PositiveIntegerField(default=0)
+    # Number of times the topic was viewed. Views are buffered in memory and added in bulk
+    # (see forum/view_counts.py), so this lags behind by up to VIEW_COUNT_FLUSH_INTERVAL.
+    view_count = models.PositiveIntegerField(default=0)
+    # Changes whenever anything shown in the topic's listing row changes, including the
+    # statistics above; part of the row's fragment cache key (see forum/fragment_cache.py)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = TopicQuerySet.as_manager()
+
+    class Meta:
+        # Indexes matching the listings' filters and their newest-first ordering, so they
+        # are read in index order instead of being sorted in a temporary B-tree. SQLite
+        # appends the rowid to every index, which also covers the pk tie-breaker of keyset
+        # pagination. A boolean filter compiles to a bare "is_sticky"/"NOT is_sticky" term
+        # that SQLite can't match against an indexed column, so the sticky split is made
+        # with partial indexes instead.
+        indexes = [  # noqa: RUF012
+            # forum_index: sticky and regular topics
+            models.Index(fields=["created_at"], condition=Q(is_sticky=True), name="topic_sticky_created_idx"),
+            models.Index(fields=["created_at"], condition=Q(is_sticky=False), name="topic_regular_created_idx"),
+            # topics_by_category: sticky and regular topics of a category
+            models.Index(
+                fields=["category", "created_at"],
+                condition=Q(is_sticky=True),
+                name="topic_cat_sticky_created_idx",
+            ),
+            models.Index(
+                fields=["category", "created_at"],
+                condition=Q(is_sticky=False),
+                name="topic_cat_regular_created_idx",
+            ),
+            # forum_index?sort=views: most viewed regular topics
+            models.Index(
+                fields=["-view_count", "-created_at"],
+                condition=Q(is_sticky=False),
+                name="topic_regular_views_idx",
+            ),
+            # user_profile: topics started by a user
+            models.Index(fields=["created_by", "created_at"], name="topic_author_created_idx"),
+            # Category statistics: the category's most recently active topic
+            models.Index(fields=["category", "last_post_at"], name="topic_cat_last_post_idx"),
+        ]
 
     # This helps represent the object nicely, e.g., in the admin area
     def __str__(self):
         return self.subject
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored category so the post_save handler can tell the topic was moved
+        instance._loaded_category_id = instance.__dict__.get("category_id")
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # The post_save handlers have seen the move by now; this is the stored category
+        self._loaded_category_id = self.category_id
+
 
 # Model for a post/reply within a topic
 class Post(models.Model):
@@ -148,10 +429,126 @@ class Post(models.Model):
         null=True,
         blank=True,
     )  # Field to store last update time
+    # 1-based position of the post within its topic, assigned when the post is created.
+    # Pages of a topic are windows of sequence numbers, so the page holding a post can be
+    # worked out from the post alone without counting the posts before it.
+    sequence = models.PositiveIntegerField(default=0, editable=False)
+    # The message rendered to sanitized HTML when the post is saved, and the renderer
+    # (name and version, see forum/rendering.py) that produced it
+    message_html = models.TextField(blank=True, editable=False)
+    renderer_version = models.CharField(max_length=32, blank=True, editable=False)
+
+    objects = PostQuerySet.as_manager()
 
     # We could add 'updated_at' and 'updated_by' if we implement editing
 
+    class Meta:
+        constraints = [  # noqa: RUF012
+            models.UniqueConstraint(fields=["topic", "sequence"], name="unique_post_sequence_per_topic"),
+        ]
+        # See Topic.Meta.indexes. topic_detail itself reads posts through the
+        # (topic, sequence) index of the unique constraint.
+        indexes = [  # noqa: RUF012
+            # Topic statistics: the topic's latest post
+            models.Index(fields=["topic", "created_at"], name="post_topic_created_idx"),
+            # user_profile: posts written by a user
+            models.Index(fields=["created_by", "created_at"], name="post_author_created_idx"),
+        ]
+
     # This provides a readable representation of the Post object
     def __str__(self):
         # Show first 50 characters of the message
         return self.message[:50] + ("..." if len(self.message) > 50 else "")
+
+    def save(self, *args, **kwargs):
+        # Render the message once here so displaying the post doesn't have to
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "message" in update_fields:
+            self.message_html, self.renderer_version = render_message(self.message)
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "message_html", "renderer_version"}
+
+        if self._state.adding and not self.sequence:
+            # Reserve the next sequence number of the topic. The UPDATE locks the topic row
+            # until the transaction commits, so concurrent replies can't get the same number.
+            with transaction.atomic():
+                Topic.objects.filter(pk=self.topic_id).update(post_sequence=F("post_sequence") + 1)
+                self.sequence = Topic.objects.values_list("post_sequence", flat=True).get(pk=self.topic_id)
+                super().save(*args, **kwargs)
+            return
+        super().save(*args, **kwargs)
+
+    def get_message_html(self):
+        """
+        Returns the message as sanitized HTML. Posts rendered by an outdated renderer are
+        rendered again on the fly until the 'rerender_posts' command has updated them.
+        """
+        if self.renderer_version == current_renderer_version():
+            return self.message_html
+        return render_message(self.message)[0]
+
+    def get_page_number(self):
+        """Returns the number of the topic page this post is shown on."""
+        return get_sequence_page_number(self.sequence)
+
+    def get_absolute_url(self):
+        """Returns the URL of the topic page showing this post, anchored at the post."""
+        url = reverse("forum:topic_detail", kwargs={"topic_id": self.topic_id})
+        page_number = self.get_page_number()
+        if page_number > 1:
+            url += f"?page={page_number}"
+        return f"{url}#post-{self.pk}"
+
+
+# How far a user has read a topic: the sequence number of the newest post they've been
+# shown. Markers only move forward and are written in batches (see forum/read_tracking.py).
+class TopicReadMarker(models.Model):
+    user = models.ForeignKey(User, related_name="topic_read_markers", on_delete=models.CASCADE)
+    topic = models.ForeignKey(Topic, related_name="read_markers", on_delete=models.CASCADE)
+    last_read_sequence = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [  # noqa: RUF012
+            models.UniqueConstraint(fields=["user", "topic"], name="unique_topic_read_marker"),
+        ]
+
+    def __str__(self):
+        return f"{self.user} read {self.topic} up to #{self.last_read_sequence}"
+
+
+# "Mark all read" watermark: every post in the category up to 'marked_at' counts as read,
+# whatever the user's topic markers say
+class CategoryReadMarker(models.Model):
+    user = models.ForeignKey(User, related_name="category_read_markers", on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, related_name="read_markers", on_delete=models.CASCADE)
+    marked_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [  # noqa: RUF012
+            models.UniqueConstraint(fields=["user", "category"], name="unique_category_read_marker"),
+        ]
+
+    def __str__(self):
+        return f"{self.user} read {self.category} up to {self.marked_at}"
+
+
+class AvatarFile(models.Model):
+    """
+    A stored avatar (Profile.avatar) and the number of profiles using it. Identical uploads
+    share one file, so it's only deleted once no profile uses it any more, by the
+    collect_avatars management command.
+    """
+
+    name = models.CharField(max_length=100, unique=True)
+    ref_count = models.PositiveIntegerField(default=0)
+    # When ref_count last changed; unused files are kept for a grace period after it
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [  # noqa: RUF012
+            # collect_avatars: files unused for longer than the grace period
+            models.Index(fields=["updated_at"], condition=Q(ref_count=0), name="avatar_file_unused_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} profiles)"
@@ -0,0 +1,325 @@
+# forum/page_cache.py
+
+import hashlib
+import time
+from datetime import UTC, datetime
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .decorators import load_user
+
+# Seconds a rendered page is kept. 0 disables the page cache.
+# Can be overridden with the FORUM_PAGE_CACHE_TIMEOUT setting.
+PAGE_CACHE_TIMEOUT = 300
+
+# Cache (from the CACHES setting) pages are stored in.
+# Can be overridden with the FORUM_PAGE_CACHE_ALIAS setting.
+PAGE_CACHE_ALIAS = "default"
+
+# While one request re-renders an expired page, others wait up to this long (seconds) for
+# it, serving the previous copy of the page meanwhile if there is one
+PAGE_CACHE_LOCK_TIMEOUT = 10
+PAGE_CACHE_WAIT = 2.0
+PAGE_CACHE_POLL_INTERVAL = 0.05
+
+# Scopes every cached page depends on: category names and author details
+# (avatar, title, signature) are shown on all of them
+GLOBAL_SCOPES = ("categories", "profiles")
+
+# Scope of the per-user state on a logged-in user's pages, such as unread indicators.
+# Logged-in users' pages aren't cached, but their conditional GET validators cover it.
+USER_SCOPE = "user:{user_id}"
+
+
+def _cache():
+    return caches[getattr(settings, "FORUM_PAGE_CACHE_ALIAS", PAGE_CACHE_ALIAS)]
+
+
+def _generation_key(scope):
+    return f"forum:page-gen:{scope}"
+
+
+def get_generations(scopes):
+    """
+    Returns the current generation of each scope, fetched in a single cache round trip.
+
+    Generations are nanosecond timestamps of the scope's last change, so they double as
+    Last-Modified times. A scope without a generation (never bumped, or evicted) starts at
+    the current time, so it can't come back at a value some older page was stored under.
+    """
+    cache = _cache()
+    keys = [_generation_key(scope) for scope in scopes]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, time.time_ns(), timeout=None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def invalidate(*scopes):
+    """Expires every cached page depending on any of the scopes by bumping their generation."""
+    cache = _cache()
+    now = time.time_ns()
+    current = cache.get_many([_generation_key(scope) for scope in scopes])
+    # Any value other than the previous one will do, so a racing bump can't lose an
+    # invalidation; never going backwards keeps Last-Modified monotonic
+    cache.set_many(
+        {
+            _generation_key(scope): max(now, current.get(_generation_key(scope), 0) + 1)
+            for scope in scopes
+        },
+        timeout=None,
+    )
+
+
+def _resolve_scopes(scopes, kwargs):
+    """Returns the global scopes plus the view's scopes filled in with its keyword arguments."""
+    return [*GLOBAL_SCOPES, *(scope.format(**kwargs) for scope in scopes)]
+
+
+def _page_keys(path, scopes):
+    path_hash = hashlib.md5(path.encode(), usedforsecurity=False).hexdigest()
+    generations = ".".join(str(generation) for generation in get_generations(scopes))
+    return (
+        f"forum:page:{path_hash}:{generations}",
+        f"forum:page-lock:{path_hash}:{generations}",
+        # The last page rendered for the path under any generation
+        f"forum:page-stale:{path_hash}",
+    )
+
+
+def _is_cacheable_request(request):
+    if request.method != "GET" or request.user.is_authenticated:
+        return False
+    # Pages showing a flash message are one-off
+    return CookieStorage.cookie_name not in request.COOKIES
+
+
+def _is_cacheable_response(request, response):
+    # Don't store anything carrying per-visitor state (CSRF token, cookies such as consumed messages)
+    return (
+        response.status_code == 200  # noqa: PLR2004
+        and not response.streaming
+        and not response.cookies
+        and not request.META.get("CSRF_COOKIE_USED")
+    )
+
+
+def _to_response(cached):
+    content, content_type = cached
+    return HttpResponse(content, content_type=content_type)
+
+
+def _get_cached_page(request, scopes, kwargs):
+    """
+    Looks the request's page up in the page cache. Returns (response, keys):
+
+    - a cached response (or the previous copy while another request re-renders it);
+    - no response and the page's keys when the caller took the re-render lock, and should
+      render the page and hand it to _store_page();
+    - neither when the caller should just render the page without storing it.
+    """
+    timeout = getattr(settings, "FORUM_PAGE_CACHE_TIMEOUT", PAGE_CACHE_TIMEOUT)
+    if not timeout or not _is_cacheable_request(request):
+        return None, None
+
+    cache = _cache()
+    keys = _page_keys(request.get_full_path(), _resolve_scopes(scopes, kwargs))
+    page_key, lock_key, stale_key = keys
+
+    cached = cache.get(page_key)
+    if cached is not None:
+        return _to_response(cached), None
+
+    # Stampede protection: only the request taking the lock renders the page
+    if not cache.add(lock_key, 1, timeout=PAGE_CACHE_LOCK_TIMEOUT):
+        stale = cache.get(stale_key)
+        if stale is not None:
+            return _to_response(stale), None
+        deadline = time.monotonic() + PAGE_CACHE_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(PAGE_CACHE_POLL_INTERVAL)
+            cached = cache.get(page_key)
+            if cached is not None:
+                return _to_response(cached), None
+        # The rendering request is taking too long; render it ourselves
+        return None, None
+
+    return None, keys
+
+
+def _store_page(request, response, keys):
+    """Stores a page rendered after _get_cached_page() and releases its re-render lock."""
+    cache = _cache()
+    page_key, lock_key, stale_key = keys
+    try:
+        if response is not None and _is_cacheable_response(request, response):
+            timeout = getattr(settings, "FORUM_PAGE_CACHE_TIMEOUT", PAGE_CACHE_TIMEOUT)
+            cached = (response.content, response["Content-Type"])
+            cache.set_many({page_key: cached, stale_key: cached}, timeout=timeout)
+    finally:
+        cache.delete(lock_key)
+
+
+def cache_anonymous_page(*scopes):
+    """
+    Decorator to serve a view's GET responses to logged-out visitors from the page cache.
+
+    Pages are keyed by their full URL (so every page of a listing is cached separately)
+    and by the generations of the scopes they depend on. Scopes are format strings filled
+    in with the view's keyword arguments, e.g. "topic:{topic_id}". The signal handlers in
+    forum/signals.py call invalidate() with the scopes a write affects, which expires
+    exactly the pages depending on them without having to find and delete their keys.
+
+    When a page has expired, only one request re-renders it; concurrent requests for the
+    same page are served the previous copy, or wait for the new one, instead of all
+    hitting the database at once.
+
+    Async views are supported too; the cache is then accessed from a worker thread so a
+    slow cache backend (or waiting for another request's page) doesn't block the event loop.
+    """
+
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+
+            @wraps(view_func)
+            async def _wrapped_view(request, *args, **kwargs):
+                await load_user(request)
+                cached, keys = await sync_to_async(_get_cached_page, thread_sensitive=False)(request, scopes, kwargs)
+                if cached is not None:
+                    return cached
+                if keys is None:
+                    return await view_func(request, *args, **kwargs)
+
+                response = None
+                try:
+                    response = await view_func(request, *args, **kwargs)
+                finally:
+                    await sync_to_async(_store_page, thread_sensitive=False)(request, response, keys)
+                return response
+
+        else:
+
+            @wraps(view_func)
+            def _wrapped_view(request, *args, **kwargs):
+                cached, keys = _get_cached_page(request, scopes, kwargs)
+                if cached is not None:
+                    return cached
+                if keys is None:
+                    return view_func(request, *args, **kwargs)
+
+                response = None
+                try:
+                    response = view_func(request, *args, **kwargs)
+                finally:
+                    _store_page(request, response, keys)
+                return response
+
+        return _wrapped_view
+
+    return decorator
+
+
+def _has_pending_messages(request):
+    return CookieStorage.cookie_name in request.COOKIES
+
+
+def _page_generations(request, scopes, kwargs):
+    # Both the ETag and the Last-Modified function need the generations; fetch them once
+    resolved = _resolve_scopes(scopes, kwargs)
+    if request.user.is_authenticated:
+        resolved.append(USER_SCOPE.format(user_id=request.user.pk))
+    memo = request.__dict__.setdefault("_page_generations", {})
+    key = tuple(resolved)
+    if key not in memo:
+        memo[key] = get_generations(resolved)
+    return memo[key]
+
+
+def _visitor_fingerprint(request):
+    """
+    Identifies the per-visitor parts of a page: the user (author-only edit/delete links,
+    the account menu) and the CSRF cookie the page's forms are signed for, which is rotated
+    on login.
+    """
+    user = request.user
+    if user.is_authenticated:
+        identity = f"{user.pk}:{user.username}:{user.is_staff}:{user.is_superuser}"
+    else:
+        identity = "anonymous"
+    return f"{identity}:{request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')}"
+
+
+def conditional_page(*scopes):
+    """
+    Decorator adding ETag and Last-Modified headers to a view's pages, and answering
+    conditional GETs for unchanged pages with 304 Not Modified without running the view.
+
+    The version of a page is fingerprinted from the generations of the page cache scopes it
+    depends on (see cache_anonymous_page), which the signal handlers in forum/signals.py
+    bump on every relevant write, so no database query is needed. The ETag also covers the
+    full URL and the visitor, since pages carry per-user fragments; Last-Modified is the
+    time of the newest change to any of the scopes. Browsers send If-None-Match along with
+    If-Modified-Since, and the ETag then takes precedence over the (one second resolution)
+    Last-Modified time.
+
+    Responses are marked "Cache-Control: no-cache" so browsers revalidate instead of
+    heuristically reusing a page for a while because it has a Last-Modified date, and
+    "private" for logged-in users so shared caches don't store their pages.
+    """
+
+    def etag_func(request, *args, **kwargs):
+        if _has_pending_messages(request):
+            return None
+        if request.user.is_authenticated and settings.CSRF_COOKIE_NAME not in request.COOKIES:
+            # The page sets the CSRF cookie its forms are signed for, so a fingerprint taken
+            # now would never match the next request's
+            return None
+        generations = _page_generations(request, scopes, kwargs)
+        fingerprint = f"{request.get_full_path()}|{generations}|{_visitor_fingerprint(request)}"
+        return hashlib.md5(fingerprint.encode(), usedforsecurity=False).hexdigest()
+
+    def last_modified_func(request, *args, **kwargs):
+        if _has_pending_messages(request):
+            return None
+        newest = max(_page_generations(request, scopes, kwargs))
+        return datetime.fromtimestamp(newest / 1e9, tz=UTC)
+
+    def add_cache_control(request, response):
+        if request.user.is_authenticated:
+            patch_cache_control(response, no_cache=True, private=True)
+        else:
+            patch_cache_control(response, no_cache=True)
+        return response
+
+    def decorator(view_func):
+        conditional_view = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view_func)
+
+        if iscoroutinefunction(view_func):
+
+            @wraps(view_func)
+            async def _wrapped_view(request, *args, **kwargs):
+                # The validators are taken before the view runs and need the user
+                await load_user(request)
+                response = await conditional_view(request, *args, **kwargs)
+                return add_cache_control(request, response)
+
+        else:
+
+            @wraps(view_func)
+            def _wrapped_view(request, *args, **kwargs):
+                response = conditional_view(request, *args, **kwargs)
+                return add_cache_control(request, response)
+
+        return _wrapped_view
+
+    return decorator
@@ -0,0 +1,256 @@
+# forum/pagination.py
+
+import base64
+import binascii
+from datetime import datetime
+
+from django.conf import settings
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db.models import Q
+from django.utils import timezone
+
+# Listings with more rows than this switch from numbered pages to keyset pagination,
+# because counting the rows and OFFSET-scanning to deep pages gets linearly slower.
+# Can be overridden with the FORUM_KEYSET_PAGINATION_THRESHOLD setting.
+KEYSET_PAGINATION_THRESHOLD = 1000
+
+# Largest primary key a cursor can hold: SQLite integers are signed 64-bit
+MAX_CURSOR_PK = 2**63 - 1
+
+
+class InvalidCursor(Exception):  # noqa: N818
+    """Raised when a pagination cursor token can't be decoded."""
+
+
+def encode_cursor(created_at, pk):
+    """Encodes a (created_at, pk) position as an opaque, URL-safe token."""
+    raw = f"{created_at.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """
+    Decodes a token produced by encode_cursor back into a (created_at, pk) tuple.
+
+    Tokens come from the query string, so one holding a time without a timezone (with
+    USE_TZ) or a primary key SQLite can't compare against is rejected here rather than
+    failing in the query.
+    """
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        created_at, pk = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        created_at, pk = datetime.fromisoformat(created_at), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        msg = f"Invalid cursor: {token!r}"
+        raise InvalidCursor(msg) from e
+    if not 0 <= pk <= MAX_CURSOR_PK or (settings.USE_TZ and timezone.is_naive(created_at)):
+        msg = f"Invalid cursor: {token!r}"
+        raise InvalidCursor(msg)
+    return created_at, pk
+
+
+class KeysetPage:
+    """
+    A single window of results returned by KeysetPaginator.
+
+    It quacks enough like django.core.paginator.Page (iteration, len(), object_list,
+    has_next/has_previous) for the listing templates to treat both the same way.
+    """
+
+    def __init__(self, object_list, *, has_next, has_previous):
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        """Token for the ?after= parameter of the next (older) page."""
+        if not self._has_next or not self.object_list:
+            return None
+        last = self.object_list[-1]
+        return encode_cursor(last.created_at, last.pk)
+
+    @property
+    def previous_cursor(self):
+        """Token for the ?before= parameter of the previous (newer) page."""
+        if not self._has_previous or not self.object_list:
+            return None
+        first = self.object_list[0]
+        return encode_cursor(first.created_at, first.pk)
+
+
+class KeysetPaginator:
+    """
+    Paginates a queryset newest-first on (created_at, pk) without COUNT(*) or OFFSET.
+
+    Every page is fetched with an indexed range condition relative to a cursor, so the
+    cost of a page doesn't depend on how far back it is.
+    """
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+
+    def _page_query(self, after, before):
+        # The rows of the requested page plus one, which tells whether there's another page
+        if before:
+            created_at, pk = decode_cursor(before)
+            # Walk backwards oldest-first from the cursor
+            return self.queryset.filter(
+                Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk),
+            ).order_by("created_at", "pk")[: self.per_page + 1]
+
+        queryset = self.queryset.order_by("-created_at", "-pk")
+        if after:
+            created_at, pk = decode_cursor(after)
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk),
+            )
+        return queryset[: self.per_page + 1]
+
+    def _make_page(self, rows, after, before):
+        if before:
+            has_previous = len(rows) > self.per_page
+            # Rows were fetched oldest-first to walk backwards; restore newest-first order
+            rows = rows[: self.per_page][::-1]
+            return KeysetPage(rows, has_next=True, has_previous=has_previous)
+
+        has_next = len(rows) > self.per_page
+        return KeysetPage(rows[: self.per_page], has_next=has_next, has_previous=bool(after))
+
+    def page(self, after=None, before=None):
+        """
+        Returns the page following the `after` cursor, preceding the `before` cursor,
+        or the first page if neither is given. A `before` cursor newer than every row
+        gets the first page too.
+
+        Raises:
+            InvalidCursor: If a cursor token can't be decoded
+
+        """
+        rows = list(self._page_query(after, before))
+        if before and not rows:
+            return self.page()
+        return self._make_page(rows, after, before)
+
+    async def apage(self, after=None, before=None):
+        """Async version of page(), fetching the rows through the async ORM."""
+        rows = [row async for row in self._page_query(after, before)]
+        if before and not rows:
+            return await self.apage()
+        return self._make_page(rows, after, before)
+
+
+def _numbered_page(paginator, page_number):
+    """Returns the requested page of a Paginator, falling back to the first or last page."""
+    try:
+        return paginator.page(page_number)
+    except PageNotAnInteger:
+        return paginator.page(1)
+    except EmptyPage:
+        return paginator.page(paginator.num_pages)
+
+
+def _numbered_context(paginator, page):
+    return {
+        "page": page,
+        "keyset_pagination": False,
+        "elided_page_range": paginator.get_elided_page_range(
+            number=page.number,
+            on_each_side=2,
+            on_ends=1,
+        ),
+        "PAGINATOR_ELLIPSIS": paginator.ELLIPSIS,
+    }
+
+
+def _keyset_context(page):
+    return {
+        "page": page,
+        "keyset_pagination": True,
+        "elided_page_range": [],
+        "PAGINATOR_ELLIPSIS": Paginator.ELLIPSIS,
+    }
+
+
+def paginate_listing(request, queryset, per_page, *, keyset=True):
+    """
+    Paginates a newest-first listing, choosing the cheapest pagination mode.
+
+    Numbered pages with an elided page range are only used while an exact total is cheap,
+    i.e. the listing has no more than KEYSET_PAGINATION_THRESHOLD rows (checked with a
+    bounded count). Larger listings, or any request carrying an ?after=/?before= cursor,
+    use keyset pagination instead. Listings in another order, which the cursors can't
+    follow, pass keyset=False to always get numbered pages.
+
+    Returns a dict of template context: 'page', 'keyset_pagination', 'elided_page_range'
+    and 'PAGINATOR_ELLIPSIS'.
+    """
+    threshold = getattr(settings, "FORUM_KEYSET_PAGINATION_THRESHOLD", KEYSET_PAGINATION_THRESHOLD)
+    after = request.GET.get("after")
+    before = request.GET.get("before")
+
+    # SELECT COUNT(*) FROM (... LIMIT threshold + 1) stops scanning once the limit is hit
+    if not keyset or (not after and not before and queryset.order_by()[: threshold + 1].count() <= threshold):
+        paginator = Paginator(queryset, per_page)
+        return _numbered_context(paginator, _numbered_page(paginator, request.GET.get("page")))
+
+    paginator = KeysetPaginator(queryset, per_page)
+    try:
+        page = paginator.page(after=after, before=before)
+    except InvalidCursor:
+        # If the cursor is malformed, deliver the first page
+        page = paginator.page()
+    return _keyset_context(page)
+
+
+async def apaginate_listing(request, queryset, per_page, *, keyset=True):
+    """
+    Async version of paginate_listing(), running its queries through the async ORM. The
+    rows of numbered pages are fetched too, so rendering the page doesn't query.
+    """
+    threshold = getattr(settings, "FORUM_KEYSET_PAGINATION_THRESHOLD", KEYSET_PAGINATION_THRESHOLD)
+    after = request.GET.get("after")
+    before = request.GET.get("before")
+
+    count = None
+    if not keyset:
+        count = await queryset.order_by().acount()
+    elif not after and not before:
+        bounded_count = await queryset.order_by()[: threshold + 1].acount()
+        # Below the threshold the bounded count is the exact total
+        if bounded_count <= threshold:
+            count = bounded_count
+
+    if count is not None:
+        paginator = Paginator(queryset, per_page)
+        # The paginator doesn't need to count again
+        paginator.count = count
+        page = _numbered_page(paginator, request.GET.get("page"))
+        page.object_list = [row async for row in page.object_list]
+        return _numbered_context(paginator, page)
+
+    paginator = KeysetPaginator(queryset, per_page)
+    try:
+        page = await paginator.apage(after=after, before=before)
+    except InvalidCursor:
+        page = await paginator.apage()
+    return _keyset_context(page)
@@ -0,0 +1,222 @@
+# forum/read_tracking.py
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DatabaseError, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import CategoryReadMarker, Topic, TopicReadMarker
+from .page_cache import USER_SCOPE, invalidate
+
+# Advanced read markers are written to the database at most this often (seconds)...
+# Can be overridden with the READ_MARKER_FLUSH_INTERVAL setting.
+READ_MARKER_FLUSH_INTERVAL = 30
+
+# ...or as soon as this many markers are pending.
+# Can be overridden with the READ_MARKER_FLUSH_THRESHOLD setting.
+READ_MARKER_FLUSH_THRESHOLD = 500
+
+logger = logging.getLogger(__name__)
+
+
+class ReadMarkerBuffer:
+    """
+    In-process buffer of advanced read markers.
+
+    Paging through a topic moves the reader's marker forward on every page; the buffer only
+    keeps the furthest position per (user, topic) and writes all pending markers in one
+    INSERT and one UPDATE at most once per READ_MARKER_FLUSH_INTERVAL, or once
+    READ_MARKER_FLUSH_THRESHOLD markers are pending. Until then, get() returns the pending
+    position so the reader's own pages stay current.
+
+    ReadMarkerMiddleware flushes the buffer once a response is ready, so the writes don't
+    count against the query budget of the page that happened to trigger them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}  # (user_id, topic_id) -> sequence not written to the database yet
+        self._last_flush = time.monotonic()
+
+    def advance(self, user_id, topic_id, sequence):
+        """Records that the user has read the topic up to 'sequence'; markers never move back."""
+        with self._lock:
+            key = (user_id, topic_id)
+            if sequence > self._pending.get(key, 0):
+                self._pending[key] = sequence
+
+    def get(self, user_id, topic_id):
+        """Returns the user's pending position in the topic, or None if nothing is pending."""
+        with self._lock:
+            return self._pending.get((user_id, topic_id))
+
+    def flush_if_due(self):
+        """Flushes the buffer if the flush interval has passed or the size threshold is reached."""
+        interval = getattr(settings, "READ_MARKER_FLUSH_INTERVAL", READ_MARKER_FLUSH_INTERVAL)
+        threshold = getattr(settings, "READ_MARKER_FLUSH_THRESHOLD", READ_MARKER_FLUSH_THRESHOLD)
+        if time.monotonic() - self._last_flush >= interval or len(self._pending) >= threshold:
+            self.flush()
+
+    def flush(self):
+        """
+        Upserts all pending markers in one statement and returns the number written. If
+        the write fails (e.g. the database is locked) the markers are kept for the next
+        flush and the error is logged rather than raised, so it doesn't fail the request
+        that happened to trigger the flush.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+
+        if not pending:
+            return 0
+
+        try:
+            markers = self._write(pending)
+        except DatabaseError:
+            logger.exception("Failed to write %d read markers, retrying next flush", len(pending))
+            with self._lock:
+                # Markers advanced since the batch was taken may be further ahead
+                for key, sequence in pending.items():
+                    self._pending[key] = max(sequence, self._pending.get(key, 0))
+            return 0
+        return len(markers)
+
+    @staticmethod
+    def _write(pending):
+        """Writes the pending markers of users and topics that still exist and returns them."""
+        # Users and topics deleted since the topic was read would fail the foreign key checks
+        users = set(User.objects.filter(pk__in={user_id for user_id, _ in pending}).values_list("pk", flat=True))
+        topics = set(Topic.objects.filter(pk__in={topic_id for _, topic_id in pending}).values_list("pk", flat=True))
+        markers = [
+            TopicReadMarker(user_id=user_id, topic_id=topic_id, last_read_sequence=sequence)
+            for (user_id, topic_id), sequence in pending.items()
+            if user_id in users and topic_id in topics
+        ]
+        if not markers:
+            return markers
+        with transaction.atomic():
+            # New markers are inserted as they are...
+            TopicReadMarker.objects.bulk_create(markers, ignore_conflicts=True)
+            # ...and existing ones only move forward: another process, or a request that read
+            # an older marker, may have written a position further ahead since
+            TopicReadMarker.objects.filter(
+                user_id__in={marker.user_id for marker in markers},
+                topic_id__in={marker.topic_id for marker in markers},
+            ).update(
+                last_read_sequence=Greatest(
+                    F("last_read_sequence"),
+                    Case(
+                        *(
+                            When(
+                                user_id=marker.user_id,
+                                topic_id=marker.topic_id,
+                                then=Value(marker.last_read_sequence),
+                            )
+                            for marker in markers
+                        ),
+                        default=F("last_read_sequence"),
+                        output_field=IntegerField(),
+                    ),
+                ),
+            )
+        return markers
+
+    def clear(self):
+        """Drops everything buffered without writing it."""
+        with self._lock:
+            self._pending = {}
+
+
+# The buffer shared by the views advancing and reading markers
+read_marker_buffer = ReadMarkerBuffer()
+
+
+def get_read_horizon(user, topic):
+    """
+    Returns the time up to which every post of the topic counts as read for the user:
+    when they last marked its category as read, or when they joined, whichever is later.
+    The topic must come from Topic.objects.with_read_state().
+    """
+    watermark = topic.category_read_at
+    return max(watermark, user.date_joined) if watermark else user.date_joined
+
+
+def get_last_read_sequence(user, topic):
+    """
+    Returns the sequence number of the last post of the topic the user has read, or 0.
+    The topic must come from Topic.objects.with_read_state().
+    """
+    pending = read_marker_buffer.get(user.pk, topic.pk)
+    return max(topic.last_read_sequence or 0, pending or 0)
+
+
+def flag_unread_topics(user, topics):
+    """
+    Sets 'is_unread' on each topic: True when it has posts newer than both the user's read
+    marker and their read horizon. The topics must come from
+    Topic.objects.with_read_state(); no queries are made.
+    """
+    for topic in topics:
+        topic.is_unread = (
+            user.is_authenticated
+            and topic.last_post_at is not None
+            and topic.last_post_at > get_read_horizon(user, topic)
+            and topic.post_sequence > get_last_read_sequence(user, topic)
+        )
+    return topics
+
+
+def flag_unread_posts(user, topic, posts):
+    """Sets 'is_unread' on each post of the topic shown to the user; no queries are made."""
+    if not user.is_authenticated:
+        for post in posts:
+            post.is_unread = False
+        return posts
+    last_read = get_last_read_sequence(user, topic)
+    horizon = get_read_horizon(user, topic)
+    for post in posts:
+        post.is_unread = post.sequence > last_read and post.created_at > horizon
+    return posts
+
+
+def mark_topic_read(user, topic, sequence):
+    """
+    Advances the user's marker in the topic to 'sequence' if that's further than they've
+    read. The write is buffered (see ReadMarkerBuffer); the user's pages are invalidated
+    right away so their conditional GETs don't keep serving stale unread indicators.
+    """
+    if not user.is_authenticated or sequence <= get_last_read_sequence(user, topic):
+        return
+    read_marker_buffer.advance(user.pk, topic.pk, sequence)
+    invalidate(USER_SCOPE.format(user_id=user.pk))
+
+
+def mark_page_read(user, topic, page, posts):
+    """
+    Advances the user's marker in the topic past the page of its posts shown to them. The
+    last page reads the topic up to its post_sequence rather than its newest post: the
+    sequence numbers of deleted replies aren't handed out again, so after the newest reply
+    is deleted the remaining posts stay behind post_sequence and the topic would be flagged
+    unread for good.
+    """
+    if not page.has_next():
+        mark_topic_read(user, topic, topic.post_sequence)
+    elif posts:
+        mark_topic_read(user, topic, posts[-1].sequence)
+
+
+def mark_category_read(user, category):
+    """Marks every post in the category, up to now, as read for the user."""
+    CategoryReadMarker.objects.update_or_create(
+        user=user,
+        category=category,
+        defaults={"marked_at": timezone.now()},
+    )
+    invalidate(USER_SCOPE.format(user_id=user.pk))
@@ -0,0 +1,136 @@
+# forum/rendering.py
+
+import re
+import threading
+
+import bleach
+from django.conf import settings
+from django.template.defaultfilters import linebreaksbr
+from django.utils.html import escape
+
+# Renderer used for new and edited posts. Can be overridden with the FORUM_POST_RENDERER setting.
+DEFAULT_RENDERER = "plain"
+
+# HTML any renderer is allowed to produce; everything else is stripped
+POST_ALLOWED_TAGS = frozenset({"a", "b", "blockquote", "br", "code", "em", "i", "pre", "strong"})
+POST_ALLOWED_ATTRIBUTES = {"a": ["href", "title"]}  # noqa: RUF012
+
+# Registered renderers: name -> (version, render function)
+_renderers = {}
+
+# bleach Cleaners are reusable but not thread-safe, so keep one per thread
+_post_cleaners = threading.local()
+
+
+def register_renderer(name, version):
+    """
+    Decorator to register a function turning a post message into HTML.
+
+    Bump 'version' whenever the renderer's output changes; posts rendered by an older
+    version are then re-rendered lazily on display and by the 'rerender_posts' command.
+    """
+
+    def decorator(render_func):
+        _renderers[name] = (version, render_func)
+        return render_func
+
+    return decorator
+
+
+def current_renderer():
+    """Returns the (name, version, render function) of the configured renderer."""
+    name = getattr(settings, "FORUM_POST_RENDERER", DEFAULT_RENDERER)
+    version, render_func = _renderers[name]
+    return name, version, render_func
+
+
+def current_renderer_version():
+    """Returns the identifier stored in Post.renderer_version for the configured renderer."""
+    name, version, _ = current_renderer()
+    return f"{name}:{version}"
+
+
+def sanitize_post_html(html):
+    """Strips any HTML not in POST_ALLOWED_TAGS/POST_ALLOWED_ATTRIBUTES."""
+    cleaner = getattr(_post_cleaners, "cleaner", None)
+    if cleaner is None:
+        cleaner = bleach.sanitizer.Cleaner(
+            tags=POST_ALLOWED_TAGS,
+            attributes=POST_ALLOWED_ATTRIBUTES,
+            strip=True,
+        )
+        _post_cleaners.cleaner = cleaner
+    return cleaner.clean(html)
+
+
+def render_message(message):
+    """
+    Renders a post message to sanitized HTML with the configured renderer.
+
+    Returns a (html, renderer_version) tuple.
+    """
+    _, _, render_func = current_renderer()
+    return sanitize_post_html(render_func(message)), current_renderer_version()
+
+
+@register_renderer("plain", version=1)
+def render_plain(message):
+    """Escapes the message and turns line breaks into <br>, like the linebreaksbr filter."""
+    return linebreaksbr(message, autoescape=True)
+
+
+FENCED_CODE_RE = re.compile(r"^```[^\n]*\n(.*?)\n```[ \t]*$", re.MULTILINE | re.DOTALL)
+INLINE_CODE_RE = re.compile(r"`([^`\n]+)`")
+BOLD_RE = re.compile(r"\*\*([^*\n]+)\*\*")
+ITALIC_RE = re.compile(r"(?<![*\w])\*([^*\n]+)\*(?![*\w])")
+
+
+def _render_inline(text):
+    # Inline code first so emphasis markers inside it are left alone
+    parts = INLINE_CODE_RE.split(text)
+    for i, part in enumerate(parts):
+        if i % 2:
+            parts[i] = f"<code>{part}</code>"
+        else:
+            part = BOLD_RE.sub(r"<strong>\1</strong>", part)
+            parts[i] = ITALIC_RE.sub(r"<em>\1</em>", part)
+    return "".join(parts)
+
+
+def _render_lines(text):
+    lines = []
+    quote = []
+
+    def flush_quote():
+        if quote:
+            lines.append(f"<blockquote>{'<br>'.join(quote)}</blockquote>")
+            quote.clear()
+
+    for line in text.split("\n"):
+        # The message is already escaped, so a quote marker shows up as "&gt;"
+        if line.startswith("&gt;"):
+            quote.append(_render_inline(line[4:].lstrip()))
+            continue
+        flush_quote()
+        lines.append(_render_inline(line))
+    flush_quote()
+    return "<br>".join(lines)
+
+
+@register_renderer("markdown", version=1)
+def render_markdown(message):
+    """
+    Renders a small Markdown subset: ```fenced code blocks```, `inline code`, **bold**,
+    *italic* and "> " quotes. Everything else is escaped and line breaks become <br>.
+    """
+    message = escape(message.replace("\r\n", "\n"))
+
+    html = []
+    position = 0
+    for match in FENCED_CODE_RE.finditer(message):
+        html.append(_render_lines(message[position : match.start()].strip("\n")))
+        html.append(f"<pre><code>{match.group(1)}</code></pre>")
+        position = match.end()
+    html.append(_render_lines(message[position:].strip("\n")))
+
+    return "".join(html)
@@ -1,8 +1,17 @@
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Greatest, Now
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
-from .models import Profile
+from categories.models import Category
+
+from .avatars import avatar_processor
+from .models import AvatarFile, Post, Profile, Topic
+from .page_cache import invalidate
 
 
 @receiver(post_save, sender=User)
@@ -32,9 +41,427 @@ def save_user_profile(sender, instance, **kwargs):
         **kwargs: Additional keyword arguments
 
     """
-    # Ensure the profile exists before trying to save it
-    # This handles cases where a user might have been created before this signal was implemented
-    if hasattr(instance, "profile"):
-        instance.profile.save()
+    if not User.profile.is_cached(instance):
+        # Nothing changed the profile along with the user (e.g. the last_login update on
+        # login), so it only has to exist. This handles users created before this signal
+        # was implemented.
+        Profile.objects.get_or_create(user=instance)
+    elif Profile.objects.filter(pk=instance.profile.pk).exists():
+        # Leave out the activity counters, which may have changed since the profile was loaded
+        instance.profile.save_without_stats()
     else:
-        Profile.objects.create(user=instance)
+        # The profile's row was deleted since it was loaded
+        instance.profile.save()
+
+
+@receiver(post_save, sender=Post)
+def update_topic_stats_on_post_create(sender, instance, created, raw=False, **kwargs):
+    """
+    Signal handler to bump the denormalized reply statistics of a Topic when a Post is created.
+
+    The counter is incremented with an F() expression so concurrent replies can't overwrite
+    each other's updates.
+
+    Args:
+        sender: The model class that sent the signal (Post)
+        instance: The actual instance being saved (Post instance)
+        created: Boolean indicating if this is a new record
+        raw: Boolean indicating if the instance is being loaded from a fixture
+        **kwargs: Additional keyword arguments
+
+    """
+    if not created or raw:
+        return
+
+    Topic.objects.filter(pk=instance.topic_id).update(
+        post_count=F("post_count") + 1,
+        last_post_at=instance.created_at,
+        last_post_by=instance.created_by_id,
+        updated_at=Now(),
+    )
+
+
+@receiver(post_delete, sender=Post)
+def update_topic_stats_on_post_delete(sender, instance, **kwargs):
+    """
+    Signal handler to update the denormalized reply statistics of a Topic when a Post is deleted.
+
+    This also fires for admin bulk deletes and cascades. The counter is decremented and the
+    last-activity columns are recalculated from the remaining posts in a single UPDATE.
+
+    Args:
+        sender: The model class that sent the signal (Post)
+        instance: The actual instance being deleted (Post instance)
+        **kwargs: Additional keyword arguments
+
+    """
+    latest_posts = Post.objects.filter(topic=OuterRef("pk")).order_by("-created_at", "-pk")
+    Topic.objects.filter(pk=instance.topic_id).update(
+        post_count=Greatest(F("post_count") - 1, 0),
+        last_post_at=Subquery(latest_posts.values("created_at")[:1]),
+        last_post_by=Subquery(latest_posts.values("created_by")[:1]),
+        updated_at=Now(),
+    )
+
+
+@receiver(post_save, sender=Topic)
+def update_category_stats_on_topic_save(sender, instance, created, raw=False, **kwargs):
+    """
+    Signal handler to update the denormalized statistics of a Category when a Topic is
+    created or moved to another category.
+
+    A new topic just bumps the counter. A moved topic takes its posts with it, so both the
+    old and the new category are recalculated.
+
+    Args:
+        sender: The model class that sent the signal (Topic)
+        instance: The actual instance being saved (Topic instance)
+        created: Boolean indicating if this is a new record
+        raw: Boolean indicating if the instance is being loaded from a fixture
+        **kwargs: Additional keyword arguments
+
+    """
+    if raw:
+        return
+
+    if created:
+        if instance.category_id is not None:
+            Category.objects.filter(pk=instance.category_id).update(topic_count=F("topic_count") + 1)
+        return
+
+    if not hasattr(instance, "_loaded_category_id"):
+        return
+    old_category_id = instance._loaded_category_id  # noqa: SLF001
+    if old_category_id != instance.category_id:
+        Category.objects.filter(pk__in=[old_category_id, instance.category_id]).refresh_stats()
+
+
+@receiver(post_delete, sender=Topic)
+def update_category_stats_on_topic_delete(sender, instance, **kwargs):
+    """
+    Signal handler to update the denormalized statistics of a Category when a Topic is deleted.
+
+    The topic's posts were deleted (and counted down) before the topic itself, so only the
+    topic counter and the last-post columns are left to update.
+
+    Args:
+        sender: The model class that sent the signal (Topic)
+        instance: The actual instance being deleted (Topic instance)
+        **kwargs: Additional keyword arguments
+
+    """
+    if instance.category_id is None:
+        return
+
+    latest_topics = Topic.objects.filter(
+        category=OuterRef("pk"),
+        last_post_at__isnull=False,
+    ).order_by("-last_post_at", "-pk")
+    Category.objects.filter(pk=instance.category_id).update(
+        topic_count=Greatest(F("topic_count") - 1, 0),
+        last_post_at=Subquery(latest_topics.values("last_post_at")[:1]),
+        last_post_by=Subquery(latest_topics.values("last_post_by")[:1]),
+        last_post_topic=Subquery(latest_topics.values("pk")[:1]),
+    )
+
+
+@receiver(post_save, sender=Post)
+def update_category_stats_on_post_create(sender, instance, created, raw=False, **kwargs):
+    """
+    Signal handler to bump the denormalized post statistics of a Category when a Post is created.
+
+    Args:
+        sender: The model class that sent the signal (Post)
+        instance: The actual instance being saved (Post instance)
+        created: Boolean indicating if this is a new record
+        raw: Boolean indicating if the instance is being loaded from a fixture
+        **kwargs: Additional keyword arguments
+
+    """
+    if not created or raw:
+        return
+
+    # Filtering through the relation updates the topic's category without loading the topic
+    Category.objects.filter(topics=instance.topic_id).update(
+        post_count=F("post_count") + 1,
+        last_post_at=instance.created_at,
+        last_post_by=instance.created_by_id,
+        last_post_topic=instance.topic_id,
+    )
+
+
+@receiver(post_delete, sender=Post)
+def update_category_stats_on_post_delete(sender, instance, **kwargs):
+    """
+    Signal handler to update the denormalized post statistics of a Category when a Post is deleted.
+
+    This runs after update_topic_stats_on_post_delete, so the last-post columns can be taken
+    from the already recalculated topic statistics instead of scanning the posts.
+
+    Args:
+        sender: The model class that sent the signal (Post)
+        instance: The actual instance being deleted (Post instance)
+        **kwargs: Additional keyword arguments
+
+    """
+    latest_topics = Topic.objects.filter(
+        category=OuterRef("pk"),
+        last_post_at__isnull=False,
+    ).order_by("-last_post_at", "-pk")
+    Category.objects.filter(topics=instance.topic_id).update(
+        post_count=Greatest(F("post_count") - 1, 0),
+        last_post_at=Subquery(latest_topics.values("last_post_at")[:1]),
+        last_post_by=Subquery(latest_topics.values("last_post_by")[:1]),
+        last_post_topic=Subquery(latest_topics.values("pk")[:1]),
+    )
+
+
+@receiver(post_save, sender=Topic)
+def update_profile_stats_on_topic_create(sender, instance, created, raw=False, **kwargs):
+    """
+    Signal handler to bump the topic counter of the author's Profile when a Topic is created.
+
+    Args:
+        sender: The model class that sent the signal (Topic)
+        instance: The actual instance being saved (Topic instance)
+        created: Boolean indicating if this is a new record
+        raw: Boolean indicating if the instance is being loaded from a fixture
+        **kwargs: Additional keyword arguments
+
+    """
+    if not created or raw:
+        return
+
+    Profile.objects.filter(user=instance.created_by_id).update(topic_count=F("topic_count") + 1)
+
+
+@receiver(post_delete, sender=Topic)
+def update_profile_stats_on_topic_delete(sender, instance, **kwargs):
+    """
+    Signal handler to count down the topic counter of the author's Profile when a Topic is deleted.
+
+    Args:
+        sender: The model class that sent the signal (Topic)
+        instance: The actual instance being deleted (Topic instance)
+        **kwargs: Additional keyword arguments
+
+    """
+    Profile.objects.filter(user=instance.created_by_id).update(topic_count=Greatest(F("topic_count") - 1, 0))
+
+
+@receiver(post_save, sender=Post)
+def update_profile_stats_on_post_create(sender, instance, created, raw=False, **kwargs):
+    """
+    Signal handler to bump the post statistics of the author's Profile when a Post is created.
+
+    Args:
+        sender: The model class that sent the signal (Post)
+        instance: The actual instance being saved (Post instance)
+        created: Boolean indicating if this is a new record
+        raw: Boolean indicating if the instance is being loaded from a fixture
+        **kwargs: Additional keyword arguments
+
+    """
+    if not created or raw:
+        return
+
+    Profile.objects.filter(user=instance.created_by_id).update(
+        post_count=F("post_count") + 1,
+        last_post_at=instance.created_at,
+    )
+
+
+@receiver(post_delete, sender=Post)
+def update_profile_stats_on_post_delete(sender, instance, **kwargs):
+    """
+    Signal handler to update the post statistics of the author's Profile when a Post is deleted.
+
+    This also fires for the posts of a deleted topic. The last post time is recalculated
+    from the user's remaining posts through the (created_by, created_at) index.
+
+    Args:
+        sender: The model class that sent the signal (Post)
+        instance: The actual instance being deleted (Post instance)
+        **kwargs: Additional keyword arguments
+
+    """
+    latest_posts = Post.objects.filter(created_by=OuterRef("user")).order_by("-created_at", "-pk")
+    Profile.objects.filter(user=instance.created_by_id).update(
+        post_count=Greatest(F("post_count") - 1, 0),
+        last_post_at=Subquery(latest_posts.values("created_at")[:1]),
+    )
+
+
+def _invalidate_on_commit(*scopes):
+    """
+    Expires the cached pages of the scopes once the current transaction commits. Bumping
+    the generations before that would let a request served in between cache the old
+    page under the new generations, where it would stay until the next write.
+    """
+    transaction.on_commit(lambda: invalidate(*scopes))
+
+
+def _category_scopes(*category_ids):
+    """Returns the page cache scopes of the categories' topic listings."""
+    category_ids = [category_id for category_id in category_ids if category_id is not None]
+    if not category_ids:
+        return []
+    slugs = Category.objects.filter(pk__in=category_ids).values_list("slug", flat=True)
+    return [f"category:{slug}" for slug in slugs]
+
+
+@receiver(post_save, sender=Topic)
+@receiver(post_delete, sender=Topic)
+def invalidate_page_cache_on_topic_change(sender, instance, **kwargs):
+    """
+    Signal handler to expire the cached pages showing a Topic when it is saved or deleted:
+    the topic itself, the forum index and its category's listing (both, if it was moved).
+
+    Args:
+        sender: The model class that sent the signal (Topic)
+        instance: The actual instance being saved or deleted (Topic instance)
+        **kwargs: Additional keyword arguments
+
+    """
+    old_category_id = getattr(instance, "_loaded_category_id", None)
+    scopes = ["index", f"topic:{instance.pk}", *_category_scopes(instance.category_id, old_category_id)]
+    _invalidate_on_commit(*scopes)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_page_cache_on_post_change(sender, instance, created=False, **kwargs):
+    """
+    Signal handler to expire the cached pages showing a Post when it is saved or deleted.
+
+    An edit only changes the topic's pages. A new or deleted post also changes the reply
+    statistics shown in the forum index and its category's listing.
+
+    Args:
+        sender: The model class that sent the signal (Post)
+        instance: The actual instance being saved or deleted (Post instance)
+        created: Boolean indicating if this is a new record (post_save only)
+        **kwargs: Additional keyword arguments
+
+    """
+    scopes = [f"topic:{instance.topic_id}"]
+    if created or kwargs["signal"] is post_delete:
+        category_ids = Topic.objects.filter(pk=instance.topic_id).values_list("category_id", flat=True)
+        scopes += ["index", *_category_scopes(*category_ids)]
+    _invalidate_on_commit(*scopes)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_page_cache_on_category_change(sender, instance, **kwargs):
+    """
+    Signal handler to expire all cached pages when a Category is saved or deleted, since
+    category names and links are shown on every page.
+
+    Args:
+        sender: The model class that sent the signal (Category)
+        instance: The actual instance being saved or deleted (Category instance)
+        **kwargs: Additional keyword arguments
+
+    """
+    _invalidate_on_commit("categories")
+
+
+@receiver(post_save, sender=Profile)
+def invalidate_page_cache_on_profile_change(sender, instance, created, **kwargs):
+    """
+    Signal handler to expire all cached pages when a Profile field shown next to the user's
+    topics and posts (Profile.PAGE_CACHE_FIELDS) changes.
+
+    Profiles are saved on every login, so saves that don't change those fields are ignored.
+
+    Args:
+        sender: The model class that sent the signal (Profile)
+        instance: The actual instance being saved (Profile instance)
+        created: Boolean indicating if this is a new record
+        **kwargs: Additional keyword arguments
+
+    """
+    loaded = getattr(instance, "_loaded_page_cache_fields", None)
+    if created or loaded is None:
+        # A new user has no topics or posts on any page yet
+        return
+    if loaded != instance.get_page_cache_fields():
+        _invalidate_on_commit("profiles")
+
+
+def _retain_avatar_file(name):
+    """Counts one more profile using the stored avatar file."""
+    avatar_file, created = AvatarFile.objects.get_or_create(name=name, defaults={"ref_count": 1})
+    if not created:
+        AvatarFile.objects.filter(pk=avatar_file.pk).update(ref_count=F("ref_count") + 1, updated_at=Now())
+
+
+def _release_avatar_file(name):
+    """Counts one profile less using the stored avatar file."""
+    AvatarFile.objects.filter(name=name).update(ref_count=Greatest(F("ref_count") - 1, 0), updated_at=Now())
+
+
+@receiver(post_save, sender=Profile)
+def update_avatar_on_profile_save(sender, instance, raw=False, **kwargs):
+    """
+    Signal handler to move a profile's reference from its old avatar file to its newly
+    uploaded one, and to queue making the new avatar's thumbnails once the transaction
+    saving it has committed.
+
+    Files no longer used by any profile are left for the collect_avatars command, since
+    identical uploads share a file.
+
+    Args:
+        sender: The model class that sent the signal (Profile)
+        instance: The actual instance being saved (Profile instance)
+        raw: Boolean indicating if the instance is being loaded from a fixture
+        **kwargs: Additional keyword arguments
+
+    """
+    # Set by Profile.save() when the avatar changed
+    replaced_avatar = instance.__dict__.pop("_replaced_avatar", None)
+    if raw or replaced_avatar is None:
+        return
+
+    if replaced_avatar:
+        _release_avatar_file(replaced_avatar)
+    profile_id, avatar_name = instance.pk, instance.avatar.name or ""
+    if avatar_name:
+        _retain_avatar_file(avatar_name)
+        transaction.on_commit(lambda: avatar_processor.submit(profile_id, avatar_name))
+
+
+@receiver(post_delete, sender=Profile)
+def release_avatar_on_profile_delete(sender, instance, **kwargs):
+    """
+    Signal handler to stop counting a deleted profile as a user of its avatar file.
+
+    Args:
+        sender: The model class that sent the signal (Profile)
+        instance: The actual instance being deleted (Profile instance)
+        **kwargs: Additional keyword arguments
+
+    """
+    if instance.avatar:
+        _release_avatar_file(instance.avatar.name)
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """
+    Signal handler to apply the SQLITE_PRAGMAS setting to every new SQLite connection.
+
+    Args:
+        sender: The database wrapper class that sent the signal
+        connection: The database connection that was opened
+        **kwargs: Additional keyword arguments
+
+    """
+    pragmas = getattr(settings, "SQLITE_PRAGMAS", {})
+    if connection.vendor != "sqlite" or not pragmas:
+        return
+
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
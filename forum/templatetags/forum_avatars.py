@@ -0,0 +1,51 @@
+from django import template
+from django.utils.html import format_html
+
+from forum.avatars import WEBP
+from forum.identity_map import get_profile
+
+register = template.Library()
+
+
+@register.simple_tag
+def avatar(user, size, css_class=""):
+    """
+    Renders the user's avatar for a slot of 'size' CSS pixels: {% avatar user 40 %}. The
+    thumbnails are offered in WebP with the JPEG or PNG ones as the fallback, and listed
+    by width so the browser picks the one for the slot and the screen's pixel density. The
+    width and height reserve the slot before the image loads.
+    """
+    profile = get_profile(user)
+    alt = f"{user.username}'s avatar"
+    class_attribute = format_html(' class="{}"', css_class) if css_class else ""
+    srcset = profile.get_avatar_srcset()
+    if not srcset:
+        # The original, while its thumbnails are being made
+        return format_html(
+            '<img src="{}" width="{}" height="{}" alt="{}"{}>',
+            profile.get_avatar_url(),
+            size,
+            size,
+            alt,
+            class_attribute,
+        )
+    img = format_html(
+        '<img src="{}" srcset="{}" sizes="{}px" width="{}" height="{}" alt="{}"{}>',
+        profile.get_avatar_url(size),
+        srcset,
+        size,
+        size,
+        size,
+        alt,
+        class_attribute,
+    )
+    webp_srcset = profile.get_avatar_srcset(WEBP)
+    if not webp_srcset:
+        # Thumbnails made before there were WebP ones
+        return img
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}px">{}</picture>',
+        webp_srcset,
+        size,
+        img,
+    )
@@ -0,0 +1,96 @@
+from django import template
+from django.conf import settings
+from django.utils.safestring import mark_safe
+
+from forum.fragment_cache import FRAGMENT_CACHE_TIMEOUT, fragment_cache_key, get_fragment_cache
+
+register = template.Library()
+
+# Where {% prefetch_fragments %} leaves the fragments it fetched for this render
+PREFETCHED_KEY = "forum_prefetched_fragments"
+
+
+def _timeout():
+    return getattr(settings, "FORUM_FRAGMENT_CACHE_TIMEOUT", FRAGMENT_CACHE_TIMEOUT)
+
+
+class PrefetchFragmentsNode(template.Node):
+    def __init__(self, name, objects):
+        self.name = name
+        self.objects = objects
+
+    def render(self, context):
+        if not _timeout():
+            return ""
+        name = self.name.resolve(context)
+        keys = [fragment_cache_key(name, obj) for obj in self.objects.resolve(context)]
+        prefetched = context.render_context.setdefault(PREFETCHED_KEY, {})
+        prefetched.update(get_fragment_cache().get_many(keys))
+        # Remember the misses too, so {% fragment_cache %} doesn't look them up again
+        prefetched.update((key, None) for key in keys if key not in prefetched)
+        return ""
+
+
+class FragmentCacheNode(template.Node):
+    def __init__(self, nodelist, name, obj):
+        self.nodelist = nodelist
+        self.name = name
+        self.obj = obj
+
+    def render(self, context):
+        timeout = _timeout()
+        if not timeout:
+            return self.nodelist.render(context)
+
+        key = fragment_cache_key(self.name.resolve(context), self.obj.resolve(context))
+        prefetched = context.render_context.get(PREFETCHED_KEY, {})
+        if key in prefetched:
+            fragment = prefetched[key]
+        else:
+            fragment = get_fragment_cache().get(key)
+        if fragment is None:
+            fragment = self.nodelist.render(context)
+            get_fragment_cache().set(key, fragment, timeout)
+        return mark_safe(fragment)  # noqa: S308
+
+
+@register.tag
+def prefetch_fragments(parser, token):
+    """
+    Fetches the cached "name" fragments of all the objects in one cache round trip, for the
+    {% fragment_cache %} blocks rendering them further down the template.
+
+    Usage::
+
+        {% prefetch_fragments "post" posts %}
+    """
+    bits = token.split_contents()
+    if len(bits) != 3:  # noqa: PLR2004
+        msg = f"'{bits[0]}' tag requires a fragment name and a list of objects"
+        raise template.TemplateSyntaxError(msg)
+    return PrefetchFragmentsNode(parser.compile_filter(bits[1]), parser.compile_filter(bits[2]))
+
+
+@register.tag
+def fragment_cache(parser, token):
+    """
+    Caches the enclosed template fragment for a topic or post, keyed by the object's
+    version and its author profile's version (see forum/fragment_cache.py), so it is only
+    re-rendered after one of them changed.
+
+    The fragment is shared by all visitors, so anything depending on the current user
+    (e.g. the author-only edit links) must be kept outside of it.
+
+    Usage::
+
+        {% fragment_cache "post" post %}
+            ...
+        {% endfragment_cache %}
+    """
+    bits = token.split_contents()
+    if len(bits) != 3:  # noqa: PLR2004
+        msg = f"'{bits[0]}' tag requires a fragment name and an object"
+        raise template.TemplateSyntaxError(msg)
+    nodelist = parser.parse(("endfragment_cache",))
+    parser.delete_first_token()
+    return FragmentCacheNode(nodelist, parser.compile_filter(bits[1]), parser.compile_filter(bits[2]))
@@ -0,0 +1,163 @@
+import importlib
+from datetime import timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import clear_url_caches, resolve, reverse
+from django.utils import timezone
+
+import categories.urls
+import forum.urls
+from categories.models import Category
+from forum import async_views
+from forum.models import Post, Topic
+from forum.read_tracking import read_marker_buffer
+from forum.view_counts import topic_view_buffer
+
+HTTP_SUCCESS = 200
+HTTP_NOT_MODIFIED = 304
+
+
+def reload_urlconf():
+    """Re-reads the URLconf so it picks the views for the current FORUM_ASYNC_VIEWS."""
+    importlib.reload(forum.urls)
+    importlib.reload(categories.urls)
+    importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+    clear_url_caches()
+
+
+@override_settings(
+    QUERY_BUDGET_MODE="raise",
+    LAST_SEEN_FLUSH_INTERVAL=3600,
+    VIEW_COUNT_FLUSH_INTERVAL=3600,
+    READ_MARKER_FLUSH_INTERVAL=3600,
+)
+class TestAsyncViews(TestCase):
+    """Tests for the async read-only views selected with FORUM_ASYNC_VIEWS."""
+
+    def setUp(self):
+        """Set up test data."""
+        cache.clear()
+        topic_view_buffer.clear()
+        read_marker_buffer.clear()
+        joined = timezone.now() - timedelta(days=1)
+        self.user = User.objects.create(username="author", date_joined=joined)
+        self.category = Category.objects.create(name="General", slug="general")
+        self.sticky = Topic.objects.create(
+            subject="Pinned Topic",
+            created_by=self.user,
+            category=self.category,
+            is_sticky=True,
+        )
+        self.topics = [
+            Topic.objects.create(subject=f"Topic {number}", created_by=self.user, category=self.category)
+            for number in range(7)
+        ]
+        self.topic = self.topics[-1]
+        for number in range(3):
+            Post.objects.create(topic=self.topic, created_by=self.user, message=f"Reply {number}")
+
+        self.index_url = reverse("forum:forum_index")
+        self.topic_url = reverse("forum:topic_detail", kwargs={"topic_id": self.topic.pk})
+        self.category_url = reverse("categories:topics_by_category", kwargs={"category_slug": "general"})
+        self.category_list_url = reverse("categories:category_list")
+
+        # Anonymous pages rendered by the sync views, to compare against
+        self.sync_pages = {
+            url: self.client.get(url).content
+            for url in (self.index_url, self.topic_url, self.category_url, self.category_list_url)
+        }
+        topic_view_buffer.clear()
+
+        self.async_views = override_settings(FORUM_ASYNC_VIEWS=True)
+        self.async_views.enable()
+        reload_urlconf()
+
+    def tearDown(self):
+        self.async_views.disable()
+        reload_urlconf()
+        topic_view_buffer.clear()
+        read_marker_buffer.clear()
+        cache.clear()
+
+    def test_setting_selects_async_views(self):
+        """Test that the read-only URLs resolve to the async views."""
+        assert resolve(self.index_url).func is async_views.forum_index  # noqa: S101
+        assert resolve(self.topic_url).func is async_views.topic_detail  # noqa: S101
+
+    async def test_pages_match_sync_views(self):
+        """Test that the async views render the same pages as the sync views, within budget."""
+        for url, content in self.sync_pages.items():
+            response = await self.async_client.get(url)
+            assert response.status_code == HTTP_SUCCESS, url  # noqa: S101
+            assert response.content == content, url  # noqa: S101
+
+    async def test_keyset_pages(self):
+        """Test that large listings are keyset paginated by the async views too."""
+        with self.settings(FORUM_KEYSET_PAGINATION_THRESHOLD=2):
+            response = await self.async_client.get(self.index_url)
+            assert response.context["keyset_pagination"]  # noqa: S101
+            next_page = await self.async_client.get(
+                self.index_url,
+                {"after": response.context["regular_topics_page"].next_cursor},
+            )
+        subjects = [topic.subject for topic in next_page.context["regular_topics_page"]]
+        assert subjects == ["Topic 1", "Topic 0"]  # noqa: S101
+
+    async def test_sort_by_views(self):
+        """Test the numbered "most viewed" listing."""
+        response = await self.async_client.get(self.index_url, {"sort": "views", "page": 2})
+        assert response.status_code == HTTP_SUCCESS  # noqa: S101
+        assert response.context["regular_topics_page"].number == 2  # noqa: S101, PLR2004
+        assert len(response.context["regular_topics_page"].object_list) == 2  # noqa: S101, PLR2004
+
+    async def test_logged_in_reader(self):
+        """Test that the async views load the user and track what they've read."""
+        await self.async_client.aforce_login(self.user)
+
+        response = await self.async_client.get(self.index_url)
+        self.assertContains(response, 'class="unread-indicator"')
+        assert "private" in response["Cache-Control"]  # noqa: S101
+
+        response = await self.async_client.get(self.topic_url)
+        self.assertContains(response, "Edit Post", count=3)
+        assert read_marker_buffer.get(self.user.pk, self.topic.pk) == 3  # noqa: S101, PLR2004
+        assert topic_view_buffer.get(self.topic.pk) == 1  # noqa: S101
+
+    async def test_conditional_get(self):
+        """Test that unchanged pages are answered with 304 Not Modified."""
+        response = await self.async_client.get(self.topic_url)
+        etag = response["ETag"]
+        response = await self.async_client.get(self.topic_url, headers={"if-none-match": etag})
+        assert response.status_code == HTTP_NOT_MODIFIED  # noqa: S101
+
+    @override_settings(FORUM_PAGE_CACHE_TIMEOUT=300)
+    async def test_page_cache(self):
+        """Test that logged-out visitors are served cached pages."""
+        first = await self.async_client.get(self.category_url)
+        second = await self.async_client.get(self.category_url)
+        assert first.context is not None  # noqa: S101
+        # Served from the cache without running the view
+        assert second.context is None  # noqa: S101
+        assert second.content == first.content  # noqa: S101
+
+
+class TestBenchmarkServers(TransactionTestCase):
+    """Tests for the benchmark_servers management command."""
+
+    def test_benchmark_runs(self):
+        """Test that the benchmark serves pages through both handlers without errors."""
+        Topic.objects.create(subject="Benchmarked", created_by=User.objects.create(username="author"))
+        out = StringIO()
+        call_command("benchmark_servers", requests=12, concurrency=3, host="testserver", stdout=out)
+
+        rows = {line[:24].strip(): line.split() for line in out.getvalue().splitlines()[2:]}
+        assert set(rows) == {"wsgi + sync views", "asgi + sync views", "asgi + async views"}  # noqa: S101
+        # The last column is the number of failed requests
+        assert all(row[-1] == "0" for row in rows.values())  # noqa: S101
+        # The URLconf is back to the configured views
+        assert resolve(reverse("forum:forum_index")).func is not async_views.forum_index  # noqa: S101
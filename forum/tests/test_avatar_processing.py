@@ -0,0 +1,388 @@
+import io
+import shutil
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from PIL import Image, ImageFile
+
+from forum.avatars import (
+    THUMBNAIL_SAVE_OPTIONS,
+    InvalidAvatar,
+    avatar_processor,
+    decode_avatar,
+    process_avatar,
+    read_avatar_header,
+)
+from forum.forms import ProfileForm
+from forum.models import Post, Profile, Topic
+
+HTTP_SUCCESS = 200
+THUMBNAIL_KEYS = {"48", "96", "256", "48.webp", "96.webp", "256.webp"}
+
+
+def make_upload(name, size=(300, 200), image_format="JPEG", mode="RGB", color="red"):
+    """Returns an uploaded image file of the given size and format."""
+    output = io.BytesIO()
+    Image.new(mode, size, color=1 if mode == "P" else color).save(output, format=image_format)
+    return SimpleUploadedFile(name, output.getvalue(), content_type=f"image/{image_format.lower()}")
+
+
+class MediaRootMixin:
+    """Stores uploads in a temporary MEDIA_ROOT for the duration of each test."""
+
+    def setUp(self):
+        """Set up a temporary media directory."""
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+
+@override_settings(AVATAR_PROCESSING_IN_BACKGROUND=False)
+class TestAvatarProcessing(MediaRootMixin, TestCase):
+    """Tests for making avatar thumbnails after an upload."""
+
+    def setUp(self):
+        """Set up test data."""
+        super().setUp()
+        cache.clear()
+        self.user = User.objects.create(username="avatartest")
+        self.client.force_login(self.user)
+        self.form_data = {"timezone": "UTC", "profile_visibility": "public"}
+
+    def tearDown(self):
+        cache.clear()
+
+    def upload(self, upload, *, process=True):
+        """Posts the avatar to the edit profile page, running the on-commit handlers if 'process'."""
+        with self.captureOnCommitCallbacks(execute=process):
+            response = self.client.post(reverse("forum:edit_profile"), {**self.form_data, "avatar": upload})
+        assert response.status_code == 302  # noqa: S101, PLR2004
+        return Profile.objects.get(user=self.user)
+
+    def test_upload_serves_original_until_processed(self):
+        """Test that the upload is stored as is and served until its thumbnails exist."""
+        profile = self.upload(make_upload("me.jpg", size=(1200, 900)), process=False)
+
+        assert profile.avatar_thumbnails == {}  # noqa: S101
+        assert profile.get_avatar_url(48) == profile.avatar.url  # noqa: S101
+        with default_storage.open(profile.avatar.name) as file, Image.open(file) as image:
+            assert image.size == (1200, 900)  # noqa: S101
+
+    def test_thumbnails_are_made(self):
+        """Test that a square thumbnail is made for each size, in the avatar's format and in WebP."""
+        profile = self.upload(make_upload("me.jpg"))
+
+        assert set(profile.avatar_thumbnails) == THUMBNAIL_KEYS  # noqa: S101
+        for key, name in profile.avatar_thumbnails.items():
+            size, _, extension = key.partition(".")
+            with default_storage.open(name) as file, Image.open(file) as image:
+                assert image.size == (int(size), int(size))  # noqa: S101
+                assert image.format == ("WEBP" if extension else "JPEG")  # noqa: S101
+
+    def test_png_and_gif_thumbnails(self):
+        """Test that avatars other than JPEGs get PNG thumbnails."""
+        for upload in (
+            make_upload("me.png", image_format="PNG", mode="RGBA"),
+            make_upload("me.gif", image_format="GIF", mode="P"),
+        ):
+            profile = self.upload(upload)
+            with default_storage.open(profile.avatar_thumbnails["96"]) as file, Image.open(file) as image:
+                assert image.format == "PNG", upload.name  # noqa: S101
+            with default_storage.open(profile.avatar_thumbnails["96.webp"]) as file, Image.open(file) as image:
+                assert image.format == "WEBP", upload.name  # noqa: S101
+
+    def test_get_avatar_url_picks_size(self):
+        """Test that the smallest thumbnail at least as large as the slot is chosen."""
+        profile = self.upload(make_upload("me.jpg"))
+        url = profile.get_avatar_url
+
+        assert url(40) == default_storage.url(profile.avatar_thumbnails["48"])  # noqa: S101
+        assert url(48) == default_storage.url(profile.avatar_thumbnails["48"])  # noqa: S101
+        assert url(50) == default_storage.url(profile.avatar_thumbnails["96"])  # noqa: S101
+        assert url(1000) == default_storage.url(profile.avatar_thumbnails["256"])  # noqa: S101
+        assert url() == profile.avatar.url  # noqa: S101
+
+    def test_default_avatar(self):
+        """Test that users without an avatar get the default one's variants."""
+        profile = Profile.objects.get(user=self.user)
+        assert profile.get_avatar_url() == "/static/forum/images/default_avatar.png"  # noqa: S101
+        assert profile.get_avatar_url(48) == "/static/forum/images/default_avatar_48.png"  # noqa: S101
+        assert profile.get_avatar_srcset("webp") == (  # noqa: S101
+            "/static/forum/images/default_avatar_48.webp 48w, /static/forum/images/default_avatar_96.webp 96w, "
+            "/static/forum/images/default_avatar_256.webp 256w"
+        )
+
+    def test_new_avatar_gets_new_thumbnails(self):
+        """Test that a new avatar replaces the thumbnails recorded for the old one."""
+        old = self.upload(make_upload("old.jpg")).avatar_thumbnails
+        new = self.upload(make_upload("new.png", image_format="PNG")).avatar_thumbnails
+
+        assert new  # noqa: S101
+        assert not set(old.values()) & set(new.values())  # noqa: S101
+
+    def test_outdated_job_is_discarded(self):
+        """Test that a job for an avatar that was replaced meanwhile records nothing."""
+        old_name = self.upload(make_upload("old.jpg"), process=False).avatar.name
+        profile = self.upload(make_upload("new.jpg", color="blue"), process=False)
+
+        assert process_avatar(profile.pk, old_name) == {}  # noqa: S101
+        profile.refresh_from_db()
+        assert profile.avatar_thumbnails == {}  # noqa: S101
+
+    def test_broken_avatar_keeps_original(self):
+        """Test that an avatar that can't be processed is still served as uploaded."""
+        profile = self.upload(make_upload("me.jpg"), process=False)
+        with default_storage.open(profile.avatar.name, "wb") as file:
+            file.write(b"not an image")
+
+        with self.assertLogs("forum.avatars", level="ERROR"):
+            avatar_processor.submit(profile.pk, profile.avatar.name)
+        profile.refresh_from_db()
+        assert profile.get_avatar_url(48) == profile.avatar.url  # noqa: S101
+
+    def test_pages_request_slot_sizes(self):
+        """Test that listings and threads link the thumbnail for their avatar slots."""
+        profile = self.upload(make_upload("me.jpg"))
+        topic = Topic.objects.create(subject="Avatars", created_by=self.user)
+        Post.objects.create(topic=topic, created_by=self.user, message="Hello")
+        thumbnail_url = {size: default_storage.url(name) for size, name in profile.avatar_thumbnails.items()}
+
+        self.assertContains(self.client.get(reverse("forum:forum_index")), thumbnail_url["48"])
+        response = self.client.get(reverse("forum:topic_detail", kwargs={"topic_id": topic.pk}))
+        self.assertContains(response, thumbnail_url["96"])
+        response = self.client.get(reverse("forum:user_profile", kwargs={"username": self.user.username}))
+        assert response.status_code == HTTP_SUCCESS  # noqa: S101
+        self.assertContains(response, thumbnail_url["256"])
+        self.assertNotContains(response, profile.avatar.url)
+
+    def test_picture_markup(self):
+        """Test that avatars are rendered as a <picture> offering the WebP thumbnails, sized for the slot."""
+        profile = self.upload(make_upload("me.jpg"))
+        url = {key: default_storage.url(name) for key, name in profile.avatar_thumbnails.items()}
+        topic = Topic.objects.create(subject="Avatars", created_by=self.user)
+        Post.objects.create(topic=topic, created_by=self.user, message="Hello")
+
+        response = self.client.get(reverse("forum:topic_detail", kwargs={"topic_id": topic.pk}))
+        self.assertContains(
+            response,
+            f'<picture><source type="image/webp" srcset="{url["48.webp"]} 48w, {url["96.webp"]} 96w, '
+            f'{url["256.webp"]} 256w" sizes="50px"><img src="{url["96"]}" srcset="{url["48"]} 48w, '
+            f'{url["96"]} 96w, {url["256"]} 256w" sizes="50px" width="50" height="50" '
+            f'alt="avatartest&#x27;s avatar"></picture>',
+            html=True,
+        )
+
+    def test_unprocessed_avatar_markup(self):
+        """Test that the original is rendered with the slot's dimensions while the thumbnails are being made."""
+        profile = self.upload(make_upload("me.jpg"), process=False)
+        response = self.client.get(reverse("forum:user_profile", kwargs={"username": self.user.username}))
+        self.assertContains(
+            response,
+            f'<img src="{profile.avatar.url}" width="100" height="100" alt="avatartest&#x27;s avatar" '
+            'class="avatar-img">',
+            html=True,
+        )
+        self.assertNotContains(response, "<picture>")
+
+
+class TestAvatarDecoding(TestCase):
+    """Tests for validating avatars from their header and decoding them in a single pass."""
+
+    def test_form_reads_upload_once(self):
+        """Test that validating an upload parses its header once and decodes nothing."""
+        upload = make_upload("me.jpg", size=(1200, 900))
+        form = ProfileForm(
+            data={"timezone": "UTC", "profile_visibility": "public"},
+            files={"avatar": upload},
+            instance=User.objects.create(username="avatartest").profile,
+        )
+        with (
+            patch.object(Image, "open", wraps=Image.open) as image_open,
+            patch.object(ImageFile.ImageFile, "load") as load,
+        ):
+            assert form.is_valid(), form.errors  # noqa: S101
+        assert image_open.call_count == 1  # noqa: S101
+        load.assert_not_called()
+
+    @override_settings(AVATAR_MAX_PIXELS=1000 * 1000)
+    def test_oversized_image_rejected_from_header(self):
+        """Test that images with too many pixels are rejected before being decoded."""
+        upload = make_upload("huge.png", size=(2000, 1000), image_format="PNG")
+        with (
+            patch.object(ImageFile.ImageFile, "load") as load,
+            self.assertRaisesMessage(InvalidAvatar, "Image too large"),
+        ):
+            decode_avatar(upload, 256)
+        load.assert_not_called()
+
+        form = ProfileForm(
+            data={"timezone": "UTC", "profile_visibility": "public"},
+            files={"avatar": make_upload("huge.png", size=(2000, 1000), image_format="PNG")},
+            instance=User.objects.create(username="avatartest").profile,
+        )
+        assert not form.is_valid()  # noqa: S101
+        assert "Image too large" in form.errors["avatar"][0]  # noqa: S101
+
+    def test_unsupported_format_rejected(self):
+        """Test that image formats other than JPEG, PNG and GIF are rejected whatever the file is named."""
+        upload = make_upload("me.png", image_format="BMP")
+        with self.assertRaisesMessage(InvalidAvatar, "Unsupported image format BMP"):
+            read_avatar_header(upload)
+
+    def test_jpeg_decoded_at_reduced_scale(self):
+        """Test that large JPEGs are decoded at the smallest scale that fills the square."""
+        square = decode_avatar(make_upload("me.jpg", size=(2000, 1500)), 256)
+        # 1/4 scale: 1/8 would leave the short side (187px) below 256px
+        assert square.size == (375, 375)  # noqa: S101
+        assert square.format == "JPEG"  # noqa: S101
+
+    def test_png_reduced_before_resampling(self):
+        """Test that other formats are cropped and reduced by a whole factor."""
+        square = decode_avatar(make_upload("me.png", size=(1600, 1200), image_format="PNG"), 256)
+        assert square.size == (300, 300)  # noqa: S101
+
+        square = decode_avatar(make_upload("me.gif", size=(1200, 900), image_format="GIF", mode="P"), 256)
+        assert square.size == (300, 300)  # noqa: S101
+        assert square.mode == "RGB"  # noqa: S101
+
+    def test_small_image_not_scaled(self):
+        """Test that images smaller than the square are only cropped."""
+        square = decode_avatar(make_upload("me.jpg", size=(200, 120)), 256)
+        assert square.size == (120, 120)  # noqa: S101
+
+    def test_exif_orientation_applied(self):
+        """Test that the EXIF orientation is applied when decoding."""
+        image = Image.new("RGB", (400, 200), "red")
+        image.paste("blue", (200, 0, 400, 200))
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Rotated 90 degrees clockwise when shown
+        output = io.BytesIO()
+        image.save(output, format="JPEG", exif=exif)
+
+        square = decode_avatar(io.BytesIO(output.getvalue()), 100)
+        top, bottom = square.getpixel((50, 10)), square.getpixel((50, 90))
+        # The right (blue) half ends up at the bottom
+        assert top[0] > top[2]  # noqa: S101
+        assert bottom[2] > bottom[0]  # noqa: S101
+
+
+class TestBackgroundAvatarProcessing(MediaRootMixin, TransactionTestCase):
+    """Tests for processing avatars in the background threads."""
+
+    def test_processed_in_background(self):
+        """Test that a saved avatar is processed by the worker threads after the commit."""
+        profile = User.objects.create(username="avatartest").profile
+        profile.avatar = make_upload("me.jpg")
+        profile.save()
+        avatar_processor.wait()
+
+        profile.refresh_from_db()
+        assert set(profile.avatar_thumbnails) == THUMBNAIL_KEYS  # noqa: S101
+
+
+@override_settings(AVATAR_PROCESSING_IN_BACKGROUND=False)
+class TestReprocessAvatars(MediaRootMixin, TestCase):
+    """Tests for the reprocess_avatars management command."""
+
+    def setUp(self):
+        """Set up test data."""
+        super().setUp()
+        cache.clear()
+        self.profiles = []
+        for index, color in enumerate(("red", "blue", "green")):
+            profile = User.objects.create(username=f"avatar{index}").profile
+            profile.avatar = make_upload(f"me{index}.png", image_format="PNG", color=color)
+            with self.captureOnCommitCallbacks(execute=True):
+                profile.save()
+            self.profiles.append(profile)
+
+    def tearDown(self):
+        cache.clear()
+
+    def reprocess(self, *args):
+        """Runs reprocess_avatars with two workers and returns its output and errors."""
+        out, err = StringIO(), StringIO()
+        call_command("reprocess_avatars", "--workers", "2", "--chunk-size", "2", *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def thumbnails(self):
+        """Returns the recorded thumbnails of the test profiles."""
+        return [Profile.objects.get(pk=profile.pk).avatar_thumbnails for profile in self.profiles]
+
+    def test_new_sizes_added(self):
+        """Test that profiles missing thumbnails of the current sizes get them, keeping the stored ones."""
+        before = self.thumbnails()
+        with override_settings(AVATAR_SIZES=(48, 96, 128, 256)):
+            output, errors = self.reprocess()
+
+        assert "Processed 3 avatars of 3 profiles (0 avatars failed)" in output  # noqa: S101
+        assert errors == ""  # noqa: S101
+        for old, new in zip(before, self.thumbnails(), strict=True):
+            assert set(new) == {*THUMBNAIL_KEYS, "128", "128.webp"}  # noqa: S101
+            assert old.items() <= new.items()  # noqa: S101
+            with default_storage.open(new["128.webp"]) as file, Image.open(file) as image:
+                assert image.size == (128, 128)  # noqa: S101
+
+    def test_current_thumbnails_skipped(self):
+        """Test that profiles with all current thumbnails are left alone."""
+        output, _ = self.reprocess()
+        assert "Processed 0 avatars of 0 profiles" in output  # noqa: S101
+
+    def test_new_encoder_settings_make_new_names(self):
+        """Test that thumbnails made with other encoder settings are remade under new names, not rewritten."""
+        before = self.thumbnails()
+        with patch.dict(THUMBNAIL_SAVE_OPTIONS, {"WEBP": {"quality": 50, "method": 6}}):
+            output, errors = self.reprocess()
+
+        assert "Processed 3 avatars of 3 profiles (0 avatars failed)" in output  # noqa: S101
+        assert errors == ""  # noqa: S101
+        for old, new in zip(before, self.thumbnails(), strict=True):
+            assert set(new) == THUMBNAIL_KEYS  # noqa: S101
+            assert not set(old.values()) & set(new.values())  # noqa: S101
+            # Browsers may still hold the old files under their immutable URLs
+            assert all(default_storage.exists(name) for name in old.values())  # noqa: S101
+
+    def test_dry_run(self):
+        """Test that a dry run lists the avatars without changing anything."""
+        Profile.objects.update(avatar_thumbnails={})
+        output, _ = self.reprocess("--dry-run", "--verbosity", "2")
+
+        assert "Would process 3 avatars of 3 profiles" in output  # noqa: S101
+        assert f"Would process {self.profiles[0].avatar.name}" in output  # noqa: S101
+        assert self.thumbnails() == [{}, {}, {}]  # noqa: S101
+
+    def test_resumes_from_checkpoint(self):
+        """Test that the command resumes after the profile recorded in the checkpoint and removes it when done."""
+        Profile.objects.update(avatar_thumbnails={})
+        checkpoint = Path(tempfile.mkdtemp()) / "avatars.checkpoint"
+        self.addCleanup(shutil.rmtree, checkpoint.parent, ignore_errors=True)
+        checkpoint.write_text(str(self.profiles[0].pk))
+
+        output, _ = self.reprocess("--checkpoint", str(checkpoint))
+        assert f"Resuming after profile {self.profiles[0].pk}" in output  # noqa: S101
+        assert [bool(thumbnails) for thumbnails in self.thumbnails()] == [False, True, True]  # noqa: S101
+        assert not checkpoint.exists()  # noqa: S101
+
+    def test_broken_avatar_reported(self):
+        """Test that an avatar that can't be processed is reported and the others are still updated."""
+        Profile.objects.update(avatar_thumbnails={})
+        broken = self.profiles[1]
+        with default_storage.open(broken.avatar.name, "wb") as file:
+            file.write(b"not an image")
+
+        output, errors = self.reprocess()
+        assert f"Failed to process {broken.avatar.name} (profiles {broken.pk})" in errors  # noqa: S101
+        assert "Processed 2 avatars of 2 profiles (1 avatars failed)" in output  # noqa: S101
+        assert [bool(thumbnails) for thumbnails in self.thumbnails()] == [True, False, True]  # noqa: S101
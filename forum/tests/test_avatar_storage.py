@@ -0,0 +1,178 @@
+import hashlib
+import os
+import time
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+
+from forum.avatars import avatar_storage, is_content_addressed, thumbnail_version
+from forum.models import AvatarFile, Profile
+from forum.tests.test_avatar_processing import MediaRootMixin, make_upload
+from forum.views import serve_media
+
+# Old enough to be past collect_avatars' default grace period
+TWO_HOURS = 2 * 60 * 60
+
+
+@override_settings(AVATAR_PROCESSING_IN_BACKGROUND=False)
+class TestAvatarStorage(MediaRootMixin, TestCase):
+    """Tests for content-addressed avatar storage and collecting unused avatars."""
+
+    def setUp(self):
+        """Set up test data."""
+        super().setUp()
+        cache.clear()
+        self.alice = User.objects.create(username="alice").profile
+        self.bob = User.objects.create(username="bob").profile
+
+    def tearDown(self):
+        cache.clear()
+
+    def set_avatar(self, profile, upload):
+        """Saves the avatar on the profile, processing it like after a commit."""
+        profile.avatar = upload
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        return Profile.objects.get(pk=profile.pk)
+
+    @staticmethod
+    def age_everything():
+        """Makes all avatar files and rows look unused for longer than the grace period."""
+        AvatarFile.objects.update(updated_at=timezone.now() - timedelta(seconds=TWO_HOURS))
+        past = time.time() - TWO_HOURS
+        for root, _, files in os.walk(avatar_storage.location):
+            for name in files:
+                os.utime(os.path.join(root, name), (past, past))  # noqa: PTH118
+
+    def collect(self, *args):
+        """Runs collect_avatars and returns its output."""
+        out = StringIO()
+        call_command("collect_avatars", *args, stdout=out)
+        return out.getvalue()
+
+    def test_avatar_named_after_content(self):
+        """Test that avatars are stored under the hash of their content."""
+        upload = make_upload("Holiday Photo.JPEG")
+        digest = hashlib.sha256(upload.read()).hexdigest()
+        upload.seek(0)
+
+        profile = self.set_avatar(self.alice, upload)
+        assert profile.avatar.name == f"avatars/{digest[:2]}/{digest}.jpg"  # noqa: S101
+        assert all(is_content_addressed(name) for name in profile.avatar_thumbnails.values())  # noqa: S101
+        assert profile.get_avatar_url(48).endswith(f"/{digest}_48_{thumbnail_version()}.jpg")  # noqa: S101
+
+    def test_identical_avatars_stored_once(self):
+        """Test that identical uploads share one file and its thumbnails."""
+        alice = self.set_avatar(self.alice, make_upload("mine.jpg"))
+        bob = self.set_avatar(self.bob, make_upload("also-mine.jpg"))
+
+        assert alice.avatar.name == bob.avatar.name  # noqa: S101
+        assert alice.avatar_thumbnails == bob.avatar_thumbnails  # noqa: S101
+        directory = os.path.dirname(avatar_storage.path(alice.avatar.name))  # noqa: PTH120
+        assert len(os.listdir(directory)) == 7  # noqa: S101, PLR2004
+        assert AvatarFile.objects.get(name=alice.avatar.name).ref_count == 2  # noqa: S101, PLR2004
+
+    def test_replacing_avatar_moves_reference(self):
+        """Test that the profile stops counting towards its old avatar."""
+        old = self.set_avatar(self.alice, make_upload("old.jpg")).avatar.name
+        new = self.set_avatar(self.alice, make_upload("new.jpg", color="blue")).avatar.name
+
+        assert AvatarFile.objects.get(name=old).ref_count == 0  # noqa: S101
+        assert AvatarFile.objects.get(name=new).ref_count == 1  # noqa: S101
+
+    def test_deleting_profile_releases_avatar(self):
+        """Test that deleting a user stops counting their avatar."""
+        name = self.set_avatar(self.alice, make_upload("mine.jpg")).avatar.name
+        self.alice.user.delete()
+        assert AvatarFile.objects.get(name=name).ref_count == 0  # noqa: S101
+
+    def test_collect_unused_avatar(self):
+        """Test that an avatar nobody uses is deleted with its thumbnails."""
+        old = self.set_avatar(self.alice, make_upload("old.jpg"))
+        self.set_avatar(self.alice, make_upload("new.jpg", color="blue"))
+        self.age_everything()
+
+        output = self.collect()
+        assert "Deleted 1 unused avatars" in output  # noqa: S101
+        assert not AvatarFile.objects.filter(name=old.avatar.name).exists()  # noqa: S101
+        for name in [old.avatar.name, *old.avatar_thumbnails.values()]:
+            assert not avatar_storage.exists(name), name  # noqa: S101
+        new = Profile.objects.get(pk=self.alice.pk)
+        for name in [new.avatar.name, *new.avatar_thumbnails.values()]:
+            assert avatar_storage.exists(name), name  # noqa: S101
+
+    def test_shared_avatar_kept(self):
+        """Test that an avatar is kept while another profile uses it."""
+        shared = self.set_avatar(self.alice, make_upload("mine.jpg")).avatar.name
+        self.set_avatar(self.bob, make_upload("mine.jpg"))
+        self.set_avatar(self.alice, make_upload("new.jpg", color="blue"))
+        self.age_everything()
+
+        self.collect()
+        assert avatar_storage.exists(shared)  # noqa: S101
+        assert Profile.objects.get(pk=self.bob.pk).get_avatar_url(48) != self.bob.avatar.url  # noqa: S101
+
+    def test_recently_unused_avatar_kept(self):
+        """Test that avatars are kept for the grace period after their last use."""
+        old = self.set_avatar(self.alice, make_upload("old.jpg")).avatar.name
+        self.set_avatar(self.alice, make_upload("new.jpg", color="blue"))
+
+        assert "Deleted 0 unused avatars" in self.collect()  # noqa: S101
+        assert avatar_storage.exists(old)  # noqa: S101
+
+    def test_reuploaded_avatar_kept(self):
+        """Test that uploading an unused avatar again claims it back."""
+        old = self.set_avatar(self.alice, make_upload("old.jpg")).avatar.name
+        self.set_avatar(self.alice, make_upload("new.jpg", color="blue"))
+        self.age_everything()
+        self.set_avatar(self.bob, make_upload("old.jpg"))
+
+        self.collect()
+        assert avatar_storage.exists(old)  # noqa: S101
+        assert AvatarFile.objects.get(name=old).ref_count == 1  # noqa: S101
+
+    def test_drifted_count_repaired(self):
+        """Test that a file counted as unused but still in use is kept and recounted."""
+        name = self.set_avatar(self.alice, make_upload("mine.jpg")).avatar.name
+        AvatarFile.objects.update(ref_count=0)
+        self.age_everything()
+
+        self.collect()
+        assert avatar_storage.exists(name)  # noqa: S101
+        assert AvatarFile.objects.get(name=name).ref_count == 1  # noqa: S101
+
+    def test_sweep_untracked_files(self):
+        """Test that --sweep deletes files in the avatar directory no profile refers to."""
+        profile = self.set_avatar(self.alice, make_upload("mine.jpg"))
+        stray = avatar_storage.save("avatars/ab/stray.jpg", ContentFile(b"stray"))
+        # A thumbnail of the avatar made with other encoder settings
+        superseded = profile.avatar_thumbnails["48"].replace(thumbnail_version(), "0" * 8)
+        avatar_storage.save(superseded, ContentFile(b"superseded"))
+        self.age_everything()
+
+        output = self.collect("--sweep", "--dry-run")
+        assert "Would delete 0 unused avatars and 2 untracked files" in output  # noqa: S101
+        assert avatar_storage.exists(stray)  # noqa: S101
+
+        self.collect("--sweep")
+        assert not avatar_storage.exists(stray)  # noqa: S101
+        assert not avatar_storage.exists(superseded)  # noqa: S101
+        for name in [profile.avatar.name, *profile.avatar_thumbnails.values()]:
+            assert avatar_storage.exists(name), name  # noqa: S101
+
+    def test_fingerprinted_avatars_cached_for_good(self):
+        """Test that content-addressed avatars are served with immutable caching headers."""
+        profile = self.set_avatar(self.alice, make_upload("mine.jpg"))
+        legacy = avatar_storage.save("avatars/mine.jpg", ContentFile(b"legacy"))
+        request = RequestFactory().get("/media/")
+
+        response = serve_media(request, profile.avatar_thumbnails["48"])
+        assert response["Cache-Control"] == "public, max-age=31536000, immutable"  # noqa: S101
+        response = serve_media(request, legacy)
+        assert "immutable" not in response.get("Cache-Control", "")  # noqa: S101
@@ -0,0 +1,102 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from categories.models import Category
+from forum.models import Post, Topic
+
+HTTP_SUCCESS = 200
+HTTP_NOT_MODIFIED = 304
+
+
+@override_settings(LAST_SEEN_FLUSH_INTERVAL=3600)
+class TestConditionalGet(TestCase):
+    """Tests for ETag/Last-Modified handling of the topic and listing pages."""
+
+    def setUp(self):
+        """Set up test data."""
+        cache.clear()
+        self.author = User.objects.create(username="author")
+        self.reader = User.objects.create(username="reader")
+        self.category = Category.objects.create(name="Test Category")
+        self.topic = Topic.objects.create(subject="Test Topic", created_by=self.author, category=self.category)
+        Post.objects.create(message="First post", topic=self.topic, created_by=self.author)
+        self.client = Client()
+
+        self.topic_url = reverse("forum:topic_detail", kwargs={"topic_id": self.topic.pk})
+        self.urls = [
+            self.topic_url,
+            reverse("forum:forum_index"),
+            reverse("categories:category_list"),
+            reverse("categories:topics_by_category", kwargs={"category_slug": self.category.slug}),
+        ]
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_pages_carry_validators(self):
+        """Test that every page has an ETag and Last-Modified and must be revalidated."""
+        for url in self.urls:
+            response = self.client.get(url)
+            assert response.status_code == HTTP_SUCCESS  # noqa: S101
+            assert response.has_header("ETag")  # noqa: S101
+            assert response.has_header("Last-Modified")  # noqa: S101
+            assert "no-cache" in response["Cache-Control"]  # noqa: S101
+
+    def test_unchanged_page_is_not_modified(self):
+        """Test that revalidating an unchanged page returns 304 without running the view."""
+        for url in self.urls:
+            etag = self.client.get(url)["ETag"]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, headers={"if-none-match": etag})
+            assert response.status_code == HTTP_NOT_MODIFIED  # noqa: S101
+            assert response.content == b""  # noqa: S101
+            assert len(queries) == 0  # noqa: S101
+
+    def test_if_modified_since(self):
+        """Test that a client only sending If-Modified-Since gets a 304 for an unchanged page."""
+        last_modified = self.client.get(self.topic_url)["Last-Modified"]
+        response = self.client.get(self.topic_url, headers={"if-modified-since": last_modified})
+        assert response.status_code == HTTP_NOT_MODIFIED  # noqa: S101
+
+    def test_new_reply_changes_fingerprint(self):
+        """Test that a reply makes the topic and listings return a full page again."""
+        etags = {url: self.client.get(url)["ETag"] for url in self.urls}
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(message="A new reply", topic=self.topic, created_by=self.reader)
+
+        for url, etag in etags.items():
+            response = self.client.get(url, headers={"if-none-match": etag})
+            assert response.status_code == HTTP_SUCCESS  # noqa: S101
+            assert response["ETag"] != etag  # noqa: S101
+
+    def test_fingerprint_is_per_user(self):
+        """Test that a page validated for one visitor isn't reused for another."""
+        anonymous_etag = self.client.get(self.topic_url)["ETag"]
+
+        self.client.force_login(self.author)
+        self.client.get(self.topic_url)
+        response = self.client.get(self.topic_url, headers={"if-none-match": anonymous_etag})
+        assert response.status_code == HTTP_SUCCESS  # noqa: S101
+        # The author sees the edit links for their post
+        self.assertContains(response, "Edit")
+        author_etag = response["ETag"]
+        assert "private" in response["Cache-Control"]  # noqa: S101
+
+        self.client.force_login(self.reader)
+        self.client.get(self.topic_url)
+        response = self.client.get(self.topic_url, headers={"if-none-match": author_etag})
+        assert response.status_code == HTTP_SUCCESS  # noqa: S101
+
+    def test_logged_in_user_gets_not_modified(self):
+        """Test that logged-in users can revalidate their own pages too."""
+        self.client.force_login(self.reader)
+        # The first page sets the CSRF cookie, so it can't be fingerprinted yet
+        assert not self.client.get(self.topic_url).has_header("ETag")  # noqa: S101
+        etag = self.client.get(self.topic_url)["ETag"]
+        response = self.client.get(self.topic_url, headers={"if-none-match": etag})
+        assert response.status_code == HTTP_NOT_MODIFIED  # noqa: S101
@@ -2,6 +2,7 @@ from django.contrib.auth.models import User
 from django.test import Client, TestCase
 from django.urls import reverse
 
+from forum.last_seen import last_seen_buffer
 from forum.models import Post, Profile, Topic
 
 HTTP_SUCCESS = 200
@@ -60,8 +61,8 @@ class TestForumIntegration(TestCase):
         # Check that the page loads successfully
         assert response.status_code == HTTP_SUCCESS  # noqa: S101
 
-        # Check that the avatar URL is included in the response
-        self.assertContains(response, self.profile.get_avatar_url())
+        # Check that the avatar URL for the listing's slot is included in the response
+        self.assertContains(response, self.profile.get_avatar_url(40))
 
         # Check that the topic creator's username is displayed
         self.assertContains(response, self.user.username)
@@ -76,11 +77,11 @@ class TestForumIntegration(TestCase):
         # Check that the page loads successfully
         assert response.status_code == HTTP_SUCCESS  # noqa: S101
 
-        # Check that the avatar URLs are included in the response
-        self.assertContains(response, self.profile.get_avatar_url())
+        # Check that the avatar URLs for the posts' slots are included in the response
+        self.assertContains(response, self.profile.get_avatar_url(50))
         self.assertContains(
             response,
-            Profile.objects.get(user=self.other_user).get_avatar_url(),
+            Profile.objects.get(user=self.other_user).get_avatar_url(50),
         )
 
         # Check that the post creators' usernames are displayed
@@ -123,9 +124,11 @@ class TestForumIntegration(TestCase):
         old_last_seen = self.profile.last_seen
 
         # Make a request to the site
+        last_seen_buffer.clear()
         self.client.get(reverse("forum:forum_index"))
 
-        # Check that the last_seen field was updated
+        # Check that the last_seen field was updated once the buffered times are written
+        last_seen_buffer.flush()
         self.profile.refresh_from_db()
         assert self.profile.last_seen is not None  # noqa: S101
         if old_last_seen:
@@ -0,0 +1,108 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from categories.models import Category
+from forum.fragment_cache import fragment_cache_key, fragment_version
+from forum.models import Post, Topic
+
+
+@override_settings(FORUM_FRAGMENT_CACHE_TIMEOUT=300)
+class TestFragmentCache(TestCase):
+    """Tests for the versioned topic row and post fragment cache."""
+
+    def setUp(self):
+        """Set up test data."""
+        cache.clear()
+        self.author = User.objects.create(username="author")
+        self.reader = User.objects.create(username="reader")
+        self.category = Category.objects.create(name="Test Category")
+        self.topic = Topic.objects.create(subject="Test Topic", created_by=self.author, category=self.category)
+        self.post = Post.objects.create(message="First post", topic=self.topic, created_by=self.author)
+        self.client = Client()
+
+        self.topic_url = reverse("forum:topic_detail", kwargs={"topic_id": self.topic.pk})
+        self.index_url = reverse("forum:forum_index")
+
+    def tearDown(self):
+        cache.clear()
+
+    def _post_key(self):
+        return fragment_cache_key("post", Post.objects.for_thread().get(pk=self.post.pk))
+
+    def _topic_key(self):
+        return fragment_cache_key("index_topic", Topic.objects.for_listing().get(pk=self.topic.pk))
+
+    def test_unchanged_fragments_come_from_cache(self):
+        """Test that rendered fragments are stored and reused as long as nothing changed."""
+        self.client.get(self.topic_url)
+        self.client.get(self.index_url)
+
+        cache.set(self._post_key(), "<p>cached post fragment</p>")
+        cache.set(self._topic_key(), "<p>cached topic row</p>")
+
+        self.assertContains(self.client.get(self.topic_url), "cached post fragment")
+        self.assertContains(self.client.get(self.index_url), "cached topic row")
+
+    def test_author_links_stay_outside_the_fragment(self):
+        """Test that a fragment cached for one visitor doesn't leak the author-only links to others."""
+        self.client.get(self.topic_url)
+        assert cache.get(self._post_key()) is not None  # noqa: S101
+        assert "Edit Post" not in cache.get(self._post_key())  # noqa: S101
+
+        self.client.force_login(self.author)
+        self.assertContains(self.client.get(self.topic_url), "Edit Post")
+
+        self.client.force_login(self.reader)
+        self.assertNotContains(self.client.get(self.topic_url), "Edit Post")
+
+    def test_post_edit_changes_key(self):
+        """Test that editing a post re-renders its fragment, even without touching updated_at."""
+        key = self._post_key()
+        self.post.message = "Edited post"
+        self.post.save()
+
+        assert self._post_key() != key  # noqa: S101
+        self.assertContains(self.client.get(self.topic_url), "Edited post")
+
+    def test_profile_change_changes_keys(self):
+        """Test that changing the author's profile re-renders their posts and topic rows."""
+        post_key = self._post_key()
+        topic_key = self._topic_key()
+
+        profile = User.objects.get(pk=self.author.pk).profile
+        profile.user_title = "Moderator"
+        profile.save()
+
+        assert self._post_key() != post_key  # noqa: S101
+        assert self._topic_key() != topic_key  # noqa: S101
+
+    def test_new_reply_changes_topic_row_key(self):
+        """Test that the post count shown in a topic row can't go stale."""
+        self.client.get(self.index_url)
+        key = self._topic_key()
+
+        Post.objects.create(message="Reply", topic=self.topic, created_by=self.reader)
+
+        assert self._topic_key() != key  # noqa: S101
+        self.assertContains(self.client.get(self.index_url), "(2 posts, ")
+
+    def test_category_rename_changes_topic_row_key(self):
+        """Test that a topic row shows its category's new name."""
+        key = self._topic_key()
+        self.category.name = "Renamed Category"
+        self.category.save()
+
+        assert self._topic_key() != key  # noqa: S101
+
+    def test_fragment_version_rejects_other_models(self):
+        """Test that only topics and posts have a fragment version."""
+        with self.assertRaises(TypeError):
+            fragment_version(self.category)
+
+    @override_settings(FORUM_FRAGMENT_CACHE_TIMEOUT=0)
+    def test_disabled(self):
+        """Test that a timeout of 0 disables the fragment cache."""
+        self.client.get(self.topic_url)
+        assert cache.get(self._post_key()) is None  # noqa: S101
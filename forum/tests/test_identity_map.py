@@ -0,0 +1,101 @@
+from django.contrib.auth.models import User
+from django.http import Http404
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from forum.identity_map import find_user, get_profile, get_user_or_404, remember, request_identity_map
+from forum.last_seen import last_seen_buffer
+from forum.models import Profile
+from forum.read_tracking import read_marker_buffer
+
+HTTP_SUCCESS = 200
+
+
+class TestIdentityMap(TestCase):
+    """Tests for the request-scoped map of loaded users and profiles."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(username="testuser", password="testpassword")  # noqa: S106
+
+    def test_user_loaded_once_per_request(self):
+        """Test that a user is looked up once by username and shared afterwards, profile included."""
+        with request_identity_map():
+            with self.assertNumQueries(1):
+                user = get_user_or_404("testuser")
+                assert get_profile(user).user_id == self.user.pk  # noqa: S101
+            with self.assertNumQueries(0):
+                assert get_user_or_404("testuser") is user  # noqa: S101
+                assert find_user(pk=self.user.pk) is user  # noqa: S101
+
+    def test_remember_returns_the_mapped_instance(self):
+        """Test that remembering a second copy of a user hands back the first one."""
+        with request_identity_map():
+            first = remember(User.objects.get(pk=self.user.pk))
+            assert remember(User.objects.get(pk=self.user.pk)) is first  # noqa: S101
+
+    def test_map_discarded_at_exit(self):
+        """Test that nothing loaded in one request is seen by the next or outside of requests."""
+        with request_identity_map():
+            get_user_or_404("testuser")
+        assert find_user(username="testuser") is None  # noqa: S101
+        with request_identity_map():
+            assert find_user(username="testuser") is None  # noqa: S101
+
+    def test_unknown_username(self):
+        """Test that an unknown username raises Http404, with or without a map."""
+        with self.assertRaises(Http404):
+            get_user_or_404("nobody")
+        with request_identity_map(), self.assertRaises(Http404):
+            get_user_or_404("nobody")
+
+
+@override_settings(LAST_SEEN_FLUSH_INTERVAL=3600, QUERY_BUDGET_MODE="raise")
+class TestIdentityMapRequests(TestCase):
+    """Tests for the duplicate user and profile lookups the identity map removes from views."""
+
+    def setUp(self):
+        """Set up test data."""
+        last_seen_buffer.clear()
+        read_marker_buffer.clear()
+        self.user = User.objects.create_user(username="testuser", password="testpassword")  # noqa: S106
+        self.other_user = User.objects.create_user(username="otheruser", password="otherpassword")  # noqa: S106
+        self.client.force_login(self.user)
+
+    def test_other_profile(self):
+        """Test that another user's profile loads each user and profile once."""
+        url = reverse("forum:user_profile", kwargs={"username": "otheruser"})
+        # The session, the viewer, the viewer's profile for the navigation bar, the profile's
+        # user with theirs and the activity window
+        with self.assertNumQueries(5):
+            response = self.client.get(url)
+        assert response.status_code == HTTP_SUCCESS  # noqa: S101
+
+    def test_own_profile(self):
+        """Test that the viewer's own profile reuses the user loaded for the session."""
+        url = reverse("forum:user_profile", kwargs={"username": "testuser"})
+        # The session, the viewer, their profile and the activity window
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        assert response.status_code == HTTP_SUCCESS  # noqa: S101
+
+    def test_edit_profile_form(self):
+        """Test that the edit form and the navigation bar share the request user's profile."""
+        # The session, the viewer and their profile
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("forum:edit_profile"))
+        assert response.status_code == HTTP_SUCCESS  # noqa: S101
+
+    def test_changes_seen_by_next_request(self):
+        """Test that a profile changed between requests isn't served from the previous request's map."""
+        url = reverse("forum:user_profile", kwargs={"username": "testuser"})
+        self.client.get(url)
+        Profile.objects.filter(user=self.user).update(bio="Changed in between")
+        self.assertContains(self.client.get(url), "Changed in between")
+
+    def test_model_backend_sessions_stay_logged_in(self):
+        """Test that sessions started with Django's ModelBackend are still authenticated."""
+        self.client.logout()
+        self.client.force_login(self.user, backend="django.contrib.auth.backends.ModelBackend")
+        response = self.client.get(reverse("forum:edit_profile"))
+        assert response.status_code == HTTP_SUCCESS  # noqa: S101
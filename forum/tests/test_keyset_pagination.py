@@ -0,0 +1,135 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.paginator import Page
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from forum.models import Topic
+from forum.pagination import InvalidCursor, KeysetPage, KeysetPaginator, decode_cursor, encode_cursor
+from categories.models import Category
+
+HTTP_SUCCESS = 200
+
+
+class TestKeysetPagination(TestCase):
+    """Tests for the keyset (cursor) pagination of topic listings."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(
+            username="testuser",
+            email="test@example.com",
+            password="testpassword",  # noqa: S106
+        )
+        self.category = Category.objects.create(
+            name="Test Category",
+            description="Test category description",
+        )
+        self.topics = [
+            Topic.objects.create(
+                subject=f"Topic {i}",
+                created_by=self.user,
+                category=self.category,
+            )
+            for i in range(12)
+        ]
+        # Give half of the topics the same timestamp to exercise the pk tie-breaker
+        Topic.objects.filter(pk__in=[t.pk for t in self.topics[:6]]).update(created_at=timezone.now())
+        self.newest_first = list(Topic.objects.order_by("-created_at", "-pk"))
+        self.client = Client()
+
+    def test_cursor_round_trip(self):
+        """Test that a cursor decodes to the position it was built from."""
+        topic = self.newest_first[0]
+        assert decode_cursor(encode_cursor(topic.created_at, topic.pk)) == (topic.created_at, topic.pk)  # noqa: S101
+
+    def test_invalid_cursor(self):
+        """Test that malformed cursors raise InvalidCursor."""
+        with self.assertRaises(InvalidCursor):
+            decode_cursor("not-a-cursor")
+
+    def test_out_of_range_cursor(self):
+        """Test that cursors with a primary key beyond 64 bits or a naive time raise InvalidCursor."""
+        now = timezone.now()
+        for token in (
+            encode_cursor(now, 2**64),
+            encode_cursor(now, -1),
+            encode_cursor(now.replace(tzinfo=None), 1),
+        ):
+            with self.assertRaises(InvalidCursor):
+                decode_cursor(token)
+
+    def test_walk_forward_and_back(self):
+        """Test that following next/previous cursors visits every topic exactly once, in order."""
+        paginator = KeysetPaginator(Topic.objects.all(), 5)
+
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(after=pages[-1].next_cursor))
+
+        assert [len(page) for page in pages] == [5, 5, 2]  # noqa: S101
+        assert not pages[0].has_previous()  # noqa: S101
+        assert [t for page in pages for t in page] == self.newest_first  # noqa: S101
+
+        previous = paginator.page(before=pages[2].previous_cursor)
+        assert list(previous) == list(pages[1])  # noqa: S101
+        first = paginator.page(before=previous.previous_cursor)
+        assert list(first) == list(pages[0])  # noqa: S101
+        assert not first.has_previous()  # noqa: S101
+
+    def test_before_cursor_newer_than_every_row(self):
+        """Test that a ?before= cursor past the newest topic delivers the first page."""
+        paginator = KeysetPaginator(Topic.objects.all(), 5)
+        future = encode_cursor(timezone.now() + timedelta(days=1), 0)
+
+        page = paginator.page(before=future)
+        assert list(page) == self.newest_first[:5]  # noqa: S101
+        assert not page.has_previous()  # noqa: S101
+        assert page.next_cursor is not None  # noqa: S101
+
+        empty = KeysetPage([], has_next=True, has_previous=True)
+        assert empty.next_cursor is None  # noqa: S101
+        assert empty.previous_cursor is None  # noqa: S101
+
+        response = self.client.get(reverse("forum:user_profile", kwargs={"username": "testuser"}), {"before": future})
+        self.assertEqual(response.status_code, HTTP_SUCCESS)
+
+    def test_small_listing_uses_numbered_pages(self):
+        """Test that listings under the threshold keep the numbered Paginator."""
+        response = self.client.get(reverse("forum:forum_index"))
+        self.assertEqual(response.status_code, HTTP_SUCCESS)
+        self.assertIsInstance(response.context["regular_topics_page"], Page)
+        self.assertFalse(response.context["keyset_pagination"])
+
+    @override_settings(FORUM_KEYSET_PAGINATION_THRESHOLD=10)
+    def test_large_listing_uses_keyset_pages(self):
+        """Test that listings over the threshold switch to keyset pagination."""
+        response = self.client.get(reverse("forum:forum_index"))
+        self.assertEqual(response.status_code, HTTP_SUCCESS)
+        page = response.context["regular_topics_page"]
+        self.assertIsInstance(page, KeysetPage)
+        self.assertTrue(response.context["keyset_pagination"])
+        self.assertContains(response, f"?after={page.next_cursor}")
+
+        response = self.client.get(
+            reverse("categories:topics_by_category", kwargs={"category_slug": self.category.slug})
+            + f"?after={page.next_cursor}",
+        )
+        self.assertEqual(response.status_code, HTTP_SUCCESS)
+        self.assertEqual(list(response.context["regular_topics_page"]), self.newest_first[5:10])
+        self.assertContains(response, "?before=")
+
+    def test_invalid_cursor_delivers_first_page(self):
+        """Test that a malformed ?after= token falls back to the first page."""
+        response = self.client.get(reverse("forum:forum_index") + "?after=garbage")
+        self.assertEqual(response.status_code, HTTP_SUCCESS)
+        self.assertEqual(list(response.context["regular_topics_page"]), self.newest_first[:5])
+
+    @override_settings(FORUM_KEYSET_PAGINATION_THRESHOLD=10)
+    def test_out_of_range_cursor_delivers_first_page(self):
+        """Test that a ?before= token with a primary key beyond 64 bits falls back to the first page."""
+        response = self.client.get(reverse("forum:forum_index"), {"before": encode_cursor(timezone.now(), 2**64)})
+        self.assertEqual(response.status_code, HTTP_SUCCESS)
+        self.assertEqual(list(response.context["regular_topics_page"]), self.newest_first[:5])
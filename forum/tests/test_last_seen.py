@@ -0,0 +1,103 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection
+from django.db.models import QuerySet
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from forum.last_seen import last_seen_buffer
+from forum.models import Profile
+
+
+@override_settings(LAST_SEEN_UPDATE_INTERVAL=300, LAST_SEEN_FLUSH_INTERVAL=3600)
+class TestLastSeen(TestCase):
+    """Tests for the throttled, buffered last_seen tracking."""
+
+    def setUp(self):
+        """Set up test data."""
+        last_seen_buffer.clear()
+        self.user = User.objects.create(username="testuser")
+        self.other_user = User.objects.create(username="otheruser")
+        self.client = Client()
+
+    def tearDown(self):
+        last_seen_buffer.clear()
+
+    def test_requests_do_not_write_profile(self):
+        """Test that browsing doesn't UPDATE the profile on every request."""
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("forum:forum_index"))
+            self.client.get(reverse("forum:forum_index"))
+
+        updates = [q["sql"] for q in queries if q["sql"].startswith('UPDATE "forum_profile"')]
+        assert updates == []  # noqa: S101
+        assert last_seen_buffer.get(self.user.pk) is not None  # noqa: S101
+
+    def test_touch_is_throttled(self):
+        """Test that a user is only recorded again once the interval has passed."""
+        now = timezone.now()
+        last_seen_buffer.touch(self.user.pk, now)
+        last_seen_buffer.touch(self.user.pk, now + timedelta(seconds=10))
+        assert last_seen_buffer.get(self.user.pk) == now  # noqa: S101
+
+        later = now + timedelta(seconds=301)
+        last_seen_buffer.touch(self.user.pk, later)
+        assert last_seen_buffer.get(self.user.pk) == later  # noqa: S101
+
+    def test_throttle_survives_flush(self):
+        """Test that flushing doesn't make recently recorded users get recorded again."""
+        now = timezone.now()
+        last_seen_buffer.touch(self.user.pk, now)
+        last_seen_buffer.flush()
+        last_seen_buffer.touch(self.user.pk, now + timedelta(seconds=10))
+        assert last_seen_buffer.get(self.user.pk) is None  # noqa: S101
+
+    def test_flush_writes_all_users_in_one_query(self):
+        """Test that pending times are written with a single UPDATE."""
+        now = timezone.now()
+        earlier = now - timedelta(minutes=1)
+        last_seen_buffer.touch(self.user.pk, now)
+        last_seen_buffer.touch(self.other_user.pk, earlier)
+
+        with self.assertNumQueries(1):
+            assert last_seen_buffer.flush() == 2  # noqa: S101
+
+        assert Profile.objects.get(user=self.user).last_seen == now  # noqa: S101
+        assert Profile.objects.get(user=self.other_user).last_seen == earlier  # noqa: S101
+        assert last_seen_buffer.get(self.user.pk) is None  # noqa: S101
+
+    def test_failed_flush_keeps_pending_times(self):
+        """Test that a failed write is logged and its times are written by the next flush."""
+        now = timezone.now()
+        last_seen_buffer.touch(self.user.pk, now)
+
+        with (
+            patch.object(QuerySet, "update", side_effect=OperationalError("database is locked")),
+            self.assertLogs("forum.last_seen", level="ERROR"),
+        ):
+            assert last_seen_buffer.flush() == 0  # noqa: S101
+        assert last_seen_buffer.get(self.user.pk) == now  # noqa: S101
+
+        assert last_seen_buffer.flush() == 1  # noqa: S101
+        assert Profile.objects.get(user=self.user).last_seen == now  # noqa: S101
+
+    def test_get_last_seen_reads_buffer_first(self):
+        """Test that Profile.get_last_seen() includes activity that hasn't been written yet."""
+        profile = Profile.objects.get(user=self.user)
+        assert profile.get_last_seen() is None  # noqa: S101
+
+        now = timezone.now()
+        last_seen_buffer.touch(self.user.pk, now)
+        assert profile.get_last_seen() == now  # noqa: S101
+
+    @override_settings(LAST_SEEN_FLUSH_INTERVAL=0)
+    def test_middleware_flushes_when_due(self):
+        """Test that the middleware writes the buffer once the flush interval has passed."""
+        self.client.force_login(self.user)
+        self.client.get(reverse("forum:forum_index"))
+        assert Profile.objects.get(user=self.user).last_seen is not None  # noqa: S101
@@ -0,0 +1,143 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from forum.live_updates import publish_post, topic_broker, topic_event_stream
+from forum.models import Post, Topic
+
+HTTP_NO_CONTENT = 204
+HTTP_NOT_FOUND = 404
+HTTP_SUCCESS = 200
+
+
+async def next_event(stream):
+    return await asyncio.wait_for(anext(stream), 2)
+
+
+class TestLiveUpdates(TestCase):
+    """Tests for the Server-Sent Events stream of new replies."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create(username="author")
+        self.topic = Topic.objects.create(subject="Live Topic", created_by=self.user)
+        self.posts = [
+            Post.objects.create(topic=self.topic, created_by=self.user, message=f"Post {number}")
+            for number in range(1, 4)
+        ]
+        self.events_url = reverse("forum:topic_events", kwargs={"topic_id": self.topic.pk})
+
+    async def create_post(self, message):
+        return await sync_to_async(Post.objects.create)(topic=self.topic, created_by=self.user, message=message)
+
+    def test_wsgi_requests_are_told_not_to_reconnect(self):
+        """Test that the stream isn't served from WSGI workers."""
+        response = self.client.get(self.events_url)
+        assert response.status_code == HTTP_NO_CONTENT  # noqa: S101
+
+    async def test_unknown_topic(self):
+        """Test that listening to a missing topic is a 404."""
+        response = await self.async_client.get(reverse("forum:topic_events", kwargs={"topic_id": 9999}))
+        assert response.status_code == HTTP_NOT_FOUND  # noqa: S101
+
+    async def test_stream_pushes_new_posts(self):
+        """Test that a published post reaches a listener as a rendered fragment."""
+        response = await self.async_client.get(self.events_url, {"after": 3})
+        assert response.status_code == HTTP_SUCCESS  # noqa: S101
+        assert response["Content-Type"] == "text/event-stream"  # noqa: S101
+        stream = aiter(response.streaming_content)
+        assert (await next_event(stream)).startswith(b"retry:")  # noqa: S101
+
+        post = await self.create_post("Hello, live readers")
+        assert await sync_to_async(publish_post)(post) == 1  # noqa: S101
+
+        event = (await next_event(stream)).decode()
+        assert event.startswith("id: 4\nevent: post\n")  # noqa: S101
+        assert f'id="post-{post.pk}"' in event  # noqa: S101
+        assert "Hello, live readers" in event  # noqa: S101
+
+    async def test_reconnect_replays_missed_posts(self):
+        """Test that a reconnecting listener gets the posts after its Last-Event-ID first."""
+        response = await self.async_client.get(self.events_url, {"after": 3}, headers={"last-event-id": "1"})
+        stream = aiter(response.streaming_content)
+        await next_event(stream)
+
+        replayed = [(await next_event(stream)).decode() for _ in range(2)]
+        assert replayed[0].startswith("id: 2\n")  # noqa: S101
+        assert replayed[1].startswith("id: 3\n")  # noqa: S101
+
+    async def test_posts_published_during_replay_are_sent_once(self):
+        """Test that a post both replayed and published isn't sent twice."""
+        stream = topic_event_stream(self.topic.pk, after=2)
+        await next_event(stream)
+        post = await self.create_post("Published while catching up")
+        await sync_to_async(publish_post)(post)
+
+        assert (await next_event(stream)).startswith("id: 3\n")  # noqa: S101
+        assert (await next_event(stream)).startswith("id: 4\n")  # noqa: S101
+        later = await self.create_post("Later")
+        await sync_to_async(publish_post)(later)
+        assert (await next_event(stream)).startswith("id: 5\n")  # noqa: S101
+        await stream.aclose()
+
+    @override_settings(LIVE_UPDATES_REPLAY_LIMIT=1)
+    async def test_listener_too_far_behind_reloads(self):
+        """Test that a listener missing more posts than the replay limit is told to reload."""
+        stream = topic_event_stream(self.topic.pk, after=1)
+        await next_event(stream)
+        assert "event: reload" in await next_event(stream)  # noqa: S101
+        with self.assertRaises(StopAsyncIteration):
+            await next_event(stream)
+        assert not topic_broker.has_subscribers(self.topic.pk)  # noqa: S101
+
+    @override_settings(LIVE_UPDATES_QUEUE_SIZE=1)
+    async def test_slow_listener_is_disconnected(self):
+        """Test that a listener whose queue overflows gets its stream closed."""
+        stream = topic_event_stream(self.topic.pk)
+        await next_event(stream)
+        for message in ("First", "Second"):
+            await sync_to_async(publish_post)(await self.create_post(message))
+        # Let the event loop deliver both events
+        await asyncio.sleep(0)
+
+        # The browser reconnects and catches up from its Last-Event-ID
+        with self.assertRaises(StopAsyncIteration):
+            await next_event(stream)
+
+    @override_settings(LIVE_UPDATES_HEARTBEAT=0.01)
+    async def test_idle_stream_sends_keep_alives(self):
+        """Test that an idle stream sends comments to keep the connection open."""
+        stream = topic_event_stream(self.topic.pk)
+        await next_event(stream)
+        assert (await next_event(stream)).startswith(":")  # noqa: S101
+        await stream.aclose()
+
+    async def test_closing_stream_unsubscribes(self):
+        """Test that a disconnected listener no longer receives posts."""
+        stream = topic_event_stream(self.topic.pk)
+        await next_event(stream)
+        assert topic_broker.has_subscribers(self.topic.pk)  # noqa: S101
+
+        await stream.aclose()
+        assert not topic_broker.has_subscribers(self.topic.pk)  # noqa: S101
+
+    def test_nothing_is_rendered_without_listeners(self):
+        """Test that publishing a post to a topic nobody listens to does nothing."""
+        assert publish_post(self.posts[0]) == 0  # noqa: S101
+
+    async def test_new_post_view_publishes(self):
+        """Test that replying through the site pushes the reply to listeners."""
+        subscription = topic_broker.subscribe(self.topic.pk)
+        try:
+            await sync_to_async(self.client.force_login)(self.user)
+            url = reverse("forum:new_post", kwargs={"topic_id": self.topic.pk})
+            await sync_to_async(self.client.post)(url, {"message": "Replying live"})
+
+            sequence, message = await asyncio.wait_for(subscription.queue.get(), 2)
+            assert sequence == 4  # noqa: S101, PLR2004
+            assert "Replying live" in message  # noqa: S101
+        finally:
+            topic_broker.unsubscribe(self.topic.pk, subscription)
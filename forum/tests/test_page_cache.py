@@ -0,0 +1,179 @@
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from categories.models import Category
+from forum import page_cache
+from forum.models import Post, Topic
+
+HTTP_SUCCESS = 200
+
+
+@override_settings(FORUM_PAGE_CACHE_TIMEOUT=300, LAST_SEEN_FLUSH_INTERVAL=3600)
+class TestPageCache(TestCase):
+    """Tests for the anonymous page cache and its signal-driven invalidation."""
+
+    def setUp(self):
+        """Set up test data."""
+        cache.clear()
+        self.user = User.objects.create(username="testuser")
+        self.category = Category.objects.create(name="Test Category")
+        self.topic = Topic.objects.create(subject="Test Topic", created_by=self.user, category=self.category)
+        self.post = Post.objects.create(message="First post", topic=self.topic, created_by=self.user)
+        self.other_topic = Topic.objects.create(subject="Other Topic", created_by=self.user)
+        self.client = Client()
+
+        self.topic_url = reverse("forum:topic_detail", kwargs={"topic_id": self.topic.pk})
+        self.other_topic_url = reverse("forum:topic_detail", kwargs={"topic_id": self.other_topic.pk})
+        self.index_url = reverse("forum:forum_index")
+        self.category_url = reverse("categories:topics_by_category", kwargs={"category_slug": self.category.slug})
+
+    def tearDown(self):
+        cache.clear()
+
+    def _is_cached(self, url):
+        """Requests the URL and returns whether it was served without touching the database."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        assert response.status_code == HTTP_SUCCESS  # noqa: S101
+        return len(queries) == 0
+
+    def _warm(self, *urls):
+        for url in urls:
+            self.client.get(url)
+            assert self._is_cached(url)  # noqa: S101
+
+    def test_anonymous_pages_are_cached(self):
+        """Test that a second anonymous request is served from the cache with the same content."""
+        first = self.client.get(self.topic_url)
+        assert self._is_cached(self.topic_url)  # noqa: S101
+        second = self.client.get(self.topic_url)
+        assert second.content == first.content  # noqa: S101
+        self.assertContains(second, "First post")
+
+    def test_pages_of_a_listing_are_cached_separately(self):
+        """Test that the query string is part of the cache key."""
+        self.client.get(self.index_url)
+        assert not self._is_cached(f"{self.index_url}?page=2")  # noqa: S101
+
+    def test_authenticated_users_bypass_cache(self):
+        """Test that logged-in users always get a freshly rendered page."""
+        self.client.get(self.topic_url)
+        self.client.force_login(self.user)
+        response = self.client.get(self.topic_url)
+        self.assertContains(response, "Logout")
+
+    def test_new_reply_expires_topic_and_listings_only(self):
+        """Test that a reply expires its topic, the index and its category, but not other topics."""
+        self._warm(self.topic_url, self.other_topic_url, self.index_url, self.category_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(message="A new reply", topic=self.topic, created_by=self.user)
+
+        assert not self._is_cached(self.topic_url)  # noqa: S101
+        assert not self._is_cached(self.index_url)  # noqa: S101
+        assert not self._is_cached(self.category_url)  # noqa: S101
+        assert self._is_cached(self.other_topic_url)  # noqa: S101
+        self.assertContains(self.client.get(self.topic_url), "A new reply")
+
+    def test_pages_expire_when_the_write_commits(self):
+        """Test that pages expire only once the write commits, so the old page can't be cached as new."""
+        self._warm(self.topic_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(message="A new reply", topic=self.topic, created_by=self.user)
+            assert self._is_cached(self.topic_url)  # noqa: S101
+
+        assert not self._is_cached(self.topic_url)  # noqa: S101
+
+    def test_post_edit_expires_topic_only(self):
+        """Test that editing a post only expires its topic's pages."""
+        self._warm(self.topic_url, self.index_url)
+
+        self.post.message = "Edited post"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.save()
+
+        assert not self._is_cached(self.topic_url)  # noqa: S101
+        assert self._is_cached(self.index_url)  # noqa: S101
+        self.assertContains(self.client.get(self.topic_url), "Edited post")
+
+    def test_topic_move_expires_both_categories(self):
+        """Test that moving a topic expires the listings of its old and new category."""
+        new_category = Category.objects.create(name="New Category")
+        new_category_url = reverse("categories:topics_by_category", kwargs={"category_slug": new_category.slug})
+        self._warm(self.category_url, new_category_url)
+
+        topic = Topic.objects.get(pk=self.topic.pk)
+        topic.category = new_category
+        with self.captureOnCommitCallbacks(execute=True):
+            topic.save()
+
+        assert not self._is_cached(self.category_url)  # noqa: S101
+        assert not self._is_cached(new_category_url)  # noqa: S101
+
+    def test_category_change_expires_everything(self):
+        """Test that renaming a category expires every page, since category names are shown everywhere."""
+        self._warm(self.topic_url, self.index_url)
+
+        self.category.name = "Renamed Category"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.save()
+
+        assert not self._is_cached(self.topic_url)  # noqa: S101
+        assert not self._is_cached(self.index_url)  # noqa: S101
+
+    def test_profile_change_expires_pages(self):
+        """Test that changing a field shown next to posts expires the cached pages."""
+        self._warm(self.topic_url)
+
+        profile = User.objects.get(pk=self.user.pk).profile
+        profile.user_title = "Moderator"
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+
+        assert not self._is_cached(self.topic_url)  # noqa: S101
+        self.assertContains(self.client.get(self.topic_url), "Moderator")
+
+    def test_unrelated_profile_save_keeps_pages(self):
+        """Test that saving a user without changing what pages show (e.g. on login) keeps them cached."""
+        self._warm(self.topic_url)
+
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = "Test"
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+
+        assert self._is_cached(self.topic_url)  # noqa: S101
+
+    def test_stampede_serves_previous_copy(self):
+        """Test that while another request re-renders an expired page, the previous copy is served."""
+        self.client.get(self.topic_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(message="A new reply", topic=self.topic, created_by=self.user)
+
+        # Another request is re-rendering the page
+        scopes = [*page_cache.GLOBAL_SCOPES, f"topic:{self.topic.pk}"]
+        _, lock_key, _ = page_cache._page_keys(self.topic_url, scopes)  # noqa: SLF001
+        cache.add(lock_key, 1)
+
+        assert self._is_cached(self.topic_url)  # noqa: S101
+        self.assertNotContains(self.client.get(self.topic_url), "A new reply")
+
+        cache.delete(lock_key)
+        self.assertContains(self.client.get(self.topic_url), "A new reply")
+
+    @patch.object(page_cache, "PAGE_CACHE_WAIT", 0.1)
+    def test_stampede_without_previous_copy_renders_after_waiting(self):
+        """Test that a request that can't get the lock and has no copy to serve renders the page itself."""
+        scopes = [*page_cache.GLOBAL_SCOPES, f"topic:{self.topic.pk}"]
+        _, lock_key, _ = page_cache._page_keys(self.topic_url, scopes)  # noqa: SLF001
+        cache.add(lock_key, 1)
+
+        response = self.client.get(self.topic_url)
+        self.assertContains(response, "First post")
@@ -0,0 +1,90 @@
+import io
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from forum.models import Post, Topic
+from forum.rendering import render_markdown, render_message
+from categories.models import Category
+
+HTTP_SUCCESS = 200
+
+
+class TestPostRendering(TestCase):
+    """Tests for the stored, pre-rendered post HTML."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create(username="testuser")
+        self.category = Category.objects.create(
+            name="Test Category",
+            description="Test category description",
+        )
+        self.topic = Topic.objects.create(
+            subject="Test Topic",
+            created_by=self.user,
+            category=self.category,
+        )
+        self.client = Client()
+
+    def test_html_rendered_on_create(self):
+        """Test that the message is escaped and rendered when the post is created."""
+        post = Post.objects.create(
+            message="Line one\nLine <b>two</b>",
+            topic=self.topic,
+            created_by=self.user,
+        )
+        assert post.message_html == "Line one<br>Line &lt;b&gt;two&lt;/b&gt;"  # noqa: S101
+        assert post.renderer_version == "plain:1"  # noqa: S101
+
+    def test_html_rendered_on_edit(self):
+        """Test that editing the message, also with update_fields, renders it again."""
+        post = Post.objects.create(message="Before", topic=self.topic, created_by=self.user)
+        post.message = "After"
+        post.save(update_fields=["message"])
+
+        post.refresh_from_db()
+        assert post.message_html == "After"  # noqa: S101
+
+    def test_markdown_renderer(self):
+        """Test the Markdown-like renderer's supported syntax and its escaping."""
+        html = render_markdown("**bold** *em* `x*y*`\n> quote\n```\n<code>\n```")
+        assert html == (  # noqa: S101
+            "<strong>bold</strong> <em>em</em> <code>x*y*</code><br>"
+            "<blockquote>quote</blockquote>"
+            "<pre><code>&lt;code&gt;</code></pre>"
+        )
+
+    @override_settings(FORUM_POST_RENDERER="markdown")
+    def test_rendered_html_is_sanitized(self):
+        """Test that the output of a renderer is passed through the sanitizer."""
+        html, version = render_message("**<script>alert(1)</script>**")
+        assert "<script>" not in html  # noqa: S101
+        assert version == "markdown:1"  # noqa: S101
+
+    def test_outdated_posts_render_lazily(self):
+        """Test that posts with an outdated renderer version are rendered on display."""
+        post = Post.objects.create(message="**Hello**", topic=self.topic, created_by=self.user)
+
+        with override_settings(FORUM_POST_RENDERER="markdown"):
+            assert post.get_message_html() == "<strong>Hello</strong>"  # noqa: S101
+            response = self.client.get(reverse("forum:topic_detail", kwargs={"topic_id": self.topic.id}))
+            self.assertEqual(response.status_code, HTTP_SUCCESS)
+            self.assertContains(response, "<strong>Hello</strong>")
+
+    def test_rerender_posts_command(self):
+        """Test that the command updates only posts with an outdated renderer version."""
+        old = Post.objects.create(message="**Old**", topic=self.topic, created_by=self.user)
+        with override_settings(FORUM_POST_RENDERER="markdown"):
+            current = Post.objects.create(message="**Current**", topic=self.topic, created_by=self.user)
+
+            out = io.StringIO()
+            call_command("rerender_posts", chunk_size=1, stdout=out)
+            assert "re-rendered 1 posts" in out.getvalue()  # noqa: S101
+
+        old.refresh_from_db()
+        current.refresh_from_db()
+        assert old.message_html == "<strong>Old</strong>"  # noqa: S101
+        assert old.renderer_version == current.renderer_version == "markdown:1"  # noqa: S101
@@ -1,6 +1,8 @@
 # import pytest
 # from django.core.exceptions import ValidationError
 
+from unittest.mock import patch
+
 from django.contrib.auth.models import User
 from django.test import TestCase
 
@@ -76,3 +78,20 @@ class TestProfileModel(TestCase):
         # Check that the script tag is removed, but don't check for the content
         # as bleach might handle it differently
         assert "<script>" not in sanitized  # noqa: S101
+
+    def test_sanitized_signature_stored_on_save(self):
+        """Test that the sanitized signature is stored with the profile, also with update_fields."""
+        self.profile.signature = "<b>Bold</b><img src=x onerror=alert(1)>"
+        self.profile.save(update_fields=["signature"])
+
+        self.profile.refresh_from_db()
+        assert self.profile.signature_html == "<b>Bold</b>"  # noqa: S101
+
+    def test_get_sanitized_signature_does_not_clean_again(self):
+        """Test that reading the sanitized signature is a field read, not another bleach pass."""
+        self.profile.signature = "<em>Hi</em>"
+        self.profile.save()
+
+        with patch("forum.models.sanitize_signature") as sanitize:
+            assert self.profile.get_sanitized_signature() == "<em>Hi</em>"  # noqa: S101
+        sanitize.assert_not_called()
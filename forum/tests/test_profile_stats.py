@@ -0,0 +1,134 @@
+import io
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from forum.models import Post, Profile, Topic
+from forum.views import PROFILE_ACTIVITY_PER_PAGE
+
+HTTP_SUCCESS = 200
+
+
+class TestProfileStats(TestCase):
+    """Tests for the denormalized activity statistics on the Profile model."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(username="testuser", password="testpassword")  # noqa: S106
+        self.other_user = User.objects.create_user(username="otheruser", password="otherpassword")  # noqa: S106
+        self.topic = Topic.objects.create(subject="Test Topic", created_by=self.user)
+
+    def stats(self, user):
+        """Returns the stored statistics of the user's profile."""
+        return Profile.objects.values_list("topic_count", "post_count", "last_post_at").get(user=user)
+
+    def test_topics_and_posts_counted(self):
+        """Test that creating topics and posts bumps their author's counters."""
+        Post.objects.create(message="First", topic=self.topic, created_by=self.user)
+        reply = Post.objects.create(message="Reply", topic=self.topic, created_by=self.other_user)
+        latest = Post.objects.create(message="Again", topic=self.topic, created_by=self.user)
+
+        assert self.stats(self.user) == (1, 2, latest.created_at)  # noqa: S101
+        assert self.stats(self.other_user) == (0, 1, reply.created_at)  # noqa: S101
+
+    def test_post_deletion_updates_stats(self):
+        """Test that deleting the user's latest post falls back to their previous one."""
+        first = Post.objects.create(message="First", topic=self.topic, created_by=self.user)
+        Post.objects.create(message="Second", topic=self.topic, created_by=self.user).delete()
+
+        assert self.stats(self.user) == (1, 1, first.created_at)  # noqa: S101
+
+    def test_topic_deletion_updates_stats(self):
+        """Test that deleting a topic counts down its author's topics and everyone's posts in it."""
+        Post.objects.create(message="First", topic=self.topic, created_by=self.user)
+        Post.objects.create(message="Reply", topic=self.topic, created_by=self.other_user)
+        self.topic.delete()
+
+        assert self.stats(self.user) == (0, 0, None)  # noqa: S101
+        assert self.stats(self.other_user) == (0, 0, None)  # noqa: S101
+
+    def test_saving_stale_profile_keeps_counters(self):
+        """Test that saving a user whose profile was loaded before a new post doesn't write back the old counters."""
+        user = User.objects.select_related("profile").get(pk=self.user.pk)
+        Post.objects.create(message="First", topic=self.topic, created_by=self.user)
+        user.profile.bio = "Hello"
+        user.save()
+
+        assert self.stats(self.user)[:2] == (1, 1)  # noqa: S101
+        assert Profile.objects.get(user=self.user).bio == "Hello"  # noqa: S101
+
+    def test_rebuild_profile_stats(self):
+        """Test that the management command repairs drifted counters."""
+        post = Post.objects.create(message="First", topic=self.topic, created_by=self.user)
+        Profile.objects.update(topic_count=7, post_count=7, last_post_at=None)
+
+        out = io.StringIO()
+        call_command("rebuild_profile_stats", "--chunk-size", "1", stdout=out)
+        assert "2 profiles" in out.getvalue()  # noqa: S101
+        assert self.stats(self.user) == (1, 1, post.created_at)  # noqa: S101
+        assert self.stats(self.other_user) == (0, 0, None)  # noqa: S101
+
+
+class TestProfileActivity(TestCase):
+    """Tests for the keyset-paginated activity lists on the profile page."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(username="testuser", password="testpassword")  # noqa: S106
+        self.topics = [
+            Topic.objects.create(subject=f"Topic {index}", created_by=self.user)
+            for index in range(PROFILE_ACTIVITY_PER_PAGE + 2)
+        ]
+        self.post = Post.objects.create(message="Only post", topic=self.topics[0], created_by=self.user)
+        self.profile_url = reverse("forum:user_profile", kwargs={"username": "testuser"})
+
+    def test_profile_shows_counters_and_first_window(self):
+        """Test that the profile shows the stored totals and only the newest window of topics."""
+        response = self.client.get(self.profile_url)
+        assert response.status_code == HTTP_SUCCESS  # noqa: S101
+        self.assertContains(response, f"Topics Started ({PROFILE_ACTIVITY_PER_PAGE + 2})")
+        self.assertContains(response, "Posts (1)")
+        assert len(response.context["activity_page"]) == PROFILE_ACTIVITY_PER_PAGE  # noqa: S101
+        self.assertContains(response, self.topics[-1].subject)
+        self.assertNotContains(response, ">Topic 0<")
+        self.assertNotContains(response, "Only post")
+
+    def test_older_window(self):
+        """Test that the older link's cursor loads the rest of the topics."""
+        page = self.client.get(self.profile_url).context["activity_page"]
+        response = self.client.get(self.profile_url, {"tab": "topics", "after": page.next_cursor})
+        subjects = [topic.subject for topic in response.context["activity_page"]]
+        assert subjects == ["Topic 1", "Topic 0"]  # noqa: S101
+        assert response.context["activity_page"].has_previous()  # noqa: S101
+
+    def test_posts_tab(self):
+        """Test that the posts tab lists the user's posts instead of their topics."""
+        response = self.client.get(self.profile_url, {"tab": "posts"})
+        self.assertContains(response, "Only post")
+        self.assertContains(response, self.post.get_absolute_url())
+        self.assertNotContains(response, self.topics[-1].subject)
+
+    def test_activity_fragment(self):
+        """Test that a window of the activity is served on its own."""
+        response = self.client.get(reverse("forum:user_activity", kwargs={"username": "testuser", "tab": "posts"}))
+        assert response.status_code == HTTP_SUCCESS  # noqa: S101
+        self.assertContains(response, "Only post")
+        self.assertNotContains(response, "<html")
+
+        with self.assertNumQueries(2):
+            # The user with their profile, shared by the visibility check and the view, and the window
+            self.client.get(reverse("forum:user_activity", kwargs={"username": "testuser", "tab": "topics"}))
+
+    def test_activity_fragment_respects_visibility(self):
+        """Test that the activity of a hidden profile isn't served to other users."""
+        Profile.objects.filter(user=self.user).update(profile_visibility="hidden")
+        response = self.client.get(reverse("forum:user_activity", kwargs={"username": "testuser", "tab": "topics"}))
+        assert response.status_code == 302  # noqa: S101, PLR2004
+
+    def test_invalid_cursor_shows_newest_window(self):
+        """Test that a malformed cursor falls back to the newest window."""
+        response = self.client.get(self.profile_url, {"after": "not-a-cursor"})
+        assert response.status_code == HTTP_SUCCESS  # noqa: S101
+        self.assertContains(response, self.topics[-1].subject)
@@ -0,0 +1,182 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from forum.decorators import QueryBudgetExceeded, query_budget
+from forum.last_seen import last_seen_buffer
+from forum.read_tracking import read_marker_buffer
+from forum.view_counts import topic_view_buffer
+from forum.models import Post, Topic, TopicReadMarker
+from categories.models import Category
+
+HTTP_SUCCESS = 200
+
+# Row counts each view is seeded with; the number of queries must not change between them
+SEED_SIZES = (1, 10, 100)
+
+
+# Large flush intervals keep last_seen, view count and read marker writes buffered by
+# earlier tests out of the counts
+@override_settings(
+    QUERY_BUDGET_MODE="raise",
+    LAST_SEEN_FLUSH_INTERVAL=3600,
+    VIEW_COUNT_FLUSH_INTERVAL=3600,
+    READ_MARKER_FLUSH_INTERVAL=3600,
+)
+class TestQueryCounts(TestCase):
+    """
+    N+1 regression tests: every read view must run the same number of queries whether it
+    shows 1, 10 or 100 rows, and must stay within the budget declared with @query_budget.
+    """
+
+    def setUp(self):
+        """Set up test data."""
+        last_seen_buffer.clear()
+        topic_view_buffer.clear()
+        read_marker_buffer.clear()
+        self.user = User.objects.create(username="viewer")
+        self.category = Category.objects.create(
+            name="Test Category",
+            description="Test category description",
+        )
+        self.topic = Topic.objects.create(
+            subject="Test Topic",
+            created_by=self.user,
+            category=self.category,
+        )
+        self.client = Client()
+        self.seeded = 0
+
+    def _seed_users(self, count):
+        """Creates 'count' distinct authors so per-author lookups show up as N+1 queries."""
+        return [User.objects.create(username=f"author{self.seeded + i}") for i in range(count)]
+
+    def _query_counts(self, url, seed):
+        """Seeds up to each of SEED_SIZES rows with 'seed' and returns the queries per request."""
+        counts = []
+        for size in SEED_SIZES:
+            seed(size - self.seeded)
+            self.seeded = size
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, HTTP_SUCCESS)
+            counts.append(len(queries))
+        return counts
+
+    def _assert_constant(self, url, seed):
+        counts = self._query_counts(url, seed)
+        self.assertEqual(len(set(counts)), 1, f"Query count grows with rows: {dict(zip(SEED_SIZES, counts))}")
+
+    def _seed_sticky_topics(self, count):
+        for author in self._seed_users(count):
+            topic = Topic.objects.create(
+                subject=f"Sticky by {author.username}",
+                created_by=author,
+                category=self.category,
+                is_sticky=True,
+            )
+            Post.objects.create(message="First post", topic=topic, created_by=author)
+
+    def test_forum_index(self):
+        """Test that the forum index doesn't query per topic row."""
+        self._assert_constant(reverse("forum:forum_index"), self._seed_sticky_topics)
+
+    def test_forum_index_authenticated(self):
+        """Test that the forum index doesn't query per topic row for logged-in users."""
+        self.client.force_login(self.user)
+        self._assert_constant(reverse("forum:forum_index"), self._seed_sticky_topics)
+
+    def test_topics_by_category(self):
+        """Test that a category's topic listing doesn't query per topic row."""
+        url = reverse("categories:topics_by_category", kwargs={"category_slug": self.category.slug})
+        self._assert_constant(url, self._seed_sticky_topics)
+
+    def test_category_list(self):
+        """Test that the category list doesn't query per category."""
+
+        def seed(count):
+            for i in range(count):
+                Category.objects.create(name=f"Category {self.seeded + i}")
+
+        self._assert_constant(reverse("categories:category_list"), seed)
+
+    def test_topic_detail(self):
+        """Test that a topic doesn't query per post."""
+
+        def seed(count):
+            for author in self._seed_users(count):
+                Post.objects.create(message="A reply", topic=self.topic, created_by=author)
+
+        url = reverse("forum:topic_detail", kwargs={"topic_id": self.topic.id})
+        self._assert_constant(url, seed)
+
+    @override_settings(READ_MARKER_FLUSH_INTERVAL=0)
+    def test_topic_detail_authenticated(self):
+        """Test that a topic read by a logged-in user stays within budget while their read marker is flushed."""
+        self.client.force_login(self.user)
+
+        def seed(count):
+            for author in self._seed_users(count):
+                Post.objects.create(message="A reply", topic=self.topic, created_by=author)
+
+        url = reverse("forum:topic_detail", kwargs={"topic_id": self.topic.id})
+        self._assert_constant(url, seed)
+        # The marker was written after the responses rather than left pending
+        assert TopicReadMarker.objects.filter(user=self.user, topic=self.topic).exists()  # noqa: S101
+        assert read_marker_buffer.get(self.user.pk, self.topic.pk) is None  # noqa: S101
+
+    def test_topic_detail_with_deleted_posts(self):
+        """Test that a topic with deleted posts doesn't query per post and stays within budget."""
+        self.client.force_login(self.user)
+
+        def seed(count):
+            for i, author in enumerate(self._seed_users(count)):
+                post = Post.objects.create(message="A reply", topic=self.topic, created_by=author)
+                if i % 2 == 0:
+                    post.delete()
+
+        url = reverse("forum:topic_detail", kwargs={"topic_id": self.topic.id})
+        self._assert_constant(url, seed)
+
+    def test_user_profile(self):
+        """Test that a profile doesn't query per topic or post of the user."""
+
+        def seed(count):
+            for i in range(count):
+                topic = Topic.objects.create(
+                    subject=f"Topic {self.seeded + i}",
+                    created_by=self.user,
+                    category=self.category,
+                )
+                Post.objects.create(message="A post", topic=topic, created_by=self.user)
+
+        url = reverse("forum:user_profile", kwargs={"username": self.user.username})
+        self._assert_constant(url, seed)
+
+    def test_query_budget_raises(self):
+        """Test that query_budget raises when a view goes over its budget."""
+
+        @query_budget(1)
+        def greedy_view(request):
+            list(User.objects.all())
+            list(Topic.objects.all())
+
+        assert greedy_view.query_budget == 1  # noqa: S101
+        with self.assertRaises(QueryBudgetExceeded):
+            greedy_view(None)
+
+    @override_settings(QUERY_BUDGET_MODE="log")
+    def test_query_budget_logs(self):
+        """Test that query_budget only logs in 'log' mode."""
+
+        @query_budget(1)
+        def greedy_view(request):
+            list(User.objects.all())
+            list(Topic.objects.all())
+            return "response"
+
+        with self.assertLogs("forum.decorators", level="WARNING") as logs:
+            assert greedy_view(None) == "response"  # noqa: S101
+        assert "exceeding its budget of 1" in logs.output[0]  # noqa: S101
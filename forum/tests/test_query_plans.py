@@ -0,0 +1,133 @@
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from categories.models import Category
+from forum.models import POSTS_PER_PAGE, Post, Topic
+from forum.pagination import encode_cursor
+
+HTTP_SUCCESS = 200
+
+# Tables whose reads must go through an index; small lookup tables like sessions are
+# always read by primary key anyway
+INDEXED_TABLES = ("forum_topic", "forum_post", "forum_profile", "categories_category")
+
+
+@contextmanager
+def capture_statements():
+    """Records the (sql, params) of every SELECT run on the default connection."""
+    statements = []
+
+    def wrapper(execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith("SELECT"):
+            statements.append((sql, params))
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(wrapper):
+        yield statements
+
+
+def plan_problems(sql, params):
+    """
+    Runs EXPLAIN QUERY PLAN on a statement and returns the plan lines that show a full
+    table scan of an INDEXED_TABLES table or a temporary B-tree sort.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        details = [row[-1] for row in cursor.fetchall()]
+
+    problems = []
+    for detail in details:
+        if "USE TEMP B-TREE" in detail:
+            problems.append(detail)
+        elif detail.startswith("SCAN ") and "USING" not in detail:
+            table = detail.split()[1]
+            if table in INDEXED_TABLES:
+                problems.append(detail)
+    return problems
+
+
+class TestQueryPlans(TestCase):
+    """
+    Plan regression tests: every query the read views run must be answered from an index,
+    without full scans of the forum tables or temporary B-tree sorts.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test data."""
+        cls.user = User.objects.create(username="viewer")
+        cls.category = Category.objects.create(name="Test Category")
+        for i in range(5):
+            topic = Topic.objects.create(
+                subject=f"Topic {i}",
+                created_by=cls.user,
+                category=cls.category,
+                is_sticky=i == 0,
+            )
+            for j in range(3):
+                Post.objects.create(message=f"Post {j}", topic=topic, created_by=cls.user)
+        cls.topic = topic
+
+    def setUp(self):
+        """Set up the test client."""
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def assert_plans_use_indexes(self, url):
+        with capture_statements() as statements:
+            response = self.client.get(url)
+        assert response.status_code == HTTP_SUCCESS  # noqa: S101
+
+        problems = []
+        for sql, params in statements:
+            problems.extend(f"{sql}\n    -> {detail}" for detail in plan_problems(sql, params))
+        if problems:
+            self.fail(f"Queries of {url} don't use an index:\n" + "\n".join(problems))
+
+    def test_forum_index(self):
+        """Test the forum index's sticky and regular topic listings."""
+        self.assert_plans_use_indexes(reverse("forum:forum_index"))
+
+    def test_forum_index_keyset_page(self):
+        """Test the forum index's keyset-paginated topic listing."""
+        cursor = encode_cursor(self.topic.created_at, self.topic.pk)
+        self.assert_plans_use_indexes(f"{reverse('forum:forum_index')}?after={cursor}")
+        self.assert_plans_use_indexes(f"{reverse('forum:forum_index')}?before={cursor}")
+
+    def test_forum_index_most_viewed(self):
+        """Test the forum index's most viewed listing."""
+        self.assert_plans_use_indexes(f"{reverse('forum:forum_index')}?sort=views")
+
+    def test_category_list(self):
+        """Test the category index."""
+        self.assert_plans_use_indexes(reverse("categories:category_list"))
+
+    def test_topics_by_category(self):
+        """Test a category's sticky and regular topic listings."""
+        url = reverse("categories:topics_by_category", kwargs={"category_slug": self.category.slug})
+        self.assert_plans_use_indexes(url)
+        cursor = encode_cursor(self.topic.created_at, self.topic.pk)
+        self.assert_plans_use_indexes(f"{url}?after={cursor}")
+
+    def test_topic_detail(self):
+        """Test a topic's page of posts."""
+        self.assert_plans_use_indexes(reverse("forum:topic_detail", kwargs={"topic_id": self.topic.pk}))
+
+    def test_topic_detail_with_deleted_posts(self):
+        """Test a page of a topic whose earlier posts and last post were deleted."""
+        topic = Topic.objects.create(subject="Gaps", created_by=self.user, category=self.category)
+        posts = [
+            Post.objects.create(message=f"Post {i}", topic=topic, created_by=self.user)
+            for i in range(POSTS_PER_PAGE * 2 + 2)
+        ]
+        for post in [*posts[POSTS_PER_PAGE - 2 : POSTS_PER_PAGE + 1], posts[-1]]:
+            post.delete()
+        self.assert_plans_use_indexes(f"{reverse('forum:topic_detail', kwargs={'topic_id': topic.pk})}?page=3")
+
+    def test_user_profile(self):
+        """Test a user's profile with their topics and posts."""
+        self.assert_plans_use_indexes(reverse("forum:user_profile", kwargs={"username": self.user.username}))
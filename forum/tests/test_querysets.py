@@ -0,0 +1,61 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from forum.models import Post, Topic
+from categories.models import Category
+
+
+class TestQuerySets(TestCase):
+    """Tests for the listing/thread helpers on the Topic and Post querysets."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create(username="testuser")
+        self.user.profile.bio = "A long biography"
+        self.user.profile.signature = "A signature"
+        self.user.profile.user_title = "Regular"
+        self.user.profile.save()
+        self.category = Category.objects.create(
+            name="Test Category",
+            description="Test category description",
+        )
+        self.topic = Topic.objects.create(
+            subject="Test Topic",
+            created_by=self.user,
+            category=self.category,
+        )
+        self.post = Post.objects.create(
+            message="Test message content",
+            topic=self.topic,
+            created_by=self.user,
+        )
+
+    def test_topic_for_listing(self):
+        """Test that for_listing() fetches author, profile and category in one query."""
+        with self.assertNumQueries(1):
+            topic = Topic.objects.for_listing().get(pk=self.topic.pk)
+            assert topic.created_by.username == "testuser"  # noqa: S101
+            assert topic.created_by.profile.user_title == "Regular"  # noqa: S101
+            assert topic.category.slug == self.category.slug  # noqa: S101
+
+        deferred = topic.created_by.profile.get_deferred_fields()
+        assert {"bio", "signature"} <= deferred  # noqa: S101
+
+    def test_post_for_thread(self):
+        """Test that for_thread() fetches author and profile, keeping the sanitized signature."""
+        with self.assertNumQueries(1):
+            post = Post.objects.for_thread().get(pk=self.post.pk)
+            assert post.created_by.profile.signature_html == "A signature"  # noqa: S101
+
+        assert {"bio", "signature"} <= post.created_by.profile.get_deferred_fields()  # noqa: S101
+
+    def test_post_for_listing(self):
+        """Test that for_listing() on posts fetches the topic in the same query."""
+        with self.assertNumQueries(1):
+            post = Post.objects.for_listing().get(pk=self.post.pk)
+            assert post.topic.subject == "Test Topic"  # noqa: S101
+
+    def test_related_manager_has_helpers(self):
+        """Test that the helpers are available through related managers too."""
+        assert list(self.category.topics.for_listing()) == [self.topic]  # noqa: S101
+        assert list(self.topic.posts.for_thread()) == [self.post]  # noqa: S101
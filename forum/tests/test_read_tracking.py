@@ -0,0 +1,208 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import OperationalError, connection
+from django.db.models import QuerySet
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from categories.models import Category
+from forum.models import POSTS_PER_PAGE, CategoryReadMarker, Post, Topic, TopicReadMarker
+from forum.read_tracking import read_marker_buffer
+
+HTTP_SUCCESS = 200
+UNREAD_INDICATOR = 'class="unread-indicator"'
+
+
+@override_settings(READ_MARKER_FLUSH_INTERVAL=3600, READ_MARKER_FLUSH_THRESHOLD=500)
+class TestReadTracking(TestCase):
+    """Tests for per-user read markers and unread indicators."""
+
+    def setUp(self):
+        """Set up test data."""
+        cache.clear()
+        read_marker_buffer.clear()
+        joined = timezone.now() - timedelta(days=1)
+        self.author = User.objects.create(username="author", date_joined=joined)
+        self.reader = User.objects.create(username="reader", date_joined=joined)
+        self.category = Category.objects.create(name="General", slug="general")
+        self.topic = Topic.objects.create(subject="Test Topic", created_by=self.author, category=self.category)
+        self.posts = [
+            Post.objects.create(topic=self.topic, created_by=self.author, message=f"Post {number}")
+            for number in range(1, 4)
+        ]
+        self.index_url = reverse("forum:forum_index")
+        self.category_url = reverse("categories:topics_by_category", kwargs={"category_slug": "general"})
+        self.topic_url = reverse("forum:topic_detail", kwargs={"topic_id": self.topic.pk})
+        self.unread_url = reverse("forum:first_unread_post", kwargs={"topic_id": self.topic.pk})
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def tearDown(self):
+        read_marker_buffer.clear()
+        cache.clear()
+
+    def test_new_topic_is_unread(self):
+        """Test that topics with posts the user hasn't read are flagged in both listings."""
+        self.assertContains(self.client.get(self.index_url), UNREAD_INDICATOR)
+        self.assertContains(self.client.get(self.category_url), UNREAD_INDICATOR)
+
+    def test_anonymous_visitors_see_no_indicators(self):
+        """Test that logged-out visitors get no unread indicators."""
+        self.client.logout()
+        self.assertNotContains(self.client.get(self.index_url), UNREAD_INDICATOR)
+
+    def test_topics_older_than_the_user_are_read(self):
+        """Test that topics without activity since the user joined aren't flagged."""
+        User.objects.filter(pk=self.reader.pk).update(date_joined=timezone.now())
+        self.assertNotContains(self.client.get(self.index_url), UNREAD_INDICATOR)
+
+    def test_unread_flags_come_from_the_listing_query(self):
+        """Test that the read markers of a whole page are fetched within the topic queries."""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.index_url)
+
+        marker_queries = [q["sql"] for q in queries if "forum_topicreadmarker" in q["sql"]]
+        assert marker_queries  # noqa: S101
+        assert all('FROM "forum_topic" ' in sql for sql in marker_queries)  # noqa: S101
+
+    def test_viewing_topic_marks_it_read(self):
+        """Test that a topic the user has viewed is no longer flagged, before any write."""
+        response = self.client.get(self.topic_url)
+        assert response.status_code == HTTP_SUCCESS  # noqa: S101
+        self.assertContains(response, '<span class="unread-indicator">New</span>', count=3)
+
+        assert read_marker_buffer.get(self.reader.pk, self.topic.pk) == 3  # noqa: S101
+        assert not TopicReadMarker.objects.exists()  # noqa: S101
+        self.assertNotContains(self.client.get(self.index_url), UNREAD_INDICATOR)
+        self.assertNotContains(self.client.get(self.topic_url), "unread-indicator")
+
+    def test_new_reply_makes_topic_unread_again(self):
+        """Test that a reply after the user's marker flags the topic and the new post."""
+        self.client.get(self.topic_url)
+        Post.objects.create(topic=self.topic, created_by=self.author, message="Post 4")
+
+        self.assertContains(self.client.get(self.index_url), UNREAD_INDICATOR)
+        self.assertContains(self.client.get(self.topic_url), '<span class="unread-indicator">New</span>', count=1)
+
+    def test_own_reply_is_read(self):
+        """Test that replying moves the replier's marker past their own post."""
+        self.client.get(self.topic_url)
+        self.client.post(reverse("forum:new_post", kwargs={"topic_id": self.topic.pk}), {"message": "My reply"})
+
+        assert read_marker_buffer.get(self.reader.pk, self.topic.pk) == 4  # noqa: S101
+        self.assertNotContains(self.client.get(self.index_url), UNREAD_INDICATOR)
+
+    def test_paging_coalesces_marker_writes(self):
+        """Test that paging through a topic buffers a single, furthest marker."""
+        for number in range(4, POSTS_PER_PAGE + 6):
+            Post.objects.create(topic=self.topic, created_by=self.author, message=f"Post {number}")
+
+        self.client.get(self.topic_url)
+        assert read_marker_buffer.get(self.reader.pk, self.topic.pk) == POSTS_PER_PAGE  # noqa: S101
+        self.client.get(self.topic_url, {"page": 2})
+        # Going back doesn't move the marker backwards
+        self.client.get(self.topic_url)
+        assert read_marker_buffer.get(self.reader.pk, self.topic.pk) == POSTS_PER_PAGE + 5  # noqa: S101
+
+        with CaptureQueriesContext(connection) as queries:
+            assert read_marker_buffer.flush() == 1  # noqa: S101
+        assert len([q for q in queries if q["sql"].startswith("INSERT")]) == 1  # noqa: S101
+        marker = TopicReadMarker.objects.get(user=self.reader, topic=self.topic)
+        assert marker.last_read_sequence == POSTS_PER_PAGE + 5  # noqa: S101
+
+    def test_flush_updates_existing_marker(self):
+        """Test that flushing moves an existing marker forward instead of adding a row."""
+        TopicReadMarker.objects.create(user=self.reader, topic=self.topic, last_read_sequence=1)
+        self.assertContains(self.client.get(self.index_url), UNREAD_INDICATOR)
+
+        self.client.get(self.topic_url)
+        read_marker_buffer.flush()
+
+        assert TopicReadMarker.objects.get().last_read_sequence == 3  # noqa: S101
+        self.assertNotContains(self.client.get(self.index_url), UNREAD_INDICATOR)
+
+    def test_flush_never_moves_marker_back(self):
+        """Test that a flush doesn't overwrite a marker another process moved further meanwhile."""
+        self.client.get(self.topic_url)
+        TopicReadMarker.objects.create(user=self.reader, topic=self.topic, last_read_sequence=5)
+
+        read_marker_buffer.flush()
+        assert TopicReadMarker.objects.get().last_read_sequence == 5  # noqa: S101, PLR2004
+
+    def test_failed_flush_keeps_pending_markers(self):
+        """Test that a failed write is logged and its markers are written by the next flush."""
+        read_marker_buffer.advance(self.reader.pk, self.topic.pk, 2)
+
+        with (
+            patch.object(QuerySet, "update", side_effect=OperationalError("database is locked")),
+            self.assertLogs("forum.read_tracking", level="ERROR"),
+        ):
+            assert read_marker_buffer.flush() == 0  # noqa: S101
+        assert not TopicReadMarker.objects.exists()  # noqa: S101
+        read_marker_buffer.advance(self.reader.pk, self.topic.pk, 1)
+        assert read_marker_buffer.get(self.reader.pk, self.topic.pk) == 2  # noqa: S101, PLR2004
+
+        assert read_marker_buffer.flush() == 1  # noqa: S101
+        assert TopicReadMarker.objects.get().last_read_sequence == 2  # noqa: S101, PLR2004
+
+    @override_settings(READ_MARKER_FLUSH_INTERVAL=0)
+    def test_markers_flushed_after_the_response(self):
+        """Test that a due flush is written once the topic page has been rendered."""
+        self.client.get(self.topic_url)
+        assert TopicReadMarker.objects.get().last_read_sequence == 3  # noqa: S101, PLR2004
+        assert read_marker_buffer.get(self.reader.pk, self.topic.pk) is None  # noqa: S101
+
+    def test_topic_read_after_newest_reply_deleted(self):
+        """Test that reading every remaining post marks the topic read after its newest reply is deleted."""
+        self.posts[-1].delete()
+
+        self.client.get(self.topic_url)
+        self.assertNotContains(self.client.get(self.index_url), UNREAD_INDICATOR)
+        read_marker_buffer.flush()
+        self.assertNotContains(self.client.get(self.index_url), UNREAD_INDICATOR)
+
+    def test_flush_skips_deleted_topics(self):
+        """Test that markers of topics deleted before the flush are dropped."""
+        self.client.get(self.topic_url)
+        self.topic.delete()
+
+        assert read_marker_buffer.flush() == 0  # noqa: S101
+        assert not TopicReadMarker.objects.exists()  # noqa: S101
+
+    def test_first_unread_post(self):
+        """Test that the unread link jumps to the first post after the user's marker."""
+        TopicReadMarker.objects.create(user=self.reader, topic=self.topic, last_read_sequence=1)
+
+        response = self.client.get(self.unread_url)
+        self.assertRedirects(response, self.posts[1].get_absolute_url(), fetch_redirect_response=False)
+
+    def test_first_unread_post_when_all_read(self):
+        """Test that the unread link of a fully read topic goes to the newest post."""
+        TopicReadMarker.objects.create(user=self.reader, topic=self.topic, last_read_sequence=3)
+
+        response = self.client.get(self.unread_url)
+        self.assertRedirects(response, self.posts[2].get_absolute_url(), fetch_redirect_response=False)
+
+    def test_mark_category_read(self):
+        """Test that marking a category read clears its topics until someone replies."""
+        response = self.client.post(reverse("categories:mark_category_read", kwargs={"category_slug": "general"}))
+        self.assertRedirects(response, self.category_url, fetch_redirect_response=False)
+        assert CategoryReadMarker.objects.filter(user=self.reader, category=self.category).exists()  # noqa: S101
+        assert not TopicReadMarker.objects.exists()  # noqa: S101
+        self.assertNotContains(self.client.get(self.category_url), UNREAD_INDICATOR)
+
+        reply = Post.objects.create(topic=self.topic, created_by=self.author, message="Post 4")
+        self.assertContains(self.client.get(self.category_url), UNREAD_INDICATOR)
+        response = self.client.get(self.unread_url)
+        self.assertRedirects(response, reply.get_absolute_url(), fetch_redirect_response=False)
+
+    def test_mark_category_read_requires_post(self):
+        """Test that the mark-read URL doesn't change anything on GET."""
+        response = self.client.get(reverse("categories:mark_category_read", kwargs={"category_slug": "general"}))
+        assert response.status_code == 405  # noqa: S101, PLR2004
+        assert not CategoryReadMarker.objects.exists()  # noqa: S101
@@ -0,0 +1,41 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from forum.signals import configure_sqlite_connection
+
+
+class TestSQLitePragmas(TestCase):
+    """Tests for the connection_created handler applying SQLITE_PRAGMAS."""
+
+    def _pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    @override_settings(SQLITE_PRAGMAS={"cache_size": -4321})
+    def test_pragmas_applied_to_connection(self):
+        """Test that every configured PRAGMA is executed on the connection."""
+        configure_sqlite_connection(sender=type(connection), connection=connection)
+        assert self._pragma("cache_size") == -4321  # noqa: S101
+
+    @override_settings(SQLITE_PRAGMAS={})
+    def test_no_pragmas_by_default(self):
+        """Test that an empty SQLITE_PRAGMAS leaves the connection untouched."""
+        before = self._pragma("cache_size")
+        configure_sqlite_connection(sender=type(connection), connection=connection)
+        assert self._pragma("cache_size") == before  # noqa: S101
+
+
+class TestBenchmarkSQLiteCommand(SimpleTestCase):
+    """Tests for the benchmark_sqlite management command."""
+
+    def test_reports_both_profiles(self):
+        """Test that the command runs and reports the default and production profiles."""
+        out = StringIO()
+        call_command("benchmark_sqlite", seconds=0.2, readers=2, writers=1, stdout=out)
+        output = out.getvalue()
+        assert "default" in output  # noqa: S101
+        assert "production" in output  # noqa: S101
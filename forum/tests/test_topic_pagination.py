@@ -0,0 +1,126 @@
+from django.contrib.auth.models import User
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from forum.models import POSTS_PER_PAGE, Post, Topic
+from categories.models import Category
+
+HTTP_SUCCESS = 200
+HTTP_REDIRECT = 302
+
+
+class TestTopicPagination(TestCase):
+    """Tests for post sequence numbers, topic pages and post permalinks."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create(username="testuser")
+        self.category = Category.objects.create(
+            name="Test Category",
+            description="Test category description",
+        )
+        self.topic = Topic.objects.create(
+            subject="Test Topic",
+            created_by=self.user,
+            category=self.category,
+        )
+        # Two full pages plus a partial third page
+        self.posts = [
+            Post.objects.create(message=f"Message {i}", topic=self.topic, created_by=self.user)
+            for i in range(POSTS_PER_PAGE * 2 + 5)
+        ]
+        self.client = Client()
+
+    def _topic_url(self, page=None):
+        url = reverse("forum:topic_detail", kwargs={"topic_id": self.topic.id})
+        return f"{url}?page={page}" if page else url
+
+    def test_sequences_are_assigned_in_order(self):
+        """Test that posts are numbered 1..n within their topic."""
+        assert [post.sequence for post in self.posts] == list(range(1, len(self.posts) + 1))  # noqa: S101
+
+        other_topic = Topic.objects.create(subject="Other", created_by=self.user, category=self.category)
+        assert Post.objects.create(message="x", topic=other_topic, created_by=self.user).sequence == 1  # noqa: S101
+
+    def test_sequences_are_not_reused(self):
+        """Test that deleting the last post doesn't free its sequence number."""
+        self.posts[-1].delete()
+        post = Post.objects.create(message="New", topic=self.topic, created_by=self.user)
+        assert post.sequence == len(self.posts) + 1  # noqa: S101
+
+    def test_topic_detail_pages(self):
+        """Test that each page of a topic shows its window of posts."""
+        response = self.client.get(self._topic_url())
+        self.assertEqual(response.status_code, HTTP_SUCCESS)
+        self.assertEqual(list(response.context["posts"]), self.posts[:POSTS_PER_PAGE])
+
+        response = self.client.get(self._topic_url(3))
+        self.assertEqual(list(response.context["posts"]), self.posts[POSTS_PER_PAGE * 2 :])
+        self.assertContains(response, "?page=2")
+
+    def test_topic_detail_invalid_page(self):
+        """Test that out-of-range pages deliver the last page and non-integers the first."""
+        response = self.client.get(self._topic_url(999))
+        self.assertEqual(response.context["page"].number, 3)
+
+        response = self.client.get(self._topic_url("abc"))
+        self.assertEqual(response.context["page"].number, 1)
+
+    def test_page_of_deleted_posts_is_skipped(self):
+        """Test that a page whose posts were all deleted shows the next page, and is skipped going back."""
+        for post in self.posts[POSTS_PER_PAGE : POSTS_PER_PAGE * 2]:
+            post.delete()
+
+        response = self.client.get(self._topic_url(2))
+        self.assertEqual(response.status_code, HTTP_SUCCESS)
+        self.assertEqual(response.context["page"].number, 3)
+        self.assertEqual(list(response.context["posts"]), self.posts[POSTS_PER_PAGE * 2 :])
+        self.assertNotContains(response, "There are no posts in this topic yet.")
+        # "previous" leads to page 1 rather than back to the empty page 2
+        self.assertEqual(response.context["previous_page_number"], 1)
+        self.assertContains(response, '<a href="?page=1" title="Previous Page">')
+
+        response = self.client.get(self._topic_url(1))
+        self.assertEqual(list(response.context["posts"]), self.posts[:POSTS_PER_PAGE])
+
+    def test_deleted_last_page_is_dropped(self):
+        """Test that pages after the last remaining post aren't offered."""
+        for post in self.posts[POSTS_PER_PAGE * 2 - 3 :]:
+            post.delete()
+
+        response = self.client.get(self._topic_url(3))
+        self.assertEqual(response.context["page"].number, 2)
+        self.assertEqual(response.context["page"].paginator.num_pages, 2)
+        self.assertEqual(list(response.context["posts"]), self.posts[POSTS_PER_PAGE : POSTS_PER_PAGE * 2 - 3])
+        self.assertFalse(response.context["page"].has_next())
+
+    def test_post_permalink_redirects_to_page(self):
+        """Test that /forum/post/<id>/ redirects to the page and anchor of the post."""
+        post = self.posts[POSTS_PER_PAGE]  # First post of page 2
+        response = self.client.get(reverse("forum:post_permalink", kwargs={"post_id": post.id}))
+        self.assertEqual(response.status_code, HTTP_REDIRECT)
+        self.assertEqual(response.url, f"{self._topic_url(2)}#post-{post.id}")
+
+        post = self.posts[0]
+        response = self.client.get(reverse("forum:post_permalink", kwargs={"post_id": post.id}))
+        self.assertEqual(response.url, f"{self._topic_url()}#post-{post.id}")
+
+    def test_new_post_redirects_to_last_page(self):
+        """Test that replying lands on the page that shows the reply."""
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse("forum:new_post", kwargs={"topic_id": self.topic.id}),
+            {"message": "A new reply"},
+        )
+        reply = Post.objects.get(message="A new reply")
+        self.assertEqual(response.url, f"{self._topic_url(3)}#post-{reply.id}")
+
+    def test_edit_post_redirects_to_post_page(self):
+        """Test that editing a post lands on the page that shows it."""
+        self.client.force_login(self.user)
+        post = self.posts[POSTS_PER_PAGE + 1]
+        response = self.client.post(
+            reverse("forum:edit_post", kwargs={"post_id": post.id}),
+            {"message": "Edited"},
+        )
+        self.assertEqual(response.url, f"{self._topic_url(2)}#post-{post.id}")
@@ -0,0 +1,115 @@
+import io
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from forum.models import Post, Topic
+from categories.models import Category
+
+HTTP_SUCCESS = 200
+
+
+class TestTopicStats(TestCase):
+    """Tests for the denormalized post statistics on the Topic model."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(
+            username="testuser",
+            email="test@example.com",
+            password="testpassword",  # noqa: S106
+        )
+        self.other_user = User.objects.create_user(
+            username="otheruser",
+            email="other@example.com",
+            password="otherpassword",  # noqa: S106
+        )
+        self.category = Category.objects.create(
+            name="Test Category",
+            description="Test category description",
+        )
+        self.topic = Topic.objects.create(
+            subject="Test Topic",
+            created_by=self.user,
+            category=self.category,
+        )
+        self.client = Client()
+
+    def test_new_topic_has_no_posts(self):
+        """Test that a topic starts with empty statistics."""
+        assert self.topic.post_count == 0  # noqa: S101
+        assert self.topic.last_post_at is None  # noqa: S101
+        assert self.topic.last_post_by is None  # noqa: S101
+
+    def test_post_creation_updates_stats(self):
+        """Test that creating posts increments the counter and records the last poster."""
+        Post.objects.create(message="First", topic=self.topic, created_by=self.user)
+        reply = Post.objects.create(message="Reply", topic=self.topic, created_by=self.other_user)
+
+        self.topic.refresh_from_db()
+        assert self.topic.post_count == 2  # noqa: S101
+        assert self.topic.last_post_at == reply.created_at  # noqa: S101
+        assert self.topic.last_post_by == self.other_user  # noqa: S101
+
+    def test_post_deletion_updates_stats(self):
+        """Test that deleting the latest post falls back to the previous one."""
+        first = Post.objects.create(message="First", topic=self.topic, created_by=self.user)
+        reply = Post.objects.create(message="Reply", topic=self.topic, created_by=self.other_user)
+
+        reply.delete()
+        self.topic.refresh_from_db()
+        assert self.topic.post_count == 1  # noqa: S101
+        assert self.topic.last_post_at == first.created_at  # noqa: S101
+        assert self.topic.last_post_by == self.user  # noqa: S101
+
+        first.delete()
+        self.topic.refresh_from_db()
+        assert self.topic.post_count == 0  # noqa: S101
+        assert self.topic.last_post_at is None  # noqa: S101
+        assert self.topic.last_post_by is None  # noqa: S101
+
+    def test_bulk_delete_updates_stats(self):
+        """Test that queryset deletes (as used by the admin) keep the counter in sync."""
+        for i in range(3):
+            Post.objects.create(message=f"Post {i}", topic=self.topic, created_by=self.user)
+
+        Post.objects.filter(topic=self.topic).delete()
+        self.topic.refresh_from_db()
+        assert self.topic.post_count == 0  # noqa: S101
+
+    def test_new_topic_view_counts_first_post(self):
+        """Test that a topic created through the view counts its first post."""
+        self.client.login(username="testuser", password="testpassword")  # noqa: S106
+        self.client.post(
+            reverse("forum:new_topic"),
+            {"subject": "Counted Topic", "category": self.category.id, "message": "Hello"},
+        )
+        topic = Topic.objects.get(subject="Counted Topic")
+        assert topic.post_count == 1  # noqa: S101
+        assert topic.last_post_by == self.user  # noqa: S101
+
+    def test_rebuild_topic_stats_command(self):
+        """Test that the management command repairs counters that have drifted."""
+        Post.objects.create(message="First", topic=self.topic, created_by=self.user)
+        reply = Post.objects.create(message="Reply", topic=self.topic, created_by=self.other_user)
+        Topic.objects.filter(pk=self.topic.pk).update(post_count=42, last_post_at=None, last_post_by=None)
+
+        out = io.StringIO()
+        call_command("rebuild_topic_stats", chunk_size=1, stdout=out)
+        assert "1 topics" in out.getvalue()  # noqa: S101
+
+        self.topic.refresh_from_db()
+        assert self.topic.post_count == 2  # noqa: S101
+        assert self.topic.last_post_at == reply.created_at  # noqa: S101
+        assert self.topic.last_post_by == self.other_user  # noqa: S101
+
+    def test_forum_index_shows_post_count(self):
+        """Test that the listing renders the stored counter."""
+        Post.objects.create(message="First", topic=self.topic, created_by=self.user)
+        Post.objects.create(message="Reply", topic=self.topic, created_by=self.user)
+
+        response = self.client.get(reverse("forum:forum_index"))
+        self.assertEqual(response.status_code, HTTP_SUCCESS)
+        self.assertContains(response, "(2 posts, ")
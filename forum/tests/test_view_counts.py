@@ -0,0 +1,169 @@
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import OperationalError, connection
+from django.db.models import QuerySet
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from categories.models import Category
+from forum.models import Topic
+from forum.page_cache import get_generations
+from forum.view_counts import topic_view_buffer
+
+HTTP_SUCCESS = 200
+
+
+@override_settings(VIEW_COUNT_FLUSH_INTERVAL=3600, VIEW_COUNT_FLUSH_THRESHOLD=500, VIEW_COUNT_DEDUP_WINDOW=1800)
+class TestViewCounts(TestCase):
+    """Tests for the buffered, deduplicated topic view counters."""
+
+    def setUp(self):
+        """Set up test data."""
+        topic_view_buffer.clear()
+        self.user = User.objects.create(username="testuser")
+        self.topic = Topic.objects.create(subject="Test Topic", created_by=self.user)
+        self.other_topic = Topic.objects.create(subject="Other Topic", created_by=self.user)
+        self.topic_url = reverse("forum:topic_detail", kwargs={"topic_id": self.topic.pk})
+        self.client = Client()
+
+    def tearDown(self):
+        topic_view_buffer.clear()
+
+    def test_views_are_buffered(self):
+        """Test that viewing a topic doesn't write to the database."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.topic_url)
+
+        assert response.status_code == HTTP_SUCCESS  # noqa: S101
+        assert not any(q["sql"].startswith("UPDATE") for q in queries)  # noqa: S101
+        assert topic_view_buffer.get(self.topic.pk) == 1  # noqa: S101
+
+    def test_repeat_views_are_deduplicated(self):
+        """Test that the same visitor viewing a topic again within the window counts once."""
+        self.client.get(self.topic_url)
+        self.client.get(self.topic_url)
+        Client(REMOTE_ADDR="10.0.0.2").get(self.topic_url)
+
+        assert topic_view_buffer.get(self.topic.pk) == 2  # noqa: S101
+
+    @override_settings(VIEW_COUNT_DEDUP_WINDOW=0)
+    def test_views_count_again_after_window(self):
+        """Test that a view counts again once the deduplication window has passed."""
+        self.client.get(self.topic_url)
+        self.client.get(self.topic_url)
+
+        assert topic_view_buffer.get(self.topic.pk) == 2  # noqa: S101
+
+    def test_logged_in_views_are_deduplicated_per_session(self):
+        """Test that logged-in visitors are identified by their session."""
+        self.client.force_login(self.user)
+        self.client.get(self.topic_url)
+        self.client.get(self.topic_url)
+
+        assert topic_view_buffer.get(self.topic.pk) == 1  # noqa: S101
+
+    def test_missing_topic_is_not_counted(self):
+        """Test that only successful responses count."""
+        self.client.get(reverse("forum:topic_detail", kwargs={"topic_id": 9999}))
+        assert topic_view_buffer.get(9999) == 0  # noqa: S101
+
+    def test_flush_writes_all_topics_in_one_update(self):
+        """Test that the buffered views of all topics are added with a single UPDATE."""
+        topic_view_buffer.record(self.topic.pk, "a")
+        topic_view_buffer.record(self.topic.pk, "b")
+        topic_view_buffer.record(self.other_topic.pk, "a")
+        Topic.objects.filter(pk=self.topic.pk).update(view_count=10)
+
+        with CaptureQueriesContext(connection) as queries:
+            assert topic_view_buffer.flush() == 2  # noqa: S101
+
+        assert len([q for q in queries if q["sql"].startswith("UPDATE")]) == 1  # noqa: S101
+        self.topic.refresh_from_db()
+        self.other_topic.refresh_from_db()
+        assert self.topic.view_count == 12  # noqa: S101
+        assert self.other_topic.view_count == 1  # noqa: S101
+        assert topic_view_buffer.get(self.topic.pk) == 0  # noqa: S101
+
+    def test_failed_flush_keeps_pending_views(self):
+        """Test that a failed write is logged and its views are added by the next flush."""
+        topic_view_buffer.record(self.topic.pk, "a")
+        topic_view_buffer.record(self.topic.pk, "b")
+
+        with (
+            patch.object(QuerySet, "update", side_effect=OperationalError("database is locked")),
+            self.assertLogs("forum.view_counts", level="ERROR"),
+        ):
+            assert topic_view_buffer.flush() == 0  # noqa: S101
+        topic_view_buffer.record(self.topic.pk, "c")
+        assert topic_view_buffer.get(self.topic.pk) == 3  # noqa: S101, PLR2004
+
+        assert topic_view_buffer.flush() == 1  # noqa: S101
+        assert Topic.objects.get(pk=self.topic.pk).view_count == 3  # noqa: S101, PLR2004
+
+    def test_flush_expires_listings(self):
+        """Test that a flush expires the index and the flushed topics' categories, not the topics."""
+        category = Category.objects.create(name="Test Category")
+        Topic.objects.filter(pk=self.topic.pk).update(category=category)
+        scopes = ["index", f"category:{category.slug}", f"topic:{self.topic.pk}"]
+        before = get_generations(scopes)
+
+        topic_view_buffer.record(self.topic.pk, "a")
+        topic_view_buffer.flush()
+
+        index, category_listing, topic = get_generations(scopes)
+        assert index != before[0]  # noqa: S101
+        assert category_listing != before[1]  # noqa: S101
+        assert topic == before[2]  # noqa: S101
+
+    @override_settings(VIEW_COUNT_FLUSH_THRESHOLD=2)
+    def test_flush_on_size_threshold(self):
+        """Test that the buffer is flushed once enough topics have pending views."""
+        topic_view_buffer.record(self.topic.pk, "a")
+        topic_view_buffer.flush_if_due()
+        assert Topic.objects.get(pk=self.topic.pk).view_count == 0  # noqa: S101
+
+        topic_view_buffer.record(self.other_topic.pk, "a")
+        topic_view_buffer.flush_if_due()
+        assert Topic.objects.get(pk=self.topic.pk).view_count == 1  # noqa: S101
+        assert Topic.objects.get(pk=self.other_topic.pk).view_count == 1  # noqa: S101
+
+    @override_settings(VIEW_COUNT_FLUSH_INTERVAL=0)
+    def test_flush_on_interval(self):
+        """Test that a view is written once the flush interval has passed."""
+        self.client.get(self.topic_url)
+        assert Topic.objects.get(pk=self.topic.pk).view_count == 1  # noqa: S101
+
+    @override_settings(FORUM_PAGE_CACHE_TIMEOUT=300)
+    def test_cached_pages_are_counted(self):
+        """Test that views served from the anonymous page cache still count."""
+        cache.clear()
+        self.client.get(self.topic_url)
+        Client(REMOTE_ADDR="10.0.0.2").get(self.topic_url)
+        cache.clear()
+
+        assert topic_view_buffer.get(self.topic.pk) == 2  # noqa: S101
+
+    def test_most_viewed_listing(self):
+        """Test that the forum index can list topics by view count."""
+        Topic.objects.filter(pk=self.other_topic.pk).update(view_count=5)
+
+        most_viewed = list(Topic.objects.most_viewed())
+        assert most_viewed[0] == self.other_topic  # noqa: S101
+
+        response = self.client.get(reverse("forum:forum_index"), {"sort": "views"})
+        content = response.content.decode()
+        assert content.index("Other Topic") < content.index("Test Topic")  # noqa: S101
+        self.assertContains(response, "5 views")
+
+    def test_most_viewed_listing_pages(self):
+        """Test that the most viewed listing gets numbered pages keeping the sort order."""
+        for index in range(6):
+            Topic.objects.create(subject=f"Topic {index}", created_by=self.user, view_count=index)
+
+        response = self.client.get(reverse("forum:forum_index"), {"sort": "views", "page": "2"})
+        assert not response.context["keyset_pagination"]  # noqa: S101
+        assert response.context["regular_topics_page"].number == 2  # noqa: S101, PLR2004
+        self.assertContains(response, "page=1&amp;sort=views")
@@ -0,0 +1,144 @@
+# forum/threads.py
+
+# The pages of a topic's posts, shared by the topic_detail view and its async version so
+# the two build the same page.
+
+from asgiref.sync import sync_to_async
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db.models import Max, Min, OuterRef, Q, Subquery
+from django.shortcuts import aget_object_or_404, get_object_or_404
+
+from .decorators import load_user
+from .models import POSTS_PER_PAGE, Post, Topic, get_sequence_page_number
+from .read_tracking import flag_unread_posts, mark_page_read
+
+
+def _thread_topics(user):
+    # with_read_state() also fetches how far the user has read the topic, and the
+    # category is shown above the posts
+    return Topic.objects.select_related("category").with_read_state(user)
+
+
+def _sequence_paginator(last_sequence):
+    # Pages are windows of post sequence numbers, so paginate the range of sequence
+    # numbers rather than the posts themselves. This needs no COUNT(*) and no OFFSET,
+    # however long the topic gets.
+    return Paginator(range(1, last_sequence + 1), POSTS_PER_PAGE)
+
+
+def _thread_page(request, topic):
+    """Returns the paginator of the topic's pages and the requested page, falling back to the first or last page."""
+    paginator = _sequence_paginator(topic.post_sequence)
+    try:
+        page = paginator.page(request.GET.get("page"))
+    except PageNotAnInteger:
+        page = paginator.page(1)
+    except EmptyPage:
+        page = paginator.page(paginator.num_pages)
+    return paginator, page
+
+
+def _has_deleted_posts(topic):
+    # Sequence numbers of deleted posts aren't handed out again, so once posts are deleted
+    # some windows are short and some may be empty
+    return topic.post_count < topic.post_sequence
+
+
+def _window_bounds(page):
+    """
+    Aggregates of a topic's posts locating the first post at or after the page's window
+    and the topic's last post, for _skip_empty_window().
+    """
+    start = page.object_list[0] if page.object_list else 1
+    return {
+        "next_sequence": Min("sequence", filter=Q(sequence__gte=start)),
+        "last_sequence": Max("sequence"),
+    }
+
+
+def _skip_empty_window(paginator, page, bounds):
+    """
+    Returns the paginator and page to show instead of 'page' in a topic with deleted posts:
+    pages end at the topic's last post, and a window whose posts were all deleted shows the
+    next page that has posts, or the last page if there's none.
+
+    Skipping forward keeps the "next" link going forward; the "previous" link skips empty
+    windows itself (see _page_posts()).
+    """
+    if bounds["last_sequence"] is None:
+        # No posts left at all
+        return paginator, page
+    paginator = _sequence_paginator(bounds["last_sequence"])
+    sequence = bounds["next_sequence"] or bounds["last_sequence"]
+    return paginator, paginator.page(get_sequence_page_number(sequence))
+
+
+def _page_posts(topic, page):
+    """
+    Returns the posts of the page, oldest first. for_thread() joins in each post's author
+    and profile so the template doesn't query per post.
+
+    In a topic with deleted posts each post also gets the sequence number of the last post
+    before the page as 'previous_sequence', so the "previous" link can skip empty windows
+    without another query.
+    """
+    sequences = page.object_list
+    posts = topic.posts.for_thread()
+    if sequences:
+        posts = posts.filter(sequence__range=(sequences[0], sequences[-1]))
+        if page.has_previous() and _has_deleted_posts(topic):
+            before = Post.objects.filter(topic=OuterRef("topic"), sequence__lt=sequences[0])
+            posts = posts.annotate(previous_sequence=Subquery(before.order_by("-sequence").values("sequence")[:1]))
+    return posts.order_by("sequence")
+
+
+def _previous_page_number(topic, page, posts):
+    if not page.has_previous():
+        return None
+    if not _has_deleted_posts(topic):
+        return page.previous_page_number()
+    previous_sequence = posts[0].previous_sequence if posts else None
+    return get_sequence_page_number(previous_sequence) if previous_sequence else None
+
+
+def _thread_context(topic, paginator, page, posts):
+    return {
+        "topic": topic,
+        "posts": posts,
+        "page": page,
+        # The nearest earlier page that has posts, or None
+        "previous_page_number": _previous_page_number(topic, page, posts),
+        "elided_page_range": paginator.get_elided_page_range(number=page.number, on_each_side=2, on_ends=1),
+        "PAGINATOR_ELLIPSIS": paginator.ELLIPSIS,
+    }
+
+
+def topic_thread(request, topic_id):
+    """
+    Returns the template context of a page of the topic's posts, raising Http404 if there's
+    no such topic.
+
+    The posts the user hasn't seen yet are flagged, then their read marker is moved past
+    the page. The marker write is buffered, so paging through a topic costs one write, not
+    one per page.
+    """
+    topic = get_object_or_404(_thread_topics(request.user), pk=topic_id)
+    paginator, page = _thread_page(request, topic)
+    if _has_deleted_posts(topic):
+        paginator, page = _skip_empty_window(paginator, page, topic.posts.aggregate(**_window_bounds(page)))
+    posts = flag_unread_posts(request.user, topic, list(_page_posts(topic, page)))
+    mark_page_read(request.user, topic, page, posts)
+    return _thread_context(topic, paginator, page, posts)
+
+
+async def atopic_thread(request, topic_id):
+    """Async version of topic_thread(), fetching the topic and posts through the async ORM."""
+    user = await load_user(request)
+    topic = await aget_object_or_404(_thread_topics(user), pk=topic_id)
+    paginator, page = _thread_page(request, topic)
+    if _has_deleted_posts(topic):
+        paginator, page = _skip_empty_window(paginator, page, await topic.posts.aaggregate(**_window_bounds(page)))
+    posts = flag_unread_posts(user, topic, [post async for post in _page_posts(topic, page)])
+    # Buffered, but bumps the user's page scope through the cache
+    await sync_to_async(mark_page_read)(user, topic, page, posts)
+    return _thread_context(topic, paginator, page, posts)
@@ -1,18 +1,22 @@
 # forum/urls.py
 
-from django.urls import path
+from django.conf import settings
+from django.urls import path, re_path
 
-from . import views  # Import views from the current directory (forum app)
+from . import async_views, views  # Import views from the current directory (forum app)
 
 # Define a namespace for easier URL referencing in templates (optional but good practice)
 app_name = "forum"
 
+# The read-only pages are served by the async views when FORUM_ASYNC_VIEWS is on
+read_views = async_views if getattr(settings, "FORUM_ASYNC_VIEWS", False) else views
+
 urlpatterns = [
     # Example: /forum/
-    path("", views.forum_index, name="forum_index"),
+    path("", read_views.forum_index, name="forum_index"),
 
     # Example: /forum/topic/5/ (where 5 is the topic_id)
-    path("topic/<int:topic_id>/", views.topic_detail, name="topic_detail"),
+    path("topic/<int:topic_id>/", read_views.topic_detail, name="topic_detail"),
 
     # Example: /forum/new_topic/
     path("new_topic/", views.new_topic, name="new_topic"),
@@ -20,6 +24,15 @@ urlpatterns = [
     # Example: /forum/topic/5/new_post/
     path("topic/<int:topic_id>/new_post/", views.new_post, name="new_post"),
 
+    # Example: /forum/topic/5/events/ (Server-Sent Events stream of new replies)
+    path("topic/<int:topic_id>/events/", views.topic_events, name="topic_events"),
+
+    # Example: /forum/topic/5/unread/ (redirects to the first post the user hasn't read)
+    path("topic/<int:topic_id>/unread/", views.first_unread_post, name="first_unread_post"),
+
+    # Example: /forum/post/7/ (redirects to the topic page showing post 7)
+    path("post/<int:post_id>/", views.post_permalink, name="post_permalink"),
+
     # Add this line for editing posts
     path("post/<int:post_id>/edit/", views.edit_post, name="edit_post"),
 
@@ -34,4 +47,7 @@ urlpatterns = [
 
     # Add this line for user profiles
     path("profile/<str:username>/", views.user_profile, name="user_profile"),
+
+    # Example: /forum/profile/alice/posts/ (a window of a user's topics or posts on its own)
+    re_path(r"^profile/(?P<username>[^/]+)/(?P<tab>topics|posts)/$", views.user_activity, name="user_activity"),
 ]
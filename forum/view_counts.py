@@ -0,0 +1,178 @@
+# forum/view_counts.py
+
+import hashlib
+import logging
+import threading
+import time
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Now
+
+from categories.models import Category
+
+from .decorators import load_user
+from .models import Topic
+from .page_cache import invalidate
+
+# Repeat views of a topic by the same visitor within this many seconds count once.
+# Can be overridden with the VIEW_COUNT_DEDUP_WINDOW setting.
+VIEW_COUNT_DEDUP_WINDOW = 1800
+
+# Buffered views are written to the database at most this often (seconds)...
+# Can be overridden with the VIEW_COUNT_FLUSH_INTERVAL setting.
+VIEW_COUNT_FLUSH_INTERVAL = 60
+
+# ...or as soon as this many topics have pending views.
+# Can be overridden with the VIEW_COUNT_FLUSH_THRESHOLD setting.
+VIEW_COUNT_FLUSH_THRESHOLD = 500
+
+logger = logging.getLogger(__name__)
+
+
+class TopicViewBuffer:
+    """
+    In-process buffer of topic views.
+
+    Each visitor's view of a topic is counted at most once per VIEW_COUNT_DEDUP_WINDOW, and
+    the counted views are added to Topic.view_count in a single UPDATE at most once per
+    VIEW_COUNT_FLUSH_INTERVAL, or once VIEW_COUNT_FLUSH_THRESHOLD topics have pending views.
+    Only the request that triggers a flush takes SQLite's write lock, once per flush instead
+    of once per view. Increments are applied with F() expressions, so several processes can
+    each run their own buffer.
+
+    Listings show the counts, so each flush expires the cached pages and conditional GET
+    validators of the forum index and of the flushed topics' categories: they lag behind
+    the views by at most one flush interval.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}  # topic_id -> views not written to the database yet
+        self._seen = {}  # (visitor, topic_id) -> monotonic time the view was counted
+        self._last_flush = time.monotonic()
+
+    def record(self, topic_id, visitor):
+        """Counts a view of the topic by 'visitor', unless they viewed it recently."""
+        window = getattr(settings, "VIEW_COUNT_DEDUP_WINDOW", VIEW_COUNT_DEDUP_WINDOW)
+        now = time.monotonic()
+        with self._lock:
+            seen = self._seen.get((visitor, topic_id))
+            if seen is not None and now - seen < window:
+                return False
+            self._seen[(visitor, topic_id)] = now
+            self._pending[topic_id] = self._pending.get(topic_id, 0) + 1
+            return True
+
+    def get(self, topic_id):
+        """Returns the number of views of the topic not written to the database yet."""
+        with self._lock:
+            return self._pending.get(topic_id, 0)
+
+    def flush_if_due(self):
+        """Flushes the buffer if the flush interval has passed or the size threshold is reached."""
+        interval = getattr(settings, "VIEW_COUNT_FLUSH_INTERVAL", VIEW_COUNT_FLUSH_INTERVAL)
+        threshold = getattr(settings, "VIEW_COUNT_FLUSH_THRESHOLD", VIEW_COUNT_FLUSH_THRESHOLD)
+        if time.monotonic() - self._last_flush >= interval or len(self._pending) >= threshold:
+            self.flush()
+
+    def flush(self):
+        """
+        Adds all pending views in one UPDATE and returns the number of topics written.
+        If the write fails (e.g. the database is locked) the views are kept for the next
+        flush and the error is logged rather than raised, so it doesn't fail the page view
+        that happened to trigger the flush.
+        """
+        window = getattr(settings, "VIEW_COUNT_DEDUP_WINDOW", VIEW_COUNT_DEDUP_WINDOW)
+        now = time.monotonic()
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = now
+            # Views older than the window no longer suppress anything
+            self._seen = {key: seen for key, seen in self._seen.items() if now - seen < window}
+
+        if not pending:
+            return 0
+
+        try:
+            slugs = list(Category.objects.filter(topics__in=pending).values_list("slug", flat=True).distinct())
+            with transaction.atomic():
+                Topic.objects.filter(pk__in=pending).update(
+                    view_count=F("view_count")
+                    + Case(
+                        *(When(pk=topic_id, then=Value(views)) for topic_id, views in pending.items()),
+                        output_field=IntegerField(),
+                    ),
+                    # The count is shown in the topic's listing row
+                    updated_at=Now(),
+                )
+        except DatabaseError:
+            logger.exception("Failed to write the views of %d topics, retrying next flush", len(pending))
+            with self._lock:
+                # Views recorded since the batch was taken are added to it
+                for topic_id, views in pending.items():
+                    self._pending[topic_id] = self._pending.get(topic_id, 0) + views
+            return 0
+        invalidate("index", *(f"category:{slug}" for slug in slugs))
+        return len(pending)
+
+    def clear(self):
+        """Drops everything buffered without writing it."""
+        with self._lock:
+            self._pending = {}
+            self._seen = {}
+
+
+# The buffer shared by the count_topic_view decorator
+topic_view_buffer = TopicViewBuffer()
+
+
+def get_visitor_key(request):
+    """
+    Identifies the visitor for deduplicating views: their session, or for visitors without
+    one (most anonymous readers) a hash of their address and user agent. No session is
+    created just to count views.
+    """
+    if request.session.session_key:
+        return f"session:{request.session.session_key}"
+    if request.user.is_authenticated:
+        return f"user:{request.user.pk}"
+    fingerprint = f"{request.META.get('REMOTE_ADDR', '')}|{request.META.get('HTTP_USER_AGENT', '')}"
+    return "anonymous:" + hashlib.md5(fingerprint.encode(), usedforsecurity=False).hexdigest()
+
+
+def count_topic_view(view_func):
+    """
+    Decorator to count a view of the topic identified by the view's 'topic_id' argument
+    in topic_view_buffer.
+
+    It should wrap the page and conditional GET caches so cached and 304 responses are
+    counted as well; only successful responses count.
+    """
+
+    if iscoroutinefunction(view_func):
+
+        @wraps(view_func)
+        async def _wrapped_view(request, *args, **kwargs):
+            response = await view_func(request, *args, **kwargs)
+            if request.method == "GET" and response.status_code in (200, 304):
+                await load_user(request)
+                topic_view_buffer.record(int(kwargs["topic_id"]), get_visitor_key(request))
+                await sync_to_async(topic_view_buffer.flush_if_due)()
+            return response
+
+    else:
+
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            response = view_func(request, *args, **kwargs)
+            if request.method == "GET" and response.status_code in (200, 304):
+                topic_view_buffer.record(int(kwargs["topic_id"]), get_visitor_key(request))
+                topic_view_buffer.flush_if_due()
+            return response
+
+    return _wrapped_view
@@ -2,6 +2,7 @@
 
 # Create your views here.
 
+from django.conf import settings
 from django.contrib import messages  # Import messages framework
 from django.contrib.auth import login  # Import the login function
 
@@ -10,76 +11,58 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import (
     UserCreationForm,  # Import Django's registration form
 )
-
-# We might need User model later:
-from django.contrib.auth.models import User
-
-# Import pagination classes
-from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
-from django.http import HttpResponseForbidden  # For permission errors
-from django.shortcuts import get_object_or_404, redirect, render
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseForbidden, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404, get_object_or_404, redirect, render
 from django.utils import timezone  # Import timezone
-from PIL import Image, UnidentifiedImageError
+from django.utils.cache import patch_cache_control
+from django.views.static import serve
 
 # We'll need forms later:
-from .decorators import profile_visibility_required
+from .avatars import AVATAR_CACHE_MAX_AGE, is_content_addressed
+from .decorators import profile_visibility_required, query_budget
 from .forms import NewPostForm, NewTopicForm, ProfileForm
+from .identity_map import get_profile, get_user_or_404
+from .listings import topic_listing
+from .live_updates import publish_post, topic_event_stream
 from .models import Post, Profile, Topic
+from .page_cache import cache_anonymous_page, conditional_page
+from .pagination import InvalidCursor, KeysetPaginator
+from .read_tracking import (
+    get_last_read_sequence,
+    get_read_horizon,
+    mark_topic_read,
+)
+from .threads import topic_thread
+from .view_counts import count_topic_view
 
-IMAGE_HEIGHT_MAX = 500
-IMAGE_WIDTH_MAX = 500
+# Topics or posts shown per window of the activity lists on a user's profile
+PROFILE_ACTIVITY_PER_PAGE = 15
+# The activity lists on a user's profile, the first one shown by default
+PROFILE_ACTIVITY_TABS = ("topics", "posts")
 
 
 # View to display the list of all topics with sticky topics at the top
+@conditional_page("index")
+@cache_anonymous_page("index")
+@query_budget(8)
 def forum_index(request):
-    # Get sticky topics, ordered by creation date (or another preferred field)
-    sticky_topics = Topic.objects.filter(is_sticky=True).order_by("-created_at")
-
-    # Get regular (non-sticky) topics for pagination
-    regular_topics_list = Topic.objects.filter(is_sticky=False).order_by("-created_at")
-
-    topics_per_page = 5  # Number of regular topics per page
-    paginator = Paginator(regular_topics_list, topics_per_page)
-    page_number = request.GET.get("page")
-
-    try:
-        regular_topics_page = paginator.page(page_number)
-    except PageNotAnInteger:
-        regular_topics_page = paginator.page(1)
-    except EmptyPage:
-        regular_topics_page = paginator.page(paginator.num_pages)
-
-    # Generate the elided page range for the regular topics
-    elided_page_range = paginator.get_elided_page_range(
-        number=regular_topics_page.number,
-        on_each_side=2,
-        on_ends=1,
-    )
-
-    context = {
-        "sticky_topics": sticky_topics,  # Pass sticky topics
-        "regular_topics_page": regular_topics_page,  # Pass paginated regular topics
-        "elided_page_range": elided_page_range,
-        "PAGINATOR_ELLIPSIS": paginator.ELLIPSIS,
-    }
+    # Sticky topics at the top, then a page of the regular ones, newest first or with
+    # ?sort=views most viewed first (see forum/listings.py)
+    context = topic_listing(request, Topic.objects.all(), sort=request.GET.get("sort"))
     return render(request, "forum/forum_index.html", context)
 
 
 # View to display a single topic and its posts
+@count_topic_view
+@conditional_page("topic:{topic_id}")
+@cache_anonymous_page("topic:{topic_id}")
+@query_budget(6)
 def topic_detail(request, topic_id):
-    # Get the specific Topic object by its primary key (topic_id)
-    # If the topic doesn't exist, it automatically raises a 404 Not Found error
-    topic = get_object_or_404(Topic, pk=topic_id)
-
-    # Get all Post objects related to this specific topic
-    # Order them by creation date, oldest first (default or use order_by('created_at'))
-    posts = topic.posts.order_by("created_at").all()
-
-    # Prepare the context
-    context = {
-        "topic": topic,
-        "posts": posts,
-    }
+    # The topic and a page of its posts, oldest first (see forum/threads.py). Raises a
+    # 404 Not Found error if the topic doesn't exist.
+    context = topic_thread(request, topic_id)
 
     # Render the template 'forum/topic_detail.html'
     return render(request, "forum/topic_detail.html", context)
@@ -97,19 +80,23 @@ def new_topic(request):
             message = form.cleaned_data["message"]
             user = request.user  # Get the currently logged-in user
 
-            # Create the Topic instance
-            topic = Topic.objects.create(
-                subject=subject,
-                created_by=user,
-                category=category,
-            )
-
-            # Create the initial Post instance for this topic
-            Post.objects.create(
-                message=message,
-                topic=topic,
-                created_by=user,
-            )
+            # Create the topic and its first post together so the topic's
+            # denormalized post statistics never see a half-created topic
+            with transaction.atomic():
+                # Create the Topic instance
+                topic = Topic.objects.create(
+                    subject=subject,
+                    created_by=user,
+                    category=category,
+                )
+
+                # Create the initial Post instance for this topic
+                # (the post_save signal updates the topic's post statistics)
+                Post.objects.create(
+                    message=message,
+                    topic=topic,
+                    created_by=user,
+                )
 
             # Redirect to the newly created topic's detail page
             return redirect("forum:topic_detail", topic_id=topic.pk)
@@ -126,7 +113,7 @@ def new_topic(request):
 
 @login_required
 def new_post(request, topic_id):
-    topic = get_object_or_404(Topic, pk=topic_id)
+    topic = get_object_or_404(Topic.objects.with_read_state(request.user), pk=topic_id)
 
     if request.method == "POST":
         form = NewPostForm(request.POST)
@@ -134,16 +121,22 @@ def new_post(request, topic_id):
             message = form.cleaned_data["message"]
             user = request.user
 
-            # Create the Post instance, linking it to the topic and user
-            Post.objects.create(
-                message=message,
-                topic=topic,
-                created_by=user,
-            )
-            # Optionally, update the topic's last_updated field here if you add one
-
-            # Redirect back to the topic detail page
-            return redirect("forum:topic_detail", topic_id=topic.pk)
+            # Create the Post instance, linking it to the topic and user.
+            # The post_save signal updates the topic's post_count/last_post_* columns
+            # in the same transaction.
+            with transaction.atomic():
+                post = Post.objects.create(
+                    message=message,
+                    topic=topic,
+                    created_by=user,
+                )
+            # Everyone has read their own reply
+            mark_topic_read(user, topic, post.sequence)
+            # Push the reply to everyone watching the topic live
+            publish_post(post)
+
+            # Redirect to the page of the topic that shows the new post
+            return redirect(post)
         # If form is invalid, render the page again with the form containing errors
     else:
         # GET request: Create a blank instance of the form
@@ -157,6 +150,55 @@ def new_post(request, topic_id):
     return render(request, "forum/new_post.html", context)
 
 
+# Server-Sent Events stream of new replies to a topic, which its last page listens to so
+# readers see replies without reloading. Under ASGI an idle listener is just a pending
+# await; a WSGI worker would be tied up for as long as the browser stays, so there the
+# stream answers 204 No Content, which tells the browser not to reconnect.
+async def topic_events(request, topic_id):
+    topic = await aget_object_or_404(Topic.objects.only("id"), pk=topic_id)
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    # Browsers send the id of the last event they got when reconnecting; the page itself
+    # passes the last sequence number it shows
+    try:
+        after = int(request.headers.get("Last-Event-ID") or request.GET["after"])
+    except (KeyError, ValueError):
+        after = None
+
+    return StreamingHttpResponse(
+        topic_event_stream(topic.pk, after),
+        content_type="text/event-stream",
+        # Don't let proxies buffer or cache the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# View to redirect to the first post of a topic the user hasn't read yet
+@login_required
+def first_unread_post(request, topic_id):
+    topic = get_object_or_404(Topic.objects.with_read_state(request.user), pk=topic_id)
+    # Only the columns needed to build the URL, read through the (topic, sequence) index
+    posts = topic.posts.only("id", "topic_id", "sequence").order_by("sequence")
+    post = posts.filter(
+        sequence__gt=get_last_read_sequence(request.user, topic),
+        created_at__gt=get_read_horizon(request.user, topic),
+    ).first()
+    if post is None:
+        # Everything is read: go to the newest post instead
+        post = posts.last()
+    if post is None:
+        return redirect("forum:topic_detail", topic_id=topic.pk)
+    return redirect(post)
+
+
+# View to redirect a post permalink to the topic page that shows the post
+def post_permalink(request, post_id):
+    # Only the columns needed to build the URL; the page follows from the sequence number
+    post = get_object_or_404(Post.objects.only("id", "topic_id", "sequence"), pk=post_id)
+    return redirect(post)
+
+
 # View for user registration/signup
 def signup(request):
     if request.method == "POST":
@@ -202,8 +244,8 @@ def edit_post(request, post_id):
             post.message = form.cleaned_data["message"]
             post.updated_at = timezone.now()  # Set the updated_at timestamp
             post.save()
-            # Redirect to the topic detail page where the post is located
-            return redirect("forum:topic_detail", topic_id=post.topic.id)
+            # Redirect to the page of the topic where the post is located
+            return redirect(post)
     else:
         # GET request: Populate the form with the existing post's message
         form = NewPostForm(initial={"message": post.message})
@@ -230,7 +272,9 @@ def delete_post(request, post_id):
     if request.method == "POST":
         # User has confirmed deletion via POST request
         post_message_preview = post.message[:30]  # For the message
-        post.delete()
+        # The post_delete signal updates the topic's post statistics in the same transaction
+        with transaction.atomic():
+            post.delete()
         messages.success(request, f"Post '{post_message_preview}...' has been deleted.")
         # Redirect to the topic detail page where the post was
         return redirect("forum:topic_detail", topic_id=topic_id_for_redirect)
@@ -242,13 +286,15 @@ def delete_post(request, post_id):
     return render(request, "forum/delete_post_confirm.html", context)
 
 
+@query_budget(5)
 @profile_visibility_required
 def user_profile(request, username):
-    # Get the User object for the requested username, or raise a 404 if not found
-    profile_user = get_object_or_404(User, username=username)
+    # Get the User object for the requested username, or raise a 404 if not found; the
+    # visibility check already loaded it and its profile
+    profile_user = get_user_or_404(username)
 
     # Get the profile and its visibility setting
-    profile = profile_user.profile
+    profile = get_profile(profile_user)
     visibility = profile.profile_visibility
 
     # Determine the level of profile information to display
@@ -271,17 +317,15 @@ def user_profile(request, username):
         info_level = 1
     # Otherwise, only basic info is shown (handled by default info_level = 0)
 
-    # Get topics created by this user, ordered by most recent
-    user_topics = Topic.objects.filter(created_by=profile_user).order_by("-created_at")
-
-    # Get posts created by this user, ordered by most recent
-    # For performance, you might want to limit this, e.g., user_posts.all()[:20]
-    user_posts = Post.objects.filter(created_by=profile_user).order_by("-created_at")
+    # Only the requested window of one activity list is loaded; the totals are the
+    # profile's denormalized counters
+    tab = request.GET.get("tab")
+    if tab not in PROFILE_ACTIVITY_TABS:
+        tab = PROFILE_ACTIVITY_TABS[0]
 
     context = {
         "profile_user": profile_user,
-        "user_topics": user_topics,
-        "user_posts": user_posts,
+        **_profile_activity(request, profile_user, tab),
         "visibility": visibility,  # Pass visibility to the template
         "info_level": info_level,  # Pass info level to the template
         "is_owner": request.user == profile_user,  # Is the viewer the profile owner?
@@ -302,82 +346,73 @@ def edit_profile(request, username=None):
             return redirect("forum:forum_index")
 
         # Get the user whose profile we're editing
-        user = get_object_or_404(User, username=username)
-        profile, created = Profile.objects.get_or_create(user=user)
+        user = get_user_or_404(username)
     else:
-        # Get the current user's profile or create one if it doesn't exist
-        profile, created = Profile.objects.get_or_create(user=request.user)
+        # The current user; get_profile() shares their profile with the navigation bar
+        user = request.user
+
+    try:
+        profile = get_profile(user)
+    except Profile.DoesNotExist:
+        # Users created before profiles were don't have one yet
+        profile = Profile.objects.create(user=user)
 
     if request.method == "POST":
         form = ProfileForm(request.POST, request.FILES, instance=profile)
         if form.is_valid():
-            # Save the form without committing to process the avatar
+            # The uploaded avatar is stored as is; its thumbnails are made in the background
+            # once the profile is saved (see forum/avatars.py)
             profile = form.save(commit=False)
 
-            # Handle avatar resizing if needed
-            if "avatar" in request.FILES:
-                avatar_file = request.FILES["avatar"]
-                # Resize large images
-                try:
-                    img = Image.open(avatar_file)
-                    if img.height > IMAGE_HEIGHT_MAX or img.width > IMAGE_WIDTH_MAX:
-                        # Calculate new dimensions while maintaining aspect ratio
-                        if img.height > img.width:
-                            ratio = 500.0 / img.height
-                            new_height = 500
-                            new_width = int(img.width * ratio)
-                        else:
-                            ratio = 500.0 / img.width
-                            new_width = 500
-                            new_height = int(img.height * ratio)
-
-                        # Resize the image
-                        img = img.resize(
-                            (new_width, new_height),
-                            Image.Resampling.LANCZOS,
-                        )
-
-                        # Save the resized image back to the avatar field
-                        # This requires saving to a temporary file
-                        import io
-
-                        from django.core.files.uploadedfile import InMemoryUploadedFile
-
-                        output = io.BytesIO()
-                        # Determine the format from the original file
-                        avatar_format = avatar_file.name.split(".")[-1].upper()
-                        if avatar_format == "JPG":
-                            avatar_format = "JPEG"
-
-                        # Save to the BytesIO object
-                        img.save(output, format=avatar_format, quality=85)
-                        output.seek(0)
-
-                        # Replace the avatar file with the resized version
-                        profile.avatar = InMemoryUploadedFile(
-                            output,
-                            "ImageField",
-                            avatar_file.name,
-                            f"image/{avatar_format.lower()}",
-                            output.getbuffer().nbytes,
-                            None,
-                        )
-                # except Exception as e:
-                except (
-                    UnidentifiedImageError,
-                    OSError,
-                    ValueError,
-                    AttributeError,
-                    IndexError,
-                    TypeError,
-                ) as e:
-                    messages.error(request, f"Error processing image: {e!s}")
-
-            # Save the profile
-            profile.save()
+            # Save the profile, leaving out the activity counters, which may have changed
+            # since it was loaded
+            profile.save_without_stats()
             messages.success(request, "Your profile has been updated successfully!")
             return redirect("forum:user_profile", username=request.user.username)
     else:
         form = ProfileForm(instance=profile)
 
     return render(request, "forum/edit_profile.html", {"form": form})
+
+
+def serve_media(request, path):
+    """
+    Serves uploaded files in development (see forum_project/urls.py). Avatars stored under
+    the hash of their content never change, so browsers may cache them for good instead
+    of revalidating them on every page; production servers should send the same headers.
+    """
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    if is_content_addressed(path):
+        patch_cache_control(response, public=True, max_age=AVATAR_CACHE_MAX_AGE, immutable=True)
+    return response
+
+
+@query_budget(4)
+@profile_visibility_required
+def user_activity(request, username, tab):
+    """
+    Renders a window of a user's topics or posts on its own, for the profile page to swap
+    in when switching tabs or pages without reloading.
+    """
+    profile_user = get_user_or_404(username)
+    return render(request, "forum/user_activity.html", _profile_activity(request, profile_user, tab))
+
+
+def _profile_activity(request, profile_user, tab):
+    """
+    Returns the template context of the window of the user's topics or posts (per 'tab')
+    requested with the ?after=/?before= cursors, newest first.
+    """
+    if tab == "posts":
+        # The list shows the start of the message, not the rendered HTML
+        items = Post.objects.filter(created_by=profile_user).for_listing().defer("message_html")
+    else:
+        items = Topic.objects.filter(created_by=profile_user).only("pk", "subject", "created_at")
+
+    paginator = KeysetPaginator(items, PROFILE_ACTIVITY_PER_PAGE)
+    try:
+        page = paginator.page(after=request.GET.get("after"), before=request.GET.get("before"))
+    except InvalidCursor:
+        # If the cursor is malformed, deliver the newest window
+        page = paginator.page()
+    return {"activity_user": profile_user, "activity_tab": tab, "activity_page": page}
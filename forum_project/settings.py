@@ -51,9 +51,11 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "forum.middleware.IdentityMapMiddleware",  # Shares the users and profiles loaded during a request
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "forum.middleware.LastSeenMiddleware",  # Add our custom middleware for tracking user activity
+    "forum.middleware.ReadMarkerMiddleware",  # Writes the buffered read markers after the response
 ]
 
 ROOT_URLCONF = "forum_project.urls"
@@ -87,6 +89,38 @@ DATABASES = {
     },
 }
 
+# PRAGMAs for SQLite in production, applied to every new connection by the
+# connection_created handler in forum/signals.py. Measure their effect with
+# 'python manage.py benchmark_sqlite'.
+SQLITE_PRODUCTION_PRAGMAS = {
+    "busy_timeout": 5000,  # Wait up to 5s for a lock instead of failing with "database is locked"
+    "journal_mode": "WAL",  # Readers don't block the writer and the writer doesn't block readers
+    "synchronous": "NORMAL",  # Safe with WAL; fsync at checkpoints instead of on every commit
+    "cache_size": -20000,  # 20MB page cache per connection
+    "mmap_size": 134217728,  # Memory-map the first 128MB of the database file
+    "temp_store": "MEMORY",  # Keep temporary tables and indices in memory
+}
+
+# Set DATABASE_PROFILE=production in the environment to use the production SQLite profile
+DATABASE_PROFILE = os.getenv("DATABASE_PROFILE", "development")
+
+if DATABASE_PROFILE == "production":
+    DATABASES["default"].update(
+        {
+            # Keep connections open between requests, checking they still work before reuse
+            "CONN_MAX_AGE": 600,
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {
+                # Take the write lock when a transaction starts, so a transaction that reads
+                # and then writes can't fail midway with "database is locked"
+                "transaction_mode": "IMMEDIATE",
+            },
+        },
+    )
+    SQLITE_PRAGMAS = SQLITE_PRODUCTION_PRAGMAS
+else:
+    SQLITE_PRAGMAS = {}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -131,6 +165,29 @@ MEDIA_ROOT = Path(BASE_DIR / "media")
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# What to do when a view decorated with forum.decorators.query_budget runs more SQL
+# queries than it declared: "off", "log" (log a warning) or "raise" (raise an exception)
+QUERY_BUDGET_MODE = "log" if DEBUG else "off"
+
+# Cache used for the anonymous page cache and other forum caches. The local-memory cache is
+# per process; use a shared backend (e.g. Redis or Memcached) when running several workers
+# so invalidations reach all of them.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+}
+
+# Seconds logged-out visitors are served cached copies of the topic listings and topics
+# (see forum/page_cache.py); 0 disables the page cache, which is handy in development
+FORUM_PAGE_CACHE_TIMEOUT = 0 if DEBUG else 300
+
+# Serve the read-only pages (topic listings, topics and categories) with the async views
+# in forum/async_views.py and categories/async_views.py. Only worth it under ASGI; under
+# WSGI every async view is run in an event loop of its own. Set FORUM_ASYNC_VIEWS=1 in
+# the environment to turn them on.
+FORUM_ASYNC_VIEWS = os.getenv("FORUM_ASYNC_VIEWS") == "1"
+
 # URL to redirect to after successful login if no 'next' parameter is specified
 LOGIN_REDIRECT_URL = "/forum/"  # Redirect to the forum index
 
@@ -40,6 +40,6 @@ urlpatterns = [
     path("categories/", include("categories.urls")),
 ]
 
-# Serve media files during development
+# Serve media files during development, with the caching headers of avatars
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    urlpatterns += static(settings.MEDIA_URL, view=forum_views.serve_media)